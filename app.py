@@ -1,5 +1,4 @@
 import customtkinter as ctk
-from gpt4all import GPT4All
 import os
 from dotenv import load_dotenv
 import tkinter.messagebox as messagebox
@@ -10,14 +9,33 @@ from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.shared import Mm
 from docx.shared import Cm
 from docx.shared import Inches
-from docx2pdf import convert
 import tkinter
 import json
 from datetime import datetime
 
+from letter_ir import Block, Letter, Span, PARAGRAPH, build_letter
+from letter_renderers import DocxLayout, render_docx
+from conversion import convert_to_pdf
+from scratch import scratch_space
+from model_registry import ModelRegistry, ModelSpec
+
 # Charger les variables d'environnement
 load_dotenv()
 
+# Mise en page de la lettre complète (PDF et document Word)
+LETTER_LAYOUT = DocxLayout(
+    line_spacing=1.0,
+    margins={"top": 25, "bottom": 25, "left": 25, "right": 25},
+    page_size={"width": 210, "height": 297}
+)
+# Mise en page de l'export du texte affiché, ligne par ligne
+TEXT_EXPORT_LAYOUT = DocxLayout(
+    line_spacing=1.0,
+    margins={"top": 25, "bottom": 25, "left": 20, "right": 20},
+    first_line_indent=0,
+    space_after=12
+)
+
 class LetterGeneratorApp:
     def __init__(self):
         self.window = ctk.CTk()
@@ -53,8 +71,11 @@ class LetterGeneratorApp:
             "first_line_indent": None
         }]
         
-        # Initialiser le modèle
-        self.llm = None
+        # Modèles chargés par le même registre que l'application web ; modèle
+        # Mistral par défaut si MODEL_PATH n'est pas défini
+        self.models = ModelRegistry.from_env()
+        if not os.getenv("MODEL_PATH"):
+            self.models.register(ModelSpec("default", "mistral-7b-instruct-v0.1.Q4_0.gguf"))
         
         # Créer un dossier pour sauvegarder les données si nécessaire
         self.save_dir = os.path.join(os.path.expanduser("~"), ".lettre_motivation_ai")
@@ -816,16 +837,14 @@ class LetterGeneratorApp:
             return False
     
     def load_model(self):
-        """Charger le modèle GPT4All."""
-        if self.llm is None:
-            try:
-                from gpt4all import GPT4All
-                self.llm = GPT4All("mistral-7b-instruct-v0.1.Q4_0.gguf")
-                return True
-            except Exception as e:
-                self.show_status(f"Impossible de charger le modèle : {str(e)}", is_error=True)
-                return False
-        return True
+        """Charger le modèle par défaut du registre."""
+        try:
+            with self.models.use():
+                pass
+            return True
+        except Exception as e:
+            self.show_status(f"Impossible de charger le modèle : {str(e)}", is_error=True)
+            return False
     
     def process_long_text(self, text, max_length=1000):
         """Traite un texte long en le divisant en sections"""
@@ -978,6 +997,54 @@ class LetterGeneratorApp:
         except Exception as e:
             self.show_status(f"Impossible de générer la lettre : {str(e)}", is_error=True)
 
+    def letter_data(self):
+        """Champs de la lettre saisis dans le formulaire."""
+        return {
+            'full_name': self.nom_prenom_entry.get(),
+            'address': self.adresse_entry.get(),
+            'postal_code': self.code_postal_entry.get(),
+            'city': self.ville_entry.get(),
+            'phone': self.telephone_entry.get(),
+            'email': self.email_entry.get(),
+            'company': self.entreprise_entry.get(),
+            'company_address': self.adresse_entreprise_entry.get(),
+            'company_postal_code': self.code_postal_entreprise_entry.get(),
+            'company_city': self.ville_entreprise_entry.get(),
+            'date': self.today_date_entry.get(),
+            'subject': self.objet_entry.get(),
+            'content': self.result_text.get("1.0", "end-1c"),
+        }
+
+    def styled_letter(self):
+        """Lettre reprenant le texte affiché, ses styles et ses alignements (un paragraphe par ligne)."""
+        textbox = self.result_text._textbox
+        text = textbox.get("1.0", "end-1c")
+        styles = self.get_text_styles(textbox)
+
+        def styled(tag, position):
+            return any(style["tag"] == tag and self.is_position_in_range(position, style["start"], style["end"])
+                       for style in styles)
+
+        blocks = []
+        for number, line in enumerate(text.split('\n'), start=1):
+            align = None
+            for style in styles:
+                if (style["tag"] in ("align_center", "align_right", "align_justify")
+                        and self.is_position_in_range(f"{number}.0", style["start"], style["end"])):
+                    align = style["tag"].replace("align_", "")
+
+            # Les caractères consécutifs de même style forment un segment
+            spans = []
+            for column, char in enumerate(line):
+                position = f"{number}.{column}"
+                bold, italic = styled("bold", position), styled("italic", position)
+                if spans and spans[-1].bold == bold and spans[-1].italic == italic:
+                    spans[-1].text += char
+                else:
+                    spans.append(Span(char, bold=bold, italic=italic))
+            blocks.append(Block(PARAGRAPH, [spans], align=align))
+        return Letter(blocks)
+
     def is_position_in_range(self, pos, start, end):
         """Vérifie si une position est dans une plage donnée."""
         try:
@@ -1201,111 +1268,8 @@ class LetterGeneratorApp:
                 if not messagebox.askyesno("Confirmation", "Le fichier existe déjà. Voulez-vous le remplacer?"):
                     return
 
-            # Créer le document Word
-            doc = Document()
-            
-            # Configuration des marges (en millimètres)
-            sections = doc.sections
-            for section in sections:
-                section.top_margin = Mm(25)      # 2.5 cm en haut
-                section.bottom_margin = Mm(25)   # 2.5 cm en bas
-                section.left_margin = Mm(20)     # 2 cm à gauche
-                section.right_margin = Mm(20)    # 2 cm à droite
-            
-            # Récupérer le texte et les styles
-            text = self.result_text._textbox.get("1.0", "end-1c")
-            styles = self.get_text_styles(self.result_text._textbox)
-            
-            # Traiter le texte ligne par ligne
-            lines = text.split('\n')
-            current_pos = "1.0"
-            
-            # Pour chaque ligne
-            for i, line in enumerate(lines):
-                # Créer un nouveau paragraphe pour la ligne
-                p = doc.add_paragraph()
-                
-                # Position de fin de la ligne actuelle
-                try:
-                    line_end = self.result_text._textbox.index(f"{current_pos} lineend")
-                except:
-                    current_pos = f"{int(current_pos.split('.')[0])+1}.0"
-                    continue
-                
-                # Vérifier l'alignement et l'interligne du paragraphe
-                for style in styles:
-                    if style["tag"].startswith("align_"):
-                        start_idx = style["start"]
-                        end_idx = style["end"]
-                        if self.is_position_in_range(current_pos, start_idx, end_idx):
-                            align = style["tag"].replace("align_", "")
-                            if align == "center":
-                                p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                            elif align == "right":
-                                p.alignment = WD_ALIGN_PARAGRAPH.RIGHT
-                            elif align == "justify":
-                                p.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-                    elif style["tag"].startswith("spacing_"):
-                        start_idx = style["start"]
-                        end_idx = style["end"]
-                        if self.is_position_in_range(current_pos, start_idx, end_idx):
-                            # Extraire la valeur d'interligne du tag (par ex: spacing_1_15 -> 1.15)
-                            line_spacing = float(style["tag"].replace("spacing_", "").replace("_", "."))
-                
-                # Appliquer l'interligne
-                p.paragraph_format.line_spacing = 1.0  # Valeur par défaut
-                
-                # Si la ligne est vide, ajouter un paragraphe vide avec l'espacement
-                if not line.strip():
-                    p.paragraph_format.space_after = Pt(12)  # Espacement après le paragraphe
-                    current_pos = self.result_text._textbox.index(f"{current_pos}+1l")
-                    continue
-                
-                # Traiter chaque caractère de la ligne
-                current_char = current_pos
-                while self.result_text._textbox.compare(current_char, "<", line_end):
-                    try:
-                        char = self.result_text._textbox.get(current_char)
-                        if char == '\n':
-                            break
-                        
-                        # Vérifier les styles à cette position
-                        is_bold = False
-                        is_italic = False
-                        for style in styles:
-                            if style["tag"] in ["bold", "italic"]:
-                                start_idx = style["start"]
-                                end_idx = style["end"]
-                                if self.is_position_in_range(current_char, start_idx, end_idx):
-                                    if style["tag"] == "bold":
-                                        is_bold = True
-                                    elif style["tag"] == "italic":
-                                        is_italic = True
-                        
-                        # Ajouter le caractère avec ses styles
-                        run = p.add_run(char)
-                        run.font.name = "Times New Roman"
-                        run.font.size = Pt(11.5)
-                        run.bold = is_bold
-                        run.italic = is_italic
-                        
-                        # Passer au caractère suivant
-                        current_char = self.result_text._textbox.index(f"{current_char}+1c")
-                    except:
-                        # En cas d'erreur sur un caractère, passer au suivant
-                        current_char = self.result_text._textbox.index(f"{current_char}+1c")
-                        continue
-                
-                # Configurer l'espacement du paragraphe
-                p.paragraph_format.space_before = Pt(0)  # Pas d'espace avant
-                p.paragraph_format.space_after = Pt(12)  # Espacement après le paragraphe
-                p.paragraph_format.line_spacing = 1.0  # Interligne
-                
-                # Passer à la ligne suivante
-                current_pos = self.result_text._textbox.index(f"{current_pos}+1l")
-            
-            # Sauvegarder le document
-            doc.save(file_path)
+            # Créer le document Word à partir du texte et de ses styles
+            render_docx(self.styled_letter(), TEXT_EXPORT_LAYOUT).save(file_path)
             
             self.show_status(f"Document Word enregistré : {filename}")
             
@@ -1333,163 +1297,19 @@ class LetterGeneratorApp:
             if not file_path:
                 return
             
-            # Créer un document Word temporaire
-            temp_docx = "temp_letter.docx"
-            doc = Document()
-            
-            # Configuration des marges
-            section = doc.sections[0]
-            section.page_height = Mm(297)  # A4
-            section.page_width = Mm(210)   # A4
-            section.left_margin = Mm(25)
-            section.right_margin = Mm(25)
-            section.top_margin = Mm(25)
-            section.bottom_margin = Mm(25)
-            
-            def add_paragraph_with_style(text, alignment=None, bold=False, first_line_indent=None):
-                p = doc.add_paragraph()
-                run = p.add_run(text)
-                run.font.name = 'Times New Roman'
-                run.font.size = Pt(11.5)
-                run.bold = bold
-                p.paragraph_format.space_after = Pt(0)
-                p.paragraph_format.space_before = Pt(0)
-                p.paragraph_format.line_spacing = 1.0
-                if alignment:
-                    p.alignment = alignment
-                if first_line_indent:
-                    p.paragraph_format.first_line_indent = first_line_indent
-                return p
-            
-            # Informations de l'expéditeur
-            for info in [
-                self.nom_prenom_entry.get(),
-                self.adresse_entry.get(),
-                f"{self.code_postal_entry.get()} {self.ville_entry.get()}",
-                self.telephone_entry.get(),
-                self.email_entry.get()
-            ]:
-                if info.strip():
-                    add_paragraph_with_style(info)
-            
-            # Espace
-            doc.add_paragraph()
-            
-            # Informations du destinataire
-            for info in [
-                self.entreprise_entry.get(),
-                self.adresse_entreprise_entry.get(),
-                f"{self.code_postal_entreprise_entry.get()} {self.ville_entreprise_entry.get()}"
-            ]:
-                if info.strip():
-                    add_paragraph_with_style(info)
-            
-            # Espace
-            doc.add_paragraph()
-            
-            # Ville et date
-            ville_date = self.ville_entry.get()
-            date = self.today_date_entry.get()
-            if ville_date and date:
-                add_paragraph_with_style(
-                    f"{ville_date}, le {date}",
-                    alignment=WD_ALIGN_PARAGRAPH.RIGHT
-                )
-            
-            # Espace
-            doc.add_paragraph()
-            
-            # Objet
-            objet = self.objet_entry.get()
-            if objet:
-                p = doc.add_paragraph()
-                run_label = p.add_run("Objet : ")
-                run_label.font.name = 'Times New Roman'
-                run_label.font.size = Pt(11.5)
-                run_label.bold = True
+            # Document Word intermédiaire dans un dossier temporaire propre à l'export,
+            # supprimé même en cas d'erreur
+            with scratch_space().directory("export") as work_dir:
+                temp_docx = os.path.join(work_dir, "lettre.docx")
+                render_docx(build_letter(self.letter_data()), LETTER_LAYOUT).save(temp_docx)
                 
-                run_text = p.add_run(objet)
-                run_text.font.name = 'Times New Roman'
-                run_text.font.size = Pt(11.5)
-                
-                p.paragraph_format.space_after = Pt(0)
-                p.paragraph_format.space_before = Pt(0)
-                p.paragraph_format.line_spacing = 1.0
-            
-            # Espace
-            doc.add_paragraph()
-            
-            # Formule de politesse début
-            add_paragraph_with_style("Madame, Monsieur,")
-            
-            # Espace
-            doc.add_paragraph()
-            
-            # Contenu de la lettre
-            content = self.result_text.get("1.0", "end-1c")
-            paragraphs = content.split('\n\n')
-            
-            for para in paragraphs:
-                if para.strip():
-                    p = doc.add_paragraph()
-                    p.paragraph_format.first_line_indent = Mm(10)
-                    p.paragraph_format.space_after = Pt(0)
-                    p.paragraph_format.space_before = Pt(0)
-                    p.paragraph_format.line_spacing = 1.0
-                    
-                    # Traiter le texte caractère par caractère pour préserver les styles
-                    current_text = ""
-                    is_bold = False
-                    is_italic = False
-                    
-                    for char in para:
-                        if char == '\n':
-                            if current_text:
-                                run = p.add_run(current_text)
-                                run.font.name = 'Times New Roman'
-                                run.font.size = Pt(11.5)
-                                run.bold = is_bold
-                                run.italic = is_italic
-                                current_text = ""
-                        else:
-                            current_text += char
-                    
-                    if current_text:
-                        run = p.add_run(current_text)
-                        run.font.name = 'Times New Roman'
-                        run.font.size = Pt(11.5)
-                        run.bold = is_bold
-                        run.italic = is_italic
-            
-            # Formule de politesse fin
-            add_paragraph_with_style(
-                "\nJe vous prie d'agréer, Madame, Monsieur, l'expression de mes salutations distinguées."
-            )
-            
-            # Signature
-            add_paragraph_with_style(
-                f"\n{self.nom_prenom_entry.get()}",
-                alignment=WD_ALIGN_PARAGRAPH.RIGHT
-            )
-            
-            # Sauvegarder le document
-            doc.save(temp_docx)
-            
-            # Convertir en PDF
-            convert(temp_docx, file_path)
+                # Convertir en PDF (pool de conversion persistant)
+                convert_to_pdf(temp_docx, file_path)
             
             self.show_status("Le PDF a été généré avec succès !")
             
         except Exception as e:
             self.show_status(f"Erreur lors de la génération du PDF : {str(e)}", is_error=True)
-            
-        finally:
-            # Supprimer le fichier Word temporaire
-            if os.path.exists(temp_docx):
-                try:
-                    os.remove(temp_docx)
-                except:
-                    pass
     
     def get_marked_ranges(self):
         """Récupérer les plages de texte marquées."""
@@ -1779,157 +1599,11 @@ class LetterGeneratorApp:
     def generate_word_document(self):
         """Générer le document Word avec la lettre de motivation."""
         try:
-            # Créer un nouveau document Word
-            doc = Document()
-            
-            # Style par défaut pour tout le document
-            style = doc.styles['Normal']
-            style.font.name = 'Times New Roman'
-            style.font.size = Pt(11.5)
-            style.paragraph_format.space_after = Pt(0)
-            style.paragraph_format.space_before = Pt(0)
-            style.paragraph_format.line_spacing = 1.0
-            
-            # Configurer la mise en page
-            section = doc.sections[0]
-            section.page_height = Mm(297)  # A4
-            section.page_width = Mm(210)   # A4
-            section.left_margin = Mm(25)
-            section.right_margin = Mm(25)
-            section.top_margin = Mm(25)
-            section.bottom_margin = Mm(25)
-            
-            def add_paragraph_with_style(text, alignment=None, bold=False, first_line_indent=None):
-                p = doc.add_paragraph()
-                run = p.add_run(text)
-                run.font.name = 'Times New Roman'
-                run.font.size = Pt(11.5)
-                run.bold = bold
-                p.paragraph_format.space_after = Pt(0)
-                p.paragraph_format.space_before = Pt(0)
-                p.paragraph_format.line_spacing = 1.0
-                if alignment:
-                    p.alignment = alignment
-                if first_line_indent:
-                    p.paragraph_format.first_line_indent = first_line_indent
-                return p
-            
-            # Informations de l'expéditeur
-            for info in [
-                self.nom_prenom_entry.get(),
-                self.adresse_entry.get(),
-                f"{self.code_postal_entry.get()} {self.ville_entry.get()}",
-                self.telephone_entry.get(),
-                self.email_entry.get()
-            ]:
-                if info.strip():
-                    add_paragraph_with_style(info)
-            
-            # Espace
-            doc.add_paragraph()
-            
-            # Informations du destinataire
-            for info in [
-                self.entreprise_entry.get(),
-                self.adresse_entreprise_entry.get(),
-                f"{self.code_postal_entreprise_entry.get()} {self.ville_entreprise_entry.get()}"
-            ]:
-                if info.strip():
-                    add_paragraph_with_style(info)
-            
-            # Espace
-            doc.add_paragraph()
-            
-            # Ville et date
-            ville_date = self.ville_entry.get()
-            date = self.today_date_entry.get()
-            if ville_date and date:
-                add_paragraph_with_style(
-                    f"{ville_date}, le {date}",
-                    alignment=WD_ALIGN_PARAGRAPH.RIGHT
-                )
-            
-            # Espace
-            doc.add_paragraph()
-            
-            # Objet
-            objet = self.objet_entry.get()
-            if objet:
-                p = doc.add_paragraph()
-                run_label = p.add_run("Objet : ")
-                run_label.font.name = 'Times New Roman'
-                run_label.font.size = Pt(11.5)
-                run_label.bold = True
-                
-                run_text = p.add_run(objet)
-                run_text.font.name = 'Times New Roman'
-                run_text.font.size = Pt(11.5)
-                
-                p.paragraph_format.space_after = Pt(0)
-                p.paragraph_format.space_before = Pt(0)
-                p.paragraph_format.line_spacing = 1.0
-            
-            # Espace
-            doc.add_paragraph()
-            
-            # Formule de politesse début
-            add_paragraph_with_style("Madame, Monsieur,")
-            
-            # Espace
-            doc.add_paragraph()
-            
-            # Contenu de la lettre
-            content = self.result_text.get("1.0", "end-1c")
-            paragraphs = content.split('\n\n')
-            
-            for para in paragraphs:
-                if para.strip():
-                    p = doc.add_paragraph()
-                    p.paragraph_format.first_line_indent = Mm(10)
-                    p.paragraph_format.space_after = Pt(0)
-                    p.paragraph_format.space_before = Pt(0)
-                    p.paragraph_format.line_spacing = 1.0
-                    
-                    # Traiter le texte caractère par caractère pour préserver les styles
-                    current_text = ""
-                    is_bold = False
-                    is_italic = False
-                    
-                    for char in para:
-                        if char == '\n':
-                            if current_text:
-                                run = p.add_run(current_text)
-                                run.font.name = 'Times New Roman'
-                                run.font.size = Pt(11.5)
-                                run.bold = is_bold
-                                run.italic = is_italic
-                                current_text = ""
-                        else:
-                            current_text += char
-                    
-                    if current_text:
-                        run = p.add_run(current_text)
-                        run.font.name = 'Times New Roman'
-                        run.font.size = Pt(11.5)
-                        run.bold = is_bold
-                        run.italic = is_italic
-            
-            # Formule de politesse fin
-            add_paragraph_with_style(
-                "\nJe vous prie d'agréer, Madame, Monsieur, l'expression de mes salutations distinguées."
-            )
-            
-            # Signature
-            add_paragraph_with_style(
-                f"\n{self.nom_prenom_entry.get()}",
-                alignment=WD_ALIGN_PARAGRAPH.RIGHT
-            )
-            
-            # Sauvegarder le document
-            doc.save("lettre_motivation.docx")
+            # Créer le document Word
+            render_docx(build_letter(self.letter_data()), LETTER_LAYOUT).save("lettre_motivation.docx")
             
             # Convertir en PDF
-            convert("lettre_motivation.docx", "lettre_motivation.pdf")
+            convert_to_pdf("lettre_motivation.docx", "lettre_motivation.pdf")
             
             self.show_status("Les documents ont été générés avec succès !")
             
@@ -6,10 +6,10 @@ from docx import Document
 from docx.shared import Pt
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 import json
-from docx2pdf import convert
-import threading
 from pathlib import Path
 
+from conversion import conversion_pool
+
 class LetterGeneratorApp:
     def __init__(self):
         self.window = ctk.CTk()
@@ -301,16 +301,15 @@ class LetterGeneratorApp:
                 f"{self.filename_var.get()}.pdf"
             )
             
-            # Utiliser un thread séparé pour la conversion
-            def convert_to_pdf():
-                try:
-                    convert(word_path, pdf_path)
+            # Conversion en arrière-plan par le pool de conversion persistant
+            def conversion_done(future):
+                error = future.exception()
+                if error is None:
                     self.window.after(0, lambda: messagebox.showinfo("Succès", f"Document PDF généré avec succès!\nChemin: {pdf_path}"))
-                except Exception as e:
-                    self.window.after(0, lambda: messagebox.showerror("Erreur", f"Erreur lors de la conversion en PDF: {str(e)}"))
+                else:
+                    self.window.after(0, lambda: messagebox.showerror("Erreur", f"Erreur lors de la conversion en PDF: {str(error)}"))
             
-            thread = threading.Thread(target=convert_to_pdf)
-            thread.start()
+            conversion_pool().submit(word_path, pdf_path).add_done_callback(conversion_done)
             
             self.save_session()
             
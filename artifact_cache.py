@@ -0,0 +1,200 @@
+"""Cache des fichiers exportés (DOCX, PDF, HTML, texte, archives ZIP).
+
+Deux niveaux, bornés en octets et vidés dans l'ordre LRU :
+- mémoire : propre à chaque worker
+- disque (optionnel) : un fichier par entrée, partagé entre les workers ;
+  la date de modification sert d'horodatage LRU
+
+La clé est l'empreinte de la requête d'export sous forme canonique (champs
+triés, formats). L'ETag est l'empreinte du contenu : deux réponses de même
+ETag sont identiques octet pour octet.
+"""
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+from metrics import metrics
+# Version du rendu : les anciens fichiers ne sont plus servis quand la mise en page change
+from letter_renderers import RENDER_VERSION
+
+# Après un dépassement, le niveau disque est ramené à cette fraction de sa taille maximale
+DISK_LOW_WATERMARK = 0.9
+
+
+def content_etag(content):
+    return hashlib.sha256(content).hexdigest()[:32]
+
+
+class ArtifactCache:
+    """Cache LRU des fichiers exportés, borné en octets, avec niveau disque optionnel"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, disk_dir=None, max_disk_bytes=512 * 1024 * 1024,
+                 name="export_cache"):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.name = name
+        self._entries = OrderedDict()   # clé -> (contenu, etag)
+        self._bytes = 0
+        self._disk_bytes = None          # estimation, recalculée lors d'une éviction
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """Créer le cache à partir des variables d'environnement"""
+        return cls(
+            max_bytes=int(float(os.getenv("EXPORT_CACHE_SIZE_MB", "64")) * 1024 * 1024),
+            disk_dir=os.getenv("EXPORT_CACHE_DIR") or None,
+            max_disk_bytes=int(float(os.getenv("EXPORT_CACHE_DISK_MB", "512")) * 1024 * 1024),
+        )
+
+    @staticmethod
+    def make_key(data, variant):
+        """Clé de cache : champs de la requête (hors format) + variante ("pdf", "zip:docx,pdf"...)"""
+        payload = {k: v for k, v in data.items() if k not in ('format', 'formats')}
+        canonical = json.dumps({
+            "data": payload,
+            "variant": variant,
+            "version": RENDER_VERSION,
+        }, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _count(self, event):
+        metrics.increment(f"{self.name}.{event}")
+
+    def get(self, key):
+        """Renvoyer (contenu, etag), ou None"""
+        if self.max_bytes > 0:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self._count("hits.memory")
+                    return entry
+
+        content = self._disk_get(key)
+        if content is not None:
+            self._count("hits.disk")
+            entry = (content, content_etag(content))
+            self._memory_set(key, entry)
+            return entry
+
+        self._count("misses")
+        return None
+
+    def set(self, key, content):
+        """Enregistrer un fichier dans les deux niveaux ; renvoie son ETag"""
+        entry = (content, content_etag(content))
+        self._memory_set(key, entry)
+        self._disk_set(key, content)
+        return entry[1]
+
+    def _memory_set(self, key, entry):
+        size = len(entry[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous[0])
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._count("evictions")
+            metrics.set_gauge(f"{self.name}.entries", len(self._entries))
+            metrics.set_gauge(f"{self.name}.bytes", self._bytes)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.bin")
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+            # Marquer l'entrée comme récemment utilisée
+            os.utime(path)
+        except OSError:
+            return None
+        return content
+
+    def _disk_set(self, key, content):
+        if not self.disk_dir or len(content) > self.max_disk_bytes:
+            return
+        try:
+            # Écriture atomique : les autres workers ne lisent jamais un fichier partiel
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, self._disk_path(key))
+        except OSError as e:
+            print(f"Erreur lors de l'écriture du cache d'export : {e}")
+            return
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._disk_usage()[1]
+            else:
+                self._disk_bytes += len(content)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._disk_evict()
+
+    def _disk_usage(self):
+        """Fichiers du niveau disque [(date d'accès, taille, chemin)] et taille totale"""
+        files = []
+        for filename in os.listdir(self.disk_dir):
+            if filename.endswith(".bin"):
+                path = os.path.join(self.disk_dir, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files, sum(size for _, size, _ in files)
+
+    def _disk_evict(self):
+        """Supprimer les fichiers les moins récemment utilisés (tous workers confondus)"""
+        files, total = self._disk_usage()
+        target = self.max_disk_bytes * DISK_LOW_WATERMARK
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self._count("evictions.disk")
+        self._disk_bytes = total
+        metrics.set_gauge(f"{self.name}.disk_bytes", total)
+
+    def clear(self):
+        """Vider les deux niveaux"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._disk_bytes = None
+        if self.disk_dir:
+            for filename in os.listdir(self.disk_dir):
+                if filename.endswith(".bin"):
+                    try:
+                        os.remove(os.path.join(self.disk_dir, filename))
+                    except OSError:
+                        pass
+
+    def stats(self):
+        """Compteurs de succès/échecs du cache"""
+        stats = metrics.snapshot(prefix=f"{self.name}.")
+        hits = stats.get(f"{self.name}.hits.memory", 0) + stats.get(f"{self.name}.hits.disk", 0)
+        lookups = hits + stats.get(f"{self.name}.misses", 0)
+        stats[f"{self.name}.hit_rate"] = round(hits / lookups, 4) if lookups else None
+        return stats
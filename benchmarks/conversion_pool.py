@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Débit des conversions PDF : un sous-processus par conversion ou pool persistant.
+
+Par défaut, le convertisseur "fake" (conversion.py) simule une conversion de
+durée fixe (--delay) : le benchmark ne mesure alors que le coût de démarrage
+d'un processus de conversion (interpréteur Python, import des modules), payé
+à chaque conversion sans pool, pas celui de Word ou de LibreOffice. Pour
+mesurer un vrai convertisseur, passer --converter et un document Word réel
+(--docx) ; docx2pdf est limité à un processus (voir conversion.py).
+
+Usage :
+    python benchmarks/conversion_pool.py --jobs 16 --delay 0.2 --sizes 1 2 4
+    python benchmarks/conversion_pool.py --converter "command:soffice --headless --convert-to pdf --outdir {outdir} {input}" --docx lettre.docx
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from conversion import ConversionPool, convert_once  # noqa: E402
+
+
+def run_jobs(convert, jobs, concurrency, work_dir, source=None):
+    """Durée de `jobs` conversions lancées par `concurrency` requêtes simultanées"""
+    docx_path = os.path.join(work_dir, "lettre.docx")
+    if source:
+        shutil.copyfile(source, docx_path)
+    else:
+        with open(docx_path, 'wb') as f:
+            f.write(b"PK lettre")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda i: convert(docx_path, os.path.join(work_dir, f"lettre_{i}.pdf")), range(jobs)))
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Débit des conversions PDF avec et sans pool")
+    parser.add_argument('--jobs', type=int, default=16)
+    parser.add_argument('--delay', type=float, default=0.2, help="Durée simulée d'une conversion (s)")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--converter', default="fake", help="Convertisseur (CONVERTER), \"fake\" par défaut")
+    parser.add_argument('--docx', help="Document Word à convertir (requis avec un vrai convertisseur)")
+    args = parser.parse_args(argv)
+    if args.converter != "fake" and not args.docx:
+        parser.error("--docx est requis avec un vrai convertisseur")
+    os.environ["FAKE_CONVERTER_DELAY"] = str(args.delay)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        elapsed = run_jobs(lambda src, dst: convert_once(src, dst, converter=args.converter),
+                           args.jobs, 1, work_dir, args.docx)
+        results["subprocess_per_job"] = {"seconds": round(elapsed, 3), "jobs_per_second": round(args.jobs / elapsed, 2)}
+
+        for size in args.sizes:
+            pool = ConversionPool(size=size, converter=args.converter, health_interval=0)
+            try:
+                # Démarrage des processus hors mesure (fait une fois par worker gunicorn)
+                run_jobs(pool.convert, pool.size, pool.size, work_dir, args.docx)
+                elapsed = run_jobs(pool.convert, args.jobs, pool.size, work_dir, args.docx)
+            finally:
+                pool.close()
+            results[f"pool_{size}"] = {"seconds": round(elapsed, 3), "jobs_per_second": round(args.jobs / elapsed, 2)}
+
+    results["converter"] = args.converter
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Place occupée par l'historique avec le stockage par empreinte.
+
+L'historique simulé mélange des envois en publipostage (modèle
+templates/default.txt rempli avec l'entreprise, le poste et l'un de quelques
+paragraphes) et des lettres générées par le moteur stub, dont les phrases
+varient d'une lettre à l'autre. On compare la taille de history.json à celle
+de l'ancien format (liste de lettres complètes).
+
+Usage :
+    python benchmarks/history_storage.py --letters 1000 --generated 0.3
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+os.environ.setdefault("MODEL_BACKEND", "stub")
+
+import web_app  # noqa: E402
+from model_backends import StubBackend  # noqa: E402
+
+COMPANIES = ["Acme", "Globex", "Initech", "Umbrella", "Hooli", "Stark Industries", "Wayne Enterprises",
+             "Soylent", "Cyberdyne", "Tyrell Corporation", "Massive Dynamic", "Aperture Science"]
+POSITIONS = ["Développeur Python", "Chef de projet", "Data analyst", "Ingénieur DevOps", "Product owner"]
+PARAGRAPHS = [
+    "Fort(e) de cinq années d'expérience en développement d'applications web, je maîtrise Python, "
+    "Django et les bases de données relationnelles.",
+    "Diplômé(e) d'une école d'ingénieurs, j'ai conduit plusieurs projets de migration vers le cloud "
+    "et mis en place des chaînes d'intégration continue.",
+    "Curieux(se) et rigoureux(se), j'aime comprendre les besoins des utilisateurs avant de proposer "
+    "une solution simple et maintenable.",
+]
+
+
+def sample_history(count, generated_ratio, seed=0):
+    """(entreprise, poste, lettre) pour un historique réaliste"""
+    rng = random.Random(seed)
+    with open(os.path.join(ROOT_DIR, "templates", "default.txt"), encoding='utf-8') as f:
+        template = f.read()
+    stub = StubBackend()
+    for i in range(count):
+        company = rng.choice(COMPANIES) + ("" if i < len(COMPANIES) else f" {i % 40}")
+        position = rng.choice(POSITIONS)
+        if rng.random() < generated_ratio:
+            content = stub.generate(f"{company}|{position}|{i}", max_tokens=400)
+        else:
+            content = template.format(
+                recruteur="Madame, Monsieur", poste=position, entreprise=company,
+                contenu=rng.choice(PARAGRAPHS), prenom="Camille", nom="Martin"
+            )
+        yield company, position, content
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Taille de l'historique avec et sans stockage par empreinte")
+    parser.add_argument('--letters', type=int, default=1000)
+    parser.add_argument('--generated', type=float, default=0.3,
+                        help="Part des lettres générées par le modèle (le reste en publipostage)")
+    args = parser.parse_args(argv)
+
+    manager = web_app.TemplateManager(tempfile.mkdtemp())
+    for company, position, content in sample_history(args.letters, args.generated):
+        manager.history.append(web_app.LetterHistory(company, position, content))
+    manager.save_data()
+
+    legacy = [{
+        'company': item.company,
+        'position': item.position,
+        'content': item.content,
+        'generated_at': item.generated_at.isoformat()
+    } for item in manager.history]
+    legacy_bytes = len(json.dumps(legacy, ensure_ascii=False, indent=4).encode('utf-8'))
+    file_bytes = os.path.getsize(manager.history_file)
+
+    results = dict(manager.history_storage())
+    results['legacy_file_bytes'] = legacy_bytes
+    results['file_bytes'] = file_bytes
+    results['file_saving'] = round(1 - file_bytes / legacy_bytes, 4)
+
+    reloaded = web_app.TemplateManager(manager.save_dir)
+    results['roundtrip_ok'] = [item.content for item in reloaded.history] == [item.content for item in manager.history]
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    return 0 if results['roundtrip_ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Temps d'évaluation du prompt avec et sans réutilisation du préfixe.
+
+Pour chaque requête (entreprise et poste différents), on mesure le délai
+jusqu'au premier token, c'est-à-dire l'évaluation du prompt :
+- "sans préfixe" : le prompt complet est évalué à chaque requête ;
+- "avec préfixe" : les instructions fixes sont évaluées une fois, seule la
+  partie variable est évaluée ensuite.
+
+Avec le moteur stub, le coût de l'évaluation est simulé (tokens / débit) : le
+gain affiché découle de ce modèle de coût et le résultat est marqué
+"simulated". Seul un vrai modèle mesure le gain réel ; le script vérifie alors
+aussi qu'une génération gloutonne donne le même texte avec et sans préfixe
+("outputs_match").
+
+Usage :
+    MODEL_BACKEND=gpt4all MODEL_PATH=/chemin/modele.gguf python benchmarks/prefix_cache.py
+    python benchmarks/prefix_cache.py --requests 20     # moteur stub (STUB_PROMPT_TOKENS_PER_SECOND)
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+os.environ.setdefault("MODEL_BACKEND", "stub")
+# Ordre de grandeur d'un modèle 7B quantifié sur CPU
+os.environ.setdefault("STUB_PROMPT_TOKENS_PER_SECOND", "200")
+
+from model_backends import create_backend  # noqa: E402
+from prompt_builder import PromptBuilder  # noqa: E402
+
+COMPANIES = ["Acme", "Globex", "Initech", "Umbrella", "Hooli", "Stark Industries", "Wayne Enterprises"]
+POSITIONS = ["Développeur Python", "Chef de projet", "Data analyst", "Ingénieur DevOps", "Product owner"]
+
+
+def sample_requests(count):
+    for i in range(count):
+        yield {
+            'company': COMPANIES[i % len(COMPANIES)],
+            'position': POSITIONS[i % len(POSITIONS)],
+            'duration': 'CDI',
+            'start_date': f'0{1 + i % 9}/09/2024',
+            'custom_paragraph': "Je suis particulièrement motivé(e) par les projets de votre équipe.",
+        }
+
+
+def time_to_first_token(backend, plan, use_prefix):
+    """Durée de l'évaluation du prompt (jusqu'au premier token généré)"""
+    first_token = []
+    start = time.perf_counter()
+
+    def on_token(token_id, token):
+        first_token.append(time.perf_counter())
+        return False
+
+    backend.generate(plan.prompt, max_tokens=1, callback=on_token,
+                     prefix=plan.prefix if use_prefix else None)
+    return (first_token[0] if first_token else time.perf_counter()) - start
+
+
+def outputs_match(backend, plan, max_tokens=16):
+    """Même texte généré (échantillonnage glouton) avec et sans réutilisation du préfixe"""
+    greedy = dict(max_tokens=max_tokens, temp=0.0, top_k=1, top_p=1.0, repeat_penalty=1.0)
+    full = backend.generate(plan.prompt, **greedy)
+    backend.generate(plan.prompt, prefix=plan.prefix, **greedy)
+    reused = backend.generate(plan.prompt, prefix=plan.prefix, **greedy)
+    return full == reused
+
+
+def summarize(samples):
+    return {
+        'mean_ms': round(statistics.mean(samples) * 1000, 2),
+        'median_ms': round(statistics.median(samples) * 1000, 2),
+        'first_ms': round(samples[0] * 1000, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de la réutilisation du préfixe de prompt")
+    parser.add_argument('--requests', type=int, default=10)
+    parser.add_argument('--model-path', default=os.getenv("MODEL_PATH"))
+    parser.add_argument('--n-ctx', type=int, default=2048)
+    parser.add_argument('--output', help="Écrire les résultats dans ce fichier JSON")
+    args = parser.parse_args(argv)
+
+    backend = create_backend(args.model_path, n_ctx=args.n_ctx)
+    builder = PromptBuilder()
+    plans = [builder.build(data, backend, args.n_ctx) for data in sample_requests(args.requests)]
+
+    without_prefix = [time_to_first_token(backend, plan, False) for plan in plans]
+    with_prefix = [time_to_first_token(backend, plan, True) for plan in plans]
+
+    results = {
+        'backend': backend.model_id,
+        'requests': args.requests,
+        'prefix_tokens': backend.count_tokens(plans[0].prefix),
+        'prompt_tokens': statistics.mean(plan.prompt_tokens for plan in plans),
+        'without_prefix': summarize(without_prefix),
+        # La première requête évalue le préfixe, les suivantes le réutilisent
+        'with_prefix': summarize(with_prefix),
+        'speedup': round(statistics.median(without_prefix) / max(statistics.median(with_prefix), 1e-9), 2),
+        'simulated': backend.name == "stub",
+    }
+    if backend.name != "stub":
+        results['prefix_supported'] = getattr(backend, 'prefix_supported', True)
+        results['outputs_match'] = outputs_match(backend, plans[0])
+    backend.close()
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    return 0 if results.get('outputs_match', True) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""Benchmarks des fonctions de web_app avec comparaison à une référence.
+
+Usage :
+    python benchmarks/run_benchmarks.py                      # comparer à baseline.json
+    python benchmarks/run_benchmarks.py --update-baseline    # enregistrer une nouvelle référence
+    python benchmarks/run_benchmarks.py --tolerance 0.5 --filter template_manager
+
+Le script échoue (code de sortie 1) si un cas est plus lent que sa référence
+au-delà de la tolérance (25 % par défaut, ou BENCH_TOLERANCE). Une tolérance
+propre à un cas peut être fixée dans baseline.json via la clé "tolerance".
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+sys.path.insert(0, ROOT_DIR)
+os.environ.setdefault("MODEL_BACKEND", "stub")
+
+import web_app  # noqa: E402
+import markup  # noqa: E402
+import letter_ir  # noqa: E402
+import letter_renderers  # noqa: E402
+
+BENCHMARKS = {}
+SIZES = [1000, 10000, 100000]
+
+
+def benchmark(name):
+    """Enregistrer un cas de benchmark.
+
+    La fonction décorée prépare les données et renvoie la fonction à chronométrer.
+    """
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+SAMPLE_LETTER = {
+    'full_name': 'Camille Martin',
+    'address': '12 rue des Lilas',
+    'postal_code': '75011',
+    'city': 'Paris',
+    'phone': '0612345678',
+    'email': 'camille.martin@example.com',
+    'company': 'Acme',
+    'company_address': '1 avenue de la République',
+    'company_postal_code': '69002',
+    'company_city': 'Lyon',
+    'subject': 'Candidature au poste de développeur Python',
+    'date': '17/01/2024',
+    'content': "\n\n".join([
+        "Je souhaite vous proposer ma candidature au poste de développeur Python au sein de votre entreprise.",
+        "- Développement d'API REST\n- Intégration continue\n- Tests automatisés",
+        "Mon expérience en développement web m'a permis d'acquérir une solide expertise technique.",
+        "Je reste à votre disposition pour un entretien.",
+    ]),
+}
+
+LONG_TEXT = " ".join(["Mon expérience en développement m'a permis d'acquérir une expertise solide."] * 400)
+
+FORMATTED_TEXT = "\n".join([
+    '<align="justify"><bold>Expérience</bold> : <italic>trois ans</italic> de développement</align>',
+    '<spacing="1.5">Je maîtrise <underline>Python</underline> et <bold>Flask</bold>.</spacing>',
+    "Un paragraphe sans mise en forme particulière.",
+] * 50)
+
+HTML_CONTENT = "\n".join([
+    '<div style="text-align: justify; line-height: 1.5">Je suis <strong>motivé</strong> '
+    'et <em>rigoureux</em>, avec une <u>solide</u> expérience.</div>',
+    "Paragraphe simple.",
+] * 50)
+
+
+@benchmark("replace_markers")
+def bench_replace_markers():
+    template = ("Je souhaite postuler au poste de [[position]] chez [[company]] pour une durée "
+                "de [[duration]] à partir du [[start_date]].\n\n[[custom_paragraph]]\n\n") * 20
+    data = {
+        'template': template,
+        'position': 'développeur Python',
+        'company': 'Acme',
+        'duration': '6 mois',
+        'start_date': '01/03/2024',
+        'custom_paragraph': "J'ai trois ans d'expérience en développement Python.",
+    }
+    return lambda: web_app.generator.replace_markers(template, data)
+
+
+@benchmark("validate_letter_data")
+def bench_validate_letter_data():
+    data = {
+        'company': 'Acme',
+        'position': 'développeur Python',
+        'start_date': '01/03/2024',
+        'today_date': '2024-01-17',
+        'duration': '6 months',
+        'email': 'camille.martin@example.com',
+        'phone': '06 12 34 56 78',
+    }
+    return lambda: web_app.validate_letter_data(data)
+
+
+@benchmark("letter_formatter.format_letter")
+def bench_format_letter():
+    formatter = web_app.LetterFormatter()
+    return lambda: formatter.format_letter(SAMPLE_LETTER)
+
+
+@benchmark("letter_renderers.render_html.inline")
+def bench_render_html_inline():
+    letter = letter_ir.build_letter(SAMPLE_LETTER)
+    style_manager = web_app.StyleManager()
+    return lambda: letter_renderers.render_html(letter, style_manager)
+
+
+@benchmark("letter_renderers.html_renderer.render")
+def bench_html_renderer():
+    letter = letter_ir.build_letter(SAMPLE_LETTER)
+    renderer = letter_renderers.HtmlRenderer()
+    return lambda: renderer.render(letter)
+
+
+@benchmark("style_manager.create_css")
+def bench_create_css():
+    style_manager = web_app.StyleManager()
+    return style_manager.create_css
+
+
+@benchmark("style_manager.stylesheet")
+def bench_stylesheet():
+    style_manager = web_app.StyleManager()
+    return style_manager.stylesheet
+
+
+@benchmark("document_manager.create_document.docx")
+def bench_create_document():
+    manager = web_app.DocumentManager()
+    return lambda: manager.create_document(SAMPLE_LETTER, "docx")
+
+
+@benchmark("document_manager.create_document.docx_direct")
+def bench_create_document_direct():
+    manager = web_app.DocumentManager()
+    manager.docx_backend = "direct"
+    return lambda: manager.create_document(SAMPLE_LETTER, "docx")
+
+
+@benchmark("document_manager.create_documents.docx_html_txt")
+def bench_create_documents():
+    manager = web_app.DocumentManager()
+    return lambda: manager.create_documents(SAMPLE_LETTER, ["docx", "html", "txt"])
+
+
+@benchmark("create_word_document")
+def bench_create_word_document(tmp_dir):
+    filename = os.path.join(tmp_dir, "bench.docx")
+    return lambda: web_app.create_word_document(HTML_CONTENT, filename)
+
+
+@benchmark("process_text_formatting")
+def bench_process_text_formatting():
+    return lambda: web_app.process_text_formatting(FORMATTED_TEXT)
+
+
+# Contenus de 1 Mo : mise en forme habituelle, et balises jamais fermées sur une seule ligne
+# (cas quadratique des anciennes substitutions par expressions régulières)
+FORMATTED_TEXT_1MB = (FORMATTED_TEXT + "\n") * (2 ** 20 // (len(FORMATTED_TEXT) + 1))
+UNCLOSED_TEXT_1MB = "x<bold>" * (2 ** 20 // 7)
+
+
+@benchmark("process_text_formatting.1mb")
+def bench_process_text_formatting_1mb():
+    return lambda: web_app.process_text_formatting(FORMATTED_TEXT_1MB)
+
+
+@benchmark("process_text_formatting.1mb_unclosed")
+def bench_process_text_formatting_unclosed():
+    return lambda: web_app.process_text_formatting(UNCLOSED_TEXT_1MB)
+
+
+@benchmark("markup.paragraphs.1mb")
+def bench_markup_paragraphs():
+    return lambda: markup.paragraphs(markup.parse(FORMATTED_TEXT_1MB))
+
+
+@benchmark("process_long_text")
+def bench_process_long_text():
+    return lambda: web_app.process_long_text(LONG_TEXT)
+
+
+SKILLS = ("Python Flask API PostgreSQL données analyse marketing vente gestion équipe projet client "
+          "cloud DevOps sécurité finance comptabilité recrutement formation logistique qualité "
+          "communication leadership rigueur autonomie innovation").split()
+
+
+def _template_manager(tmp_dir, size):
+    """Créer un gestionnaire pré-rempli avec `size` modèles et lettres"""
+    save_dir = tempfile.mkdtemp(dir=tmp_dir)
+    manager = web_app.TemplateManager(save_dir)
+    for i in range(size):
+        name = f"Modele {i}"
+        manager.templates[name] = web_app.Template(
+            name, f"Contenu du modèle numéro {i}", "General", [f"tag{i % 100}"]
+        )
+        manager.history.append(web_app.LetterHistory(
+            f"Entreprise {i}", f"Poste {i % 50}", f"Lettre numéro {i} pour l'entreprise {i}"
+        ))
+    return manager
+
+
+def _register_template_manager_cases():
+    for size in SIZES:
+        def add_case(tmp_dir, size=size):
+            manager = _template_manager(tmp_dir, size)
+            counter = iter(range(10 ** 9))
+            return lambda: manager.add_template(f"Nouveau {next(counter)}", "Contenu")
+
+        def search_case(tmp_dir, size=size):
+            manager = _template_manager(tmp_dir, size)
+            return lambda: manager.search_templates("tag42")
+
+        def history_case(tmp_dir, size=size):
+            manager = _template_manager(tmp_dir, size)
+            return lambda: manager.add_to_history("Acme", "Développeur", "Contenu de la lettre")
+
+        def recommend_case(tmp_dir, size=size):
+            manager = _template_manager(tmp_dir, size)
+            for i, template in enumerate(manager.templates.values()):
+                words = [SKILLS[(i * 7 + j * 13) % len(SKILLS)] for j in range(12)]
+                manager.index.add(template.name, "Mon expérience en " + " et ".join(words))
+            return lambda: manager.recommend_templates(JOB_OFFER, 5)
+
+        benchmark(f"template_manager.add_template[{size}]")(add_case)
+        benchmark(f"template_manager.search_templates[{size}]")(search_case)
+        benchmark(f"template_manager.add_to_history[{size}]")(history_case)
+        benchmark(f"template_manager.recommend_templates[{size}]")(recommend_case)
+
+
+_register_template_manager_cases()
+
+
+def time_case(func, min_time=0.2, repeat=5):
+    """Mesurer le meilleur temps d'un appel (en secondes), comme timeit"""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / repeat or loops >= 10 ** 6:
+            break
+        loops *= 2
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        timings.append((time.perf_counter() - start) / loops)
+    return min(timings), loops
+
+
+JOB_OFFER = """Développeur Python (H/F)
+Acme Solutions recrute un développeur Python confirmé pour rejoindre son équipe data.
+Vos missions : concevoir des API, maintenir la plateforme, encadrer deux alternants.
+Profil : 3 ans d'expérience minimum en Python, Flask et PostgreSQL.
+Contrat : CDD de 12 mois, démarrage le 1er septembre 2024.
+Envoyez votre candidature à jobs@acme-solutions.fr"""
+
+
+@benchmark("extract_job_offer")
+def bench_extract_job_offer():
+    return lambda: web_app.extract_job_offer(JOB_OFFER)
+
+
+def run_benchmarks(names, repeat, min_time):
+    """Exécuter les cas demandés et renvoyer {nom: secondes par appel}"""
+    results = {}
+    tmp_dir = tempfile.mkdtemp(prefix="lettre_bench_")
+    try:
+        for name in names:
+            setup = BENCHMARKS[name]
+            args = (tmp_dir,) if setup.__code__.co_argcount else ()
+            func = setup(*args)
+            seconds, loops = time_case(func, min_time=min_time, repeat=repeat)
+            results[name] = seconds
+            print(f"{name:55s} {seconds * 1e6:14.2f} µs  ({loops} boucles)")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get("benchmarks", {})
+
+
+def save_baseline(path, results, previous):
+    benchmarks = dict(previous)
+    for name, seconds in results.items():
+        entry = dict(previous.get(name, {}))
+        entry["seconds"] = seconds
+        benchmarks[name] = entry
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "python": sys.version.split()[0],
+            "updated_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "benchmarks": dict(sorted(benchmarks.items())),
+        }, f, ensure_ascii=False, indent=4)
+        f.write("\n")
+
+
+def compare(results, baseline, tolerance):
+    """Renvoyer la liste des cas en régression"""
+    regressions = []
+    for name, seconds in results.items():
+        if name not in baseline:
+            print(f"  [nouveau]    {name}")
+            continue
+        reference = baseline[name]["seconds"]
+        allowed = baseline[name].get("tolerance", tolerance)
+        ratio = seconds / reference if reference else float('inf')
+        status = "REGRESSION" if ratio > 1 + allowed else "ok"
+        print(f"  [{status:10s}] {name:55s} x{ratio:.2f} (tolérance +{allowed:.0%})")
+        if status == "REGRESSION":
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks avec détection des régressions")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="Fichier de référence")
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="Enregistrer les résultats comme nouvelle référence")
+    parser.add_argument('--tolerance', type=float,
+                        default=float(os.getenv("BENCH_TOLERANCE", "0.25")),
+                        help="Ralentissement toléré (0.25 = +25 %%)")
+    parser.add_argument('--filter', default='', help="N'exécuter que les cas contenant ce texte")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help="Durée minimale de mesure par cas (s)")
+    parser.add_argument('--output', help="Écrire les résultats bruts dans ce fichier JSON")
+    args = parser.parse_args(argv)
+
+    names = [name for name in BENCHMARKS if args.filter in name]
+    results = run_benchmarks(names, args.repeat, args.min_time)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+
+    baseline = load_baseline(args.baseline)
+    if args.update_baseline:
+        save_baseline(args.baseline, results, baseline)
+        print(f"Référence enregistrée dans {args.baseline}")
+        return 0
+
+    print("\nComparaison avec la référence :")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} régression(s) : {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
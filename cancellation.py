@@ -0,0 +1,80 @@
+"""Annulation coopérative et délais des requêtes.
+
+Un CancellationToken accompagne une requête dans tout le traitement
+(génération, conversion PDF). Il est annulé quand le client se déconnecte ou
+quand le délai de la requête est dépassé (REQUEST_TIMEOUT, inférieur au
+timeout de gunicorn) ; chaque étape longue le consulte régulièrement et
+s'interrompt.
+"""
+import os
+import time
+import threading
+
+from metrics import metrics
+
+
+class Cancelled(Exception):
+    """La requête a été annulée"""
+
+    def __init__(self, reason="cancelled"):
+        super().__init__(f"Requête annulée ({reason})")
+        self.reason = reason
+
+
+class CancellationToken:
+    """Signal d'annulation partagé par les étapes d'une requête"""
+
+    def __init__(self, deadline=None):
+        # Échéance en secondes de time.monotonic(), None = pas de délai
+        self.deadline = deadline
+        self._event = threading.Event()
+        self._reason = None
+
+    @classmethod
+    def with_timeout(cls, seconds):
+        return cls(time.monotonic() + seconds if seconds else None)
+
+    @classmethod
+    def for_request(cls):
+        """Jeton d'une requête HTTP, avec le délai REQUEST_TIMEOUT"""
+        return cls.with_timeout(float(os.getenv("REQUEST_TIMEOUT", "110")))
+
+    def cancel(self, reason="cancelled"):
+        if not self._event.is_set():
+            self._reason = reason
+            self._event.set()
+            metrics.increment(f"cancellation.requests.{reason}")
+
+    @property
+    def cancelled(self):
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+        return self._event.is_set()
+
+    @property
+    def reason(self):
+        return self._reason if self.cancelled else None
+
+    def remaining(self):
+        """Secondes restantes avant l'échéance (None si pas de délai)"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self):
+        """Lever Cancelled si la requête est annulée"""
+        if self.cancelled:
+            raise Cancelled(self._reason)
+
+    def wait(self, timeout=None):
+        """Attendre l'annulation au plus `timeout` secondes ; renvoie True si annulée"""
+        remaining = self.remaining()
+        if remaining is not None:
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        self._event.wait(timeout)
+        return self.cancelled
+
+
+def cancelled(token):
+    """Vrai si le jeton (éventuellement absent) est annulé"""
+    return token is not None and token.cancelled
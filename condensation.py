@@ -0,0 +1,133 @@
+"""Condensation des textes longs avant génération.
+
+Les offres d'emploi ou extraits de CV collés dans le paragraphe personnalisé
+peuvent dépasser la fenêtre de contexte du modèle. Le texte est découpé en
+sections (map), chaque section est résumée, puis les résumés sont assemblés
+(reduce) ; l'opération est répétée tant que le résultat dépasse le budget de
+tokens. Les résumés sont générés l'un après l'autre : un moteur n'exécute
+qu'une génération à la fois. Les instructions du résumé forment un préfixe
+commun, évalué une fois pour toutes les sections. Les résumés sont mis en cache
+par contenu de section : une même offre collée plusieurs fois n'est résumée
+qu'une fois.
+
+Configuration :
+- CONDENSE_SECTION_CHARS : taille maximale d'une section (1000 caractères)
+- CONDENSE_SUMMARY_TOKENS : longueur maximale d'un résumé (150 tokens)
+- CONDENSE_MODEL : modèle utilisé pour les résumés (par défaut, celui de la lettre ;
+  avec GPT4All, un autre modèle laisse intact le préfixe des lettres dans le contexte)
+"""
+import os
+
+from metrics import metrics
+from generation_cache import GenerationCache
+
+# Instructions communes à tous les résumés, évaluées une seule fois par modèle
+SUMMARY_PREFIX = """Résume en quelques phrases le texte suivant, en gardant uniquement les informations utiles pour une lettre de motivation (missions, compétences, expériences, valeurs de l'entreprise). Réponds uniquement par le résumé.
+
+Texte :
+"""
+SUMMARY_PROMPT = SUMMARY_PREFIX + "{section}"
+
+# Au-delà, le texte n'est plus résumé mais tronqué
+MAX_ROUNDS = 3
+
+
+def iter_sections(text, max_length=1000):
+    """Découper un texte en sections d'au plus max_length caractères (mots entiers).
+
+    Version incrémentale de process_long_text : chaque section est transmise
+    dès qu'elle est complète, sans attendre la fin du découpage.
+    """
+    current_section = []
+    current_length = 0
+
+    for word in text.split():
+        if current_length + len(word) + 1 <= max_length:
+            current_section.append(word)
+            current_length += len(word) + 1
+        else:
+            if current_section:
+                yield " ".join(current_section)
+            current_section = [word]
+            current_length = len(word)
+
+    if current_section:
+        yield " ".join(current_section)
+
+
+class Condenser:
+    """Résume un texte section par section pour qu'il tienne dans un budget de tokens"""
+
+    def __init__(self, section_chars=1000, summary_tokens=150, cache=None, model=None):
+        self.section_chars = section_chars
+        self.summary_tokens = summary_tokens
+        self.cache = cache or GenerationCache(max_entries=1024, name="section_cache")
+        self.model = model
+
+    @classmethod
+    def from_env(cls):
+        """Créer le condenseur à partir des variables d'environnement"""
+        cache_dir = os.getenv("GENERATION_CACHE_DIR")
+        return cls(
+            section_chars=int(os.getenv("CONDENSE_SECTION_CHARS", "1000")),
+            summary_tokens=int(os.getenv("CONDENSE_SUMMARY_TOKENS", "150")),
+            cache=GenerationCache(
+                max_entries=int(os.getenv("CONDENSE_CACHE_SIZE", "1024")),
+                ttl=float(os.getenv("GENERATION_CACHE_TTL", "86400")),
+                disk_dir=os.path.join(cache_dir, "sections") if cache_dir else None,
+                max_disk_bytes=int(float(os.getenv("GENERATION_CACHE_DISK_MB", "256")) * 1024 * 1024),
+                name="section_cache",
+            ),
+            model=os.getenv("CONDENSE_MODEL") or None,
+        )
+
+    def _summarize(self, llm, section, token=None):
+        """Résumé d'une section, mis en cache par contenu"""
+        params = {'task': 'summary', 'max_tokens': self.summary_tokens}
+        key = self.cache.make_key(section, llm.model_id, params)
+        summary = self.cache.get(key)
+        if summary is not None:
+            return summary
+
+        def on_token(token_id, response):
+            return token is None or not token.cancelled
+
+        summary = llm.generate(
+            SUMMARY_PROMPT.format(section=section),
+            prefix=SUMMARY_PREFIX,
+            max_tokens=self.summary_tokens,
+            temp=0.2,
+            callback=on_token,
+        ).strip()
+        if token is not None:
+            token.check()
+        metrics.increment("condensation.sections_summarized")
+        self.cache.set(key, summary)
+        return summary
+
+    def condense(self, text, llm, budget, trim=None, token=None):
+        """Réduire `text` à `budget` tokens au plus.
+
+        trim(text, budget) raccourcit le texte si les résumés successifs ne
+        suffisent pas. Renvoie le texte tel quel s'il tient déjà dans le budget.
+        """
+        if llm.count_tokens(text) <= budget:
+            return text
+        metrics.increment("condensation.inputs")
+
+        for _ in range(MAX_ROUNDS):
+            # Les sections répétées (offre collée deux fois) ne sont résumées qu'une fois
+            sections = dict.fromkeys(iter_sections(text, self.section_chars))
+            # map : un résumé par section, dans l'ordre
+            summaries = [self._summarize(llm, section, token) for section in sections]
+            # reduce : les résumés assemblés forment le nouveau texte
+            condensed = "\n".join(summary for summary in summaries if summary)
+            if not condensed or len(condensed) >= len(text):
+                break
+            text = condensed
+            if llm.count_tokens(text) <= budget:
+                return text
+
+        metrics.increment("condensation.trimmed")
+        return trim(text, budget) if trim else text
+
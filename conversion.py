@@ -0,0 +1,417 @@
+"""Conversion DOCX vers PDF par un pool de processus de conversion persistants.
+
+docx2pdf pilote Word (Windows) ou osascript (macOS) et ne rend pas la main
+avant la fin de la conversion. Lancer un nouveau processus à chaque export
+coûte le démarrage de Python et l'import du convertisseur : un pool de
+processus persistants (CONVERSION_WORKERS, 2 par défaut, 1 avec docx2pdf)
+reçoit donc les conversions par une file d'attente. Chaque processus tourne
+dans son propre groupe de processus : si la requête est annulée ou si le
+délai CONVERSION_TIMEOUT est dépassé, le groupe entier est arrêté et le
+processus est relancé (Word, lancé hors du groupe, reste ouvert). Un contrôle
+de santé périodique relance les processus bloqués.
+
+Le convertisseur est choisi par CONVERTER :
+- "docx2pdf" (par défaut) : Word reste ouvert entre les conversions
+  (keep_active) et le pool est limité à un processus, car tous les processus
+  pilotent la même instance de Word (serveur COM partagé)
+- "command:<commande>" : n'importe quelle commande, avec {input}, {output}
+  et {outdir} (par exemple un client unoserver, ou LibreOffice sans interface)
+- "fake" : PDF minimal, pour les tests et les benchmarks
+  (FAKE_CONVERTER_DELAY simule la durée d'une conversion)
+
+Avec CONVERSION_WORKERS=0, chaque conversion est lancée dans un nouveau
+sous-processus, comme auparavant.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import shlex
+import atexit
+import signal
+import hashlib
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics
+from cancellation import Cancelled
+
+POLL_INTERVAL = 0.1
+# Convertisseurs qui pilotent une application partagée : un seul processus de conversion
+SINGLE_PROCESS_CONVERTERS = {"docx2pdf"}
+
+
+class ConversionError(Exception):
+    """Échec de la conversion"""
+    pass
+
+
+# Convertisseurs (exécutés dans les processus de conversion)
+
+def _convert_docx2pdf(input_path, output_path):
+    from docx2pdf import convert
+    # Sans keep_active, Word est quitté après chaque conversion (et relancé à la suivante)
+    convert(input_path, output_path, keep_active=True)
+
+
+def _convert_fake(input_path, output_path):
+    """PDF minimal portant l'empreinte du document Word"""
+    time.sleep(float(os.getenv("FAKE_CONVERTER_DELAY", "0")))
+    with open(input_path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    with open(output_path, 'wb') as f:
+        f.write(b"%PDF-1.4\n% " + digest.encode('ascii') + b"\n%%EOF\n")
+
+
+def _command_converter(template):
+    def convert(input_path, output_path):
+        outdir = os.path.dirname(output_path)
+        command = [part.format(input=input_path, output=output_path, outdir=outdir)
+                   for part in shlex.split(template)]
+        subprocess.run(command, check=True, stdout=sys.stderr)
+        # Les commandes qui n'acceptent qu'un dossier de sortie (soffice --outdir)
+        produced = os.path.join(outdir, os.path.splitext(os.path.basename(input_path))[0] + ".pdf")
+        if not os.path.exists(output_path) and os.path.exists(produced):
+            os.replace(produced, output_path)
+    return convert
+
+
+def load_converter(spec):
+    """Fonction de conversion (entrée, sortie) correspondant à CONVERTER"""
+    if spec == "docx2pdf":
+        return _convert_docx2pdf
+    if spec == "fake":
+        return _convert_fake
+    if spec.startswith("command:"):
+        return _command_converter(spec[len("command:"):])
+    raise ValueError(f"Convertisseur inconnu : {spec}")
+
+
+def worker_main(spec):
+    """Boucle d'un processus de conversion : une requête JSON par ligne sur stdin, une réponse sur stdout"""
+    replies = sys.stdout
+    # Les messages du convertisseur ne doivent pas se mêler aux réponses
+    sys.stdout = sys.stderr
+    convert = load_converter(spec)
+    for line in sys.stdin:
+        job = json.loads(line)
+        if job.get('ping'):
+            reply = {'ok': True}
+        else:
+            try:
+                convert(job['input'], job['output'])
+                reply = {'ok': True}
+            except BaseException as e:
+                reply = {'ok': False, 'error': str(e) or e.__class__.__name__}
+        replies.write(json.dumps(reply) + "\n")
+        replies.flush()
+
+
+# Processus
+
+def _process_options():
+    """Nouveau groupe de processus, pour arrêter aussi les descendants (soffice...).
+
+    Word n'en fait pas partie : lancé par COM (Windows) ou par osascript (macOS),
+    il n'est pas un descendant du processus de conversion et n'est pas arrêté.
+    """
+    if os.name == 'posix':
+        return {'start_new_session': True}
+    return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+
+
+def _kill(process):
+    """Arrêter le sous-processus et ses descendants (arborescence sous Windows, via taskkill)"""
+    try:
+        if os.name == 'posix':
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            process.kill()
+    except OSError:
+        pass
+    process.communicate()
+
+
+def _wait_reason(token, waited, timeout, timeout_reason):
+    """Raison d'abandonner l'attente (annulation ou délai dépassé), ou None"""
+    reason = token.reason if token is not None else None
+    if reason is None and timeout is not None and waited >= timeout:
+        reason = timeout_reason
+    return reason
+
+
+def _cancelled(reason, waited, pdf_path):
+    metrics.increment("cancellation.conversions")
+    metrics.increment("cancellation.conversion_seconds", waited)
+    if os.path.exists(pdf_path):
+        os.remove(pdf_path)
+    return Cancelled(reason)
+
+
+class ConversionWorker:
+    """Processus de conversion persistant, qui traite une conversion à la fois"""
+
+    def __init__(self, converter):
+        self.converter = converter
+        self.process = None
+        self.jobs = 0
+        self.start()
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker", self.converter],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, **_process_options()
+        )
+        self.jobs = 0
+        # Les réponses sont lues par un thread, pour pouvoir attendre avec un délai
+        self._replies = queue.Queue()
+        threading.Thread(
+            target=self._read_replies, args=(self.process.stdout, self._replies),
+            name="conversion-reader", daemon=True
+        ).start()
+
+    @staticmethod
+    def _read_replies(stream, replies):
+        for line in stream:
+            replies.put(line)
+        replies.put(None)
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def call(self, message, timeout=None, token=None, timeout_reason="conversion_timeout"):
+        """Envoyer une requête et attendre la réponse ; lève Cancelled si le délai est dépassé"""
+        try:
+            self.process.stdin.write((json.dumps(message) + "\n").encode('utf-8'))
+            self.process.stdin.flush()
+        except OSError as e:
+            raise ConversionError(f"Processus de conversion arrêté : {e}")
+
+        waited = 0.0
+        while True:
+            try:
+                line = self._replies.get(timeout=POLL_INTERVAL)
+                break
+            except queue.Empty:
+                waited += POLL_INTERVAL
+                reason = _wait_reason(token, waited, timeout, timeout_reason)
+                if reason is not None:
+                    raise Cancelled(reason)
+        if line is None:
+            raise ConversionError(f"Processus de conversion arrêté (code {self.process.wait()})")
+        return json.loads(line)
+
+    def ping(self, timeout):
+        """Contrôle de santé : le processus répond-il dans le délai ?"""
+        if not self.alive():
+            return False
+        try:
+            return self.call({'ping': True}, timeout, timeout_reason="health_check").get('ok', False)
+        except (Cancelled, ConversionError, ValueError):
+            return False
+
+    def restart(self):
+        self.stop()
+        self.start()
+        metrics.increment("conversion.restarts")
+
+    def stop(self):
+        _kill(self.process)
+
+
+class ConversionPool:
+    """Pool de processus de conversion persistants, alimenté par une file d'attente"""
+
+    def __init__(self, size=2, converter="docx2pdf", timeout=60.0, health_interval=30.0,
+                 health_timeout=10.0, max_jobs=None):
+        if converter in SINGLE_PROCESS_CONVERTERS and size > 1:
+            print(f"Convertisseur {converter} : un seul processus de conversion (au lieu de {size})")
+            size = 1
+        self.size = size
+        self.converter = converter
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        # Relancer un processus après max_jobs conversions (fuites mémoire du convertisseur)
+        self.max_jobs = max_jobs
+        self._idle = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._executor = None
+
+    @classmethod
+    def from_env(cls):
+        """Créer le pool à partir des variables d'environnement"""
+        max_jobs = int(os.getenv("CONVERSION_MAX_JOBS", "0"))
+        converter = os.getenv("CONVERTER", "docx2pdf")
+        default_size = "1" if converter in SINGLE_PROCESS_CONVERTERS else "2"
+        return cls(
+            size=max(1, int(os.getenv("CONVERSION_WORKERS", default_size))),
+            converter=converter,
+            timeout=float(os.getenv("CONVERSION_TIMEOUT", "60")),
+            health_interval=float(os.getenv("CONVERSION_HEALTH_INTERVAL", "30")),
+            max_jobs=max_jobs or None,
+        )
+
+    def _ensure_started(self):
+        """Démarrer les processus à la première conversion (après le fork des workers gunicorn)"""
+        if self._workers:
+            return
+        with self._lock:
+            if self._workers:
+                return
+            workers = [ConversionWorker(self.converter) for _ in range(self.size)]
+            for worker in workers:
+                self._idle.put(worker)
+            self._workers = workers
+            metrics.set_gauge("conversion.workers", self.size)
+            if self.health_interval:
+                threading.Thread(target=self._health_loop, name="conversion-health", daemon=True).start()
+
+    def _acquire(self, token, timeout):
+        """Processus libre ; l'attente dans la file compte dans le délai de la conversion"""
+        waited = 0.0
+        while True:
+            try:
+                worker = self._idle.get(timeout=POLL_INTERVAL)
+                break
+            except queue.Empty:
+                waited += POLL_INTERVAL
+                reason = _wait_reason(token, waited, timeout, "conversion_queue_timeout")
+                if reason is not None:
+                    metrics.increment("conversion.queue_timeouts")
+                    raise Cancelled(reason)
+        metrics.increment("conversion.queue_seconds", waited)
+        return worker, waited
+
+    def convert(self, docx_path, pdf_path, token=None, timeout=None):
+        """Convertir docx_path en pdf_path ; lève Cancelled si la requête est annulée"""
+        if timeout is None:
+            timeout = self.timeout
+        if token is not None:
+            token.check()
+        self._ensure_started()
+        worker, waited = self._acquire(token, timeout)
+        started = time.monotonic()
+        try:
+            if not worker.alive():
+                worker.restart()
+            reply = worker.call({
+                'input': os.path.abspath(docx_path),
+                'output': os.path.abspath(pdf_path),
+            }, timeout - waited, token)
+            worker.jobs += 1
+            if self.max_jobs and worker.jobs >= self.max_jobs:
+                worker.restart()
+        except Cancelled as e:
+            # Le processus est peut-être bloqué au milieu de la conversion : il est relancé
+            worker.restart()
+            raise _cancelled(e.reason, time.monotonic() - started, pdf_path)
+        except ConversionError:
+            worker.restart()
+            raise
+        finally:
+            self._idle.put(worker)
+
+        metrics.increment("conversion.jobs")
+        metrics.increment("conversion.seconds", time.monotonic() - started)
+        if not reply.get('ok'):
+            raise ConversionError(reply.get('error') or "Échec de la conversion")
+
+    def submit(self, docx_path, pdf_path, timeout=None):
+        """Conversion en arrière-plan (application de bureau) : renvoie un Future"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="conversion")
+        return self._executor.submit(self.convert, docx_path, pdf_path, None, timeout)
+
+    def _health_loop(self):
+        while not self._stopped.wait(self.health_interval):
+            self.check_health()
+
+    def check_health(self):
+        """Relancer les processus libres qui ne répondent plus ; renvoie le nombre de relances"""
+        restarted = 0
+        for _ in range(self.size):
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                if not worker.ping(self.health_timeout):
+                    worker.restart()
+                    restarted += 1
+                    metrics.increment("conversion.health_failures")
+            finally:
+                self._idle.put(worker)
+        return restarted
+
+    def close(self):
+        """Arrêter les processus de conversion"""
+        self._stopped.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.stop()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def conversion_pool():
+    """Pool de conversion du processus, créé à la première utilisation"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConversionPool.from_env()
+                atexit.register(_pool.close)
+    return _pool
+
+
+def convert_once(docx_path, pdf_path, token=None, timeout=60.0, converter=None):
+    """Conversion dans un nouveau sous-processus (CONVERSION_WORKERS=0)"""
+    converter = converter or os.getenv("CONVERTER", "docx2pdf")
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--convert", converter, docx_path, pdf_path],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, **_process_options()
+    )
+    waited = 0.0
+    while True:
+        try:
+            _, stderr = process.communicate(timeout=POLL_INTERVAL)
+            break
+        except subprocess.TimeoutExpired:
+            waited += POLL_INTERVAL
+            reason = _wait_reason(token, waited, timeout, "conversion_timeout")
+            if reason is not None:
+                _kill(process)
+                raise _cancelled(reason, waited, pdf_path)
+
+    if process.returncode != 0:
+        lines = stderr.decode('utf-8', 'replace').strip().splitlines()
+        raise ConversionError(lines[-1] if lines else f"Code de sortie {process.returncode}")
+
+
+def convert_to_pdf(docx_path, pdf_path, token=None, timeout=None):
+    """Convertir docx_path en pdf_path ; lève Cancelled si la requête est annulée"""
+    if timeout is None:
+        timeout = float(os.getenv("CONVERSION_TIMEOUT", "60"))
+    if int(os.getenv("CONVERSION_WORKERS", "2")) <= 0:
+        return convert_once(docx_path, pdf_path, token, timeout)
+    return conversion_pool().convert(docx_path, pdf_path, token, timeout)
+
+
+if __name__ == '__main__':
+    if sys.argv[1] == "--worker":
+        worker_main(sys.argv[2])
+    elif sys.argv[1] == "--convert":
+        load_converter(sys.argv[2])(sys.argv[3], sys.argv[4])
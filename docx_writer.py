@@ -0,0 +1,272 @@
+"""Écriture directe des documents Word (WordprocessingML), sans python-docx.
+
+python-docx construit un arbre lxml complet et applique la police, la taille
+et le gras à chaque segment. Pour les traitements par lots, ce module écrit
+directement document.xml à partir d'un squelette précompilé : la mise en forme
+est définie une fois dans styles.xml sous forme de styles nommés (LetterBody,
+LetterAddress, LetterSignature...), et chaque paragraphe ne fait que
+référencer son style. Le paquet est écrit avec zipfile, avec des dates et un
+ordre des fichiers fixes : la même lettre donne toujours les mêmes octets.
+"""
+import io
+import re
+import zipfile
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+from letter_ir import HEADER, FOOTER, LIST, SENDER, RECIPIENT
+from letter_renderers import (
+    DocxLayout, SPACED_BLOCKS, DOCX_STYLES, STRONG, EMPHASIS, UNDERLINE, docx_styles
+)
+
+# Date fixe des entrées de l'archive (sortie stable octet pour octet)
+ZIP_DATE = (1980, 1, 1, 0, 0, 0)
+TWIPS_PER_MM = 1440 / 25.4
+# Caractères interdits en XML 1.0
+INVALID_XML = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f￾￿]")
+ALIGNMENTS = {'left': 'left', 'center': 'center', 'right': 'right', 'justify': 'both'}
+
+NAMESPACES = (
+    'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+)
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+DOCUMENT_MAIN = "application/vnd.openxmlformats-officedocument.wordprocessingml"
+
+CONTENT_TYPES = (
+    XML_DECLARATION
+    + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    f'<Override PartName="/word/document.xml" ContentType="{DOCUMENT_MAIN}.document.main+xml"/>'
+    f'<Override PartName="/word/styles.xml" ContentType="{DOCUMENT_MAIN}.styles+xml"/>'
+    f'<Override PartName="/word/numbering.xml" ContentType="{DOCUMENT_MAIN}.numbering+xml"/>'
+    '{overrides}</Types>'
+)
+HEADER_FOOTER_TYPES = {
+    'header': f'<Override PartName="/word/header1.xml" ContentType="{DOCUMENT_MAIN}.header+xml"/>',
+    'footer': f'<Override PartName="/word/footer1.xml" ContentType="{DOCUMENT_MAIN}.footer+xml"/>',
+}
+
+PACKAGE_RELS = (
+    XML_DECLARATION
+    + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/></Relationships>'
+)
+
+RELATIONSHIP_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/"
+DOCUMENT_RELS = (
+    XML_DECLARATION
+    + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    f'<Relationship Id="rId1" Type="{RELATIONSHIP_TYPE}styles" Target="styles.xml"/>'
+    f'<Relationship Id="rId2" Type="{RELATIONSHIP_TYPE}numbering" Target="numbering.xml"/>'
+    '{relationships}</Relationships>'
+)
+HEADER_FOOTER_RELS = {
+    'header': f'<Relationship Id="rId3" Type="{RELATIONSHIP_TYPE}header" Target="header1.xml"/>',
+    'footer': f'<Relationship Id="rId4" Type="{RELATIONSHIP_TYPE}footer" Target="footer1.xml"/>',
+}
+HEADER_FOOTER_REFS = {
+    'header': '<w:headerReference w:type="default" r:id="rId3"/>',
+    'footer': '<w:footerReference w:type="default" r:id="rId4"/>',
+}
+
+DOCUMENT_START = XML_DECLARATION + f'<w:document {NAMESPACES}><w:body>'
+DOCUMENT_END = '{section}</w:body></w:document>'
+
+NUMBERING = (
+    XML_DECLARATION
+    + f'<w:numbering {NAMESPACES}>'
+    '<w:abstractNum w:abstractNumId="0"><w:multiLevelType w:val="singleLevel"/>'
+    '<w:lvl w:ilvl="0"><w:start w:val="1"/><w:numFmt w:val="bullet"/><w:lvlText w:val="•"/>'
+    '<w:lvlJc w:val="left"/><w:pPr><w:ind w:left="{left}" w:hanging="284"/></w:pPr></w:lvl>'
+    '</w:abstractNum><w:num w:numId="1"><w:abstractNumId w:val="0"/></w:num></w:numbering>'
+)
+
+
+def _twips(mm):
+    return int(round(mm * TWIPS_PER_MM))
+
+
+def _layout_key(layout, styles):
+    """Réglages de mise en page et styles nommés sous forme hachable (cache des squelettes)"""
+    return (
+        layout.font, layout.font_size, layout.line_spacing,
+        tuple(sorted(layout.margins.items())),
+        tuple(sorted(layout.page_size.items())) if layout.page_size else None,
+        layout.list_indent, layout.space_after,
+        tuple((name, tuple(sorted(properties.items()))) for name, properties in styles.items()),
+    )
+
+
+def _paragraph_style(style_id, name, properties="", run_properties=""):
+    return (
+        f'<w:style w:type="paragraph" w:customStyle="1" w:styleId="{style_id}">'
+        f'<w:name w:val="{name}"/><w:basedOn w:val="Normal"/><w:qFormat/>'
+        f'<w:pPr>{properties}</w:pPr><w:rPr>{run_properties}</w:rPr></w:style>'
+    )
+
+
+def _character_style(style_id, name, run_properties):
+    return (
+        f'<w:style w:type="character" w:customStyle="1" w:styleId="{style_id}">'
+        f'<w:name w:val="{name}"/><w:qFormat/><w:rPr>{run_properties}</w:rPr></w:style>'
+    )
+
+
+def _style_properties(properties):
+    """pPr et rPr d'un style de paragraphe nommé"""
+    paragraph = ""
+    if properties.get("first_line_indent"):
+        paragraph += f'<w:ind w:firstLine="{_twips(properties["first_line_indent"])}"/>'
+    if properties.get("align"):
+        paragraph += f'<w:jc w:val="{ALIGNMENTS[properties["align"]]}"/>'
+    run = "<w:b/><w:bCs/>" if properties.get("bold") else ""
+    if properties.get("color"):
+        run += f'<w:color w:val="{properties["color"]}"/>'
+    if properties.get("font_size"):
+        half_points = int(round(properties["font_size"] * 2))
+        run += f'<w:sz w:val="{half_points}"/><w:szCs w:val="{half_points}"/>'
+    return paragraph, run
+
+
+@lru_cache(maxsize=16)
+def _skeleton(key):
+    """Parties fixes du paquet pour une mise en page : styles.xml, numbering.xml, sectPr"""
+    font, font_size, line_spacing, margins, page_size, list_indent, space_after, named_styles = key
+    margins = dict(margins)
+    page_size = dict(page_size) if page_size else {"width": 210, "height": 297}
+    font = escape(font, {'"': "&quot;"})
+
+    paragraph_styles = ""
+    for name, properties in named_styles:
+        paragraph, run = _style_properties(dict(properties))
+        if name == "LetterList":
+            paragraph = (f'<w:numPr><w:ilvl w:val="0"/><w:numId w:val="1"/></w:numPr>'
+                         f'<w:ind w:left="{_twips(list_indent)}" w:hanging="284"/>' + paragraph)
+        paragraph_styles += _paragraph_style(name, name, paragraph, run)
+
+    styles = (
+        XML_DECLARATION
+        + f'<w:styles {NAMESPACES}>'
+        '<w:docDefaults><w:rPrDefault><w:rPr>'
+        f'<w:rFonts w:ascii="{font}" w:hAnsi="{font}" w:eastAsia="{font}" w:cs="{font}"/>'
+        f'<w:sz w:val="{int(round(font_size * 2))}"/><w:szCs w:val="{int(round(font_size * 2))}"/>'
+        '<w:lang w:val="fr-FR"/></w:rPr></w:rPrDefault>'
+        '<w:pPrDefault><w:pPr>'
+        f'<w:spacing w:before="0" w:after="{int(round(space_after * 20))}" '
+        f'w:line="{int(round(line_spacing * 240))}" w:lineRule="auto"/>'
+        '</w:pPr></w:pPrDefault></w:docDefaults>'
+        '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/><w:qFormat/></w:style>'
+        '<w:style w:type="character" w:default="1" w:styleId="DefaultParagraphFont">'
+        '<w:name w:val="Default Paragraph Font"/><w:uiPriority w:val="1"/><w:semiHidden/></w:style>'
+        + paragraph_styles
+        + _character_style(STRONG, STRONG, "<w:b/><w:bCs/>")
+        + _character_style(EMPHASIS, EMPHASIS, "<w:i/><w:iCs/>")
+        + _character_style(UNDERLINE, UNDERLINE, '<w:u w:val="single"/>')
+        + '</w:styles>'
+    )
+    section = (
+        '<w:sectPr>{references}'
+        f'<w:pgSz w:w="{_twips(page_size["width"])}" w:h="{_twips(page_size["height"])}"/>'
+        f'<w:pgMar w:top="{_twips(margins["top"])}" w:right="{_twips(margins["right"])}" '
+        f'w:bottom="{_twips(margins["bottom"])}" w:left="{_twips(margins["left"])}" '
+        'w:header="709" w:footer="709" w:gutter="0"/></w:sectPr>'
+    )
+    numbering = NUMBERING.format(left=_twips(list_indent))
+    return styles.encode('utf-8'), numbering.encode('utf-8'), section
+
+
+def _text(text):
+    return escape(INVALID_XML.sub("", text))
+
+
+def _runs(line):
+    """Segments d'une ligne : un style de caractère, les autres styles en direct s'ils se cumulent"""
+    parts = []
+    for span in line:
+        if not span.text:
+            continue
+        styles = [(span.bold, STRONG, "<w:b/>"), (span.italic, EMPHASIS, "<w:i/>"),
+                  (span.underline, UNDERLINE, '<w:u w:val="single"/>')]
+        active = [(style_id, direct) for enabled, style_id, direct in styles if enabled]
+        if active:
+            properties = f'<w:rStyle w:val="{active[0][0]}"/>' + "".join(direct for _, direct in active[1:])
+            parts.append(f'<w:r><w:rPr>{properties}</w:rPr><w:t xml:space="preserve">{_text(span.text)}</w:t></w:r>')
+        else:
+            parts.append(f'<w:r><w:t xml:space="preserve">{_text(span.text)}</w:t></w:r>')
+    return "".join(parts)
+
+
+def _paragraph(style, lines, align=None):
+    properties = f'<w:pStyle w:val="{style}"/>'
+    if align:
+        properties += f'<w:jc w:val="{ALIGNMENTS[align]}"/>'
+    content = '<w:r><w:br/></w:r>'.join(_runs(line) for line in lines)
+    return f'<w:p><w:pPr>{properties}</w:pPr>{content}</w:p>'
+
+
+def _header_footer(tag, block):
+    return (
+        XML_DECLARATION + f'<w:{tag} {NAMESPACES}>'
+        + _paragraph(DOCX_STYLES[block.kind], block.lines)
+        + f'</w:{tag}>'
+    ).encode('utf-8')
+
+
+def render_docx_bytes(letter, layout=None):
+    """Document Word de la lettre, écrit directement (octets du fichier .docx)"""
+    layout = layout or DocxLayout()
+    named_styles = docx_styles(layout)
+    styles, numbering, section = _skeleton(_layout_key(layout, named_styles))
+
+    body = [DOCUMENT_START]
+    extra_parts = {}
+    for block in letter:
+        style = DOCX_STYLES[block.kind]
+        # Alignement direct seulement s'il diffère de celui du style
+        align = block.align if block.align != named_styles[style].get("align") else None
+        if block.kind in (HEADER, FOOTER):
+            tag = 'hdr' if block.kind == HEADER else 'ftr'
+            extra_parts['header' if block.kind == HEADER else 'footer'] = _header_footer(tag, block)
+            continue
+        if block.kind in (LIST, SENDER, RECIPIENT):
+            # Une ligne par paragraphe (puces, lignes d'adresse)
+            for line in block.lines:
+                body.append(_paragraph(style, [line], align))
+        else:
+            body.append(_paragraph(style, block.lines, align))
+        if block.kind in SPACED_BLOCKS:
+            body.append('<w:p/>')
+
+    kinds = [kind for kind in ('header', 'footer') if kind in extra_parts]
+    body.append(DOCUMENT_END.format(
+        section=section.format(references="".join(HEADER_FOOTER_REFS[kind] for kind in kinds))
+    ))
+
+    parts = [
+        ('[Content_Types].xml', CONTENT_TYPES.format(
+            overrides="".join(HEADER_FOOTER_TYPES[kind] for kind in kinds)).encode('utf-8')),
+        ('_rels/.rels', PACKAGE_RELS.encode('utf-8')),
+        ('word/document.xml', "".join(body).encode('utf-8')),
+        ('word/_rels/document.xml.rels', DOCUMENT_RELS.format(
+            relationships="".join(HEADER_FOOTER_RELS[kind] for kind in kinds)).encode('utf-8')),
+        ('word/styles.xml', styles),
+        ('word/numbering.xml', numbering),
+    ]
+    parts += [(f'word/{kind}1.xml', extra_parts[kind]) for kind in kinds]
+    return _write_package(parts)
+
+
+def _write_package(parts):
+    """Archive .docx aux métadonnées fixes"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as package:
+        for name, content in parts:
+            info = zipfile.ZipInfo(name, date_time=ZIP_DATE)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            package.writestr(info, content)
+    return buffer.getvalue()
@@ -0,0 +1,215 @@
+"""Cache des réponses du modèle de génération.
+
+Deux niveaux :
+- mémoire : LRU borné, propre à chaque worker
+- disque (optionnel) : un fichier JSON par entrée, partagé entre les workers,
+  borné en octets ; la date de modification sert d'horodatage LRU
+
+Les entrées expirent après `ttl` secondes dans les deux niveaux. Quand le
+niveau disque dépasse sa taille maximale, les fichiers expirés puis les moins
+récemment utilisés sont supprimés.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from metrics import metrics
+
+# Après un dépassement, le niveau disque est ramené à cette fraction de sa taille maximale
+DISK_LOW_WATERMARK = 0.9
+
+
+def normalize_prompt(prompt):
+    """Normaliser un prompt pour que les variantes de mise en forme partagent la même entrée"""
+    prompt = unicodedata.normalize("NFC", prompt)
+    lines = [re.sub(r"[ \t]+", " ", line).strip() for line in prompt.strip().splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+
+
+class GenerationCache:
+    """Cache LRU + TTL des générations, avec niveau disque optionnel"""
+
+    def __init__(self, max_entries=256, ttl=86400, disk_dir=None, max_disk_bytes=256 * 1024 * 1024,
+                 name="generation_cache"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.name = name
+        self._entries = OrderedDict()
+        self._disk_bytes = None          # estimation, recalculée lors d'une éviction
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """Créer le cache à partir des variables d'environnement"""
+        return cls(
+            max_entries=int(os.getenv("GENERATION_CACHE_SIZE", "256")),
+            ttl=float(os.getenv("GENERATION_CACHE_TTL", "86400")),
+            disk_dir=os.getenv("GENERATION_CACHE_DIR") or None,
+            max_disk_bytes=int(float(os.getenv("GENERATION_CACHE_DISK_MB", "256")) * 1024 * 1024),
+        )
+
+    @staticmethod
+    def make_key(prompt, model_id, params):
+        """Clé de cache : prompt normalisé + modèle + paramètres d'échantillonnage"""
+        payload = json.dumps({
+            "prompt": normalize_prompt(prompt),
+            "model": model_id,
+            "params": params,
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _count(self, event):
+        metrics.increment(f"{self.name}.{event}")
+
+    def get(self, key):
+        """Renvoyer la valeur associée à la clé, ou None"""
+        if self.max_entries > 0:
+            now = time.time()
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    value, expires_at = entry
+                    if expires_at > now:
+                        self._entries.move_to_end(key)
+                        self._count("hits.memory")
+                        return value
+                    del self._entries[key]
+                    self._count("expirations")
+
+        value = self._disk_get(key)
+        if value is not None:
+            self._count("hits.disk")
+            self._memory_set(key, value)
+            return value
+
+        self._count("misses")
+        return None
+
+    def set(self, key, value):
+        """Enregistrer une valeur dans les deux niveaux"""
+        self._memory_set(key, value)
+        self._disk_set(key, value)
+
+    def _memory_set(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._count("evictions")
+            metrics.set_gauge(f"{self.name}.entries", len(self._entries))
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("expires_at", 0) <= time.time():
+            self._count("expirations")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        try:
+            # Marquer l'entrée comme récemment utilisée
+            os.utime(path)
+        except OSError:
+            pass
+        return entry.get("value")
+
+    def _disk_set(self, key, value):
+        if not self.disk_dir:
+            return
+        content = json.dumps({"value": value, "expires_at": time.time() + self.ttl},
+                             ensure_ascii=False).encode("utf-8")
+        if len(content) > self.max_disk_bytes:
+            return
+        try:
+            # Écriture atomique : les autres workers ne lisent jamais un fichier partiel
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, self._disk_path(key))
+        except OSError as e:
+            print(f"Erreur lors de l'écriture du cache : {e}")
+            return
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._disk_usage()[1]
+            else:
+                self._disk_bytes += len(content)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._disk_evict()
+
+    def _disk_usage(self):
+        """Fichiers du niveau disque [(date d'accès, taille, chemin)] et taille totale"""
+        files = []
+        for filename in os.listdir(self.disk_dir):
+            if filename.endswith(".json"):
+                path = os.path.join(self.disk_dir, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files, sum(size for _, size, _ in files)
+
+    def _disk_evict(self):
+        """Supprimer les fichiers expirés, puis les moins récemment utilisés (tous workers confondus)"""
+        files, total = self._disk_usage()
+        target = self.max_disk_bytes * DISK_LOW_WATERMARK
+        # Un fichier écrit avant mtime - ttl est forcément expiré (la lecture ne prolonge pas l'entrée)
+        expired_before = time.time() - self.ttl
+        for mtime, size, path in sorted(files, key=lambda f: (f[0] > expired_before, f[0])):
+            if total <= target and mtime > expired_before:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self._count("expirations" if mtime <= expired_before else "evictions.disk")
+        self._disk_bytes = total
+        metrics.set_gauge(f"{self.name}.disk_bytes", total)
+
+    def clear(self):
+        """Vider les deux niveaux"""
+        with self._lock:
+            self._entries.clear()
+            self._disk_bytes = None
+        if self.disk_dir:
+            for filename in os.listdir(self.disk_dir):
+                if filename.endswith(".json"):
+                    try:
+                        os.remove(os.path.join(self.disk_dir, filename))
+                    except OSError:
+                        pass
+
+    def stats(self):
+        """Compteurs de succès/échecs du cache"""
+        stats = metrics.snapshot(prefix=f"{self.name}.")
+        hits = stats.get(f"{self.name}.hits.memory", 0) + stats.get(f"{self.name}.hits.disk", 0)
+        lookups = hits + stats.get(f"{self.name}.misses", 0)
+        stats[f"{self.name}.hit_rate"] = round(hits / lookups, 4) if lookups else None
+        return stats
@@ -0,0 +1,324 @@
+"""Extraction des champs du formulaire à partir d'une offre d'emploi collée.
+
+Extraction déterministe par expressions régulières (sans appel au modèle) :
+entreprise, poste, durée du contrat et date de début, ainsi que le type de
+contrat, le salaire et le lieu à titre indicatif. Les durées et dates
+reconnues sont celles qu'acceptent LocalizedDataValidator.validate_duration et
+validate_date, et les valeurs renvoyées sont déjà dans le format attendu par
+validate_letter_data ("6 mois", "01/09/2024").
+"""
+import re
+from datetime import datetime
+
+# Mêmes unités que LocalizedDataValidator.validate_duration, converties en français
+DURATION_UNITS = r"mois|ans?|semaines?|months?|years?|weeks?"
+UNIT_MAP = {
+    'month': 'mois', 'months': 'mois',
+    'year': 'an', 'years': 'ans',
+    'week': 'semaine', 'weeks': 'semaines'
+}
+# Format des dates renvoyées, le premier accepté par validate_date
+DATE_FORMAT = "%d/%m/%Y"
+
+MONTHS = {
+    'janvier': 1, 'février': 2, 'fevrier': 2, 'mars': 3, 'avril': 4, 'mai': 5, 'juin': 6,
+    'juillet': 7, 'août': 8, 'aout': 8, 'septembre': 9, 'octobre': 10, 'novembre': 11,
+    'décembre': 12, 'decembre': 12,
+    'january': 1, 'february': 2, 'march': 3, 'april': 4, 'may': 5, 'june': 6, 'july': 7,
+    'august': 8, 'september': 9, 'october': 10, 'november': 11, 'december': 12,
+}
+MONTH_NAMES = "|".join(sorted(MONTHS, key=len, reverse=True))
+
+DURATION_PATTERN = re.compile(rf"\b(\d{{1,3}})[\s-]*({DURATION_UNITS})\b", re.IGNORECASE)
+# Une durée précédée de ces mots est celle du contrat (et non l'expérience demandée)
+DURATION_CONTEXT = re.compile(
+    r"(durée|contrat|mission|cdd|stage|alternance|internship|contract|duration|assignment)[^\n.]{0,40}$",
+    re.IGNORECASE
+)
+# Une durée suivie de ces mots est l'expérience demandée, jamais celle du contrat
+EXPERIENCE_CONTEXT = re.compile(r"[ \t]*(?:d['’]|de[ \t]+|of[ \t]+)?(?:expérience|experience)", re.IGNORECASE)
+
+DATE_PATTERNS = [
+    # 01/09/2024, 01-09-2024, 01.09.2024
+    (re.compile(r"\b(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})\b"), ('day', 'month', 'year')),
+    # 2024-09-01
+    (re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b"), ('year', 'month', 'day')),
+    # 1er septembre 2024, 1 September 2024
+    (re.compile(rf"\b(\d{{1,2}})(?:er|st|nd|rd|th)?\s+({MONTH_NAMES})\s+(\d{{4}})\b", re.IGNORECASE),
+     ('day', 'month', 'year')),
+    # September 1, 2024
+    (re.compile(rf"\b({MONTH_NAMES})\s+(\d{{1,2}})(?:st|nd|rd|th)?,?\s+(\d{{4}})\b", re.IGNORECASE),
+     ('month', 'day', 'year')),
+]
+START_CONTEXT = re.compile(
+    r"(début|démarrage|prise de poste|à partir du|dès le|disponible le|commencer|"
+    r"start(?:ing)?(?: date)?|from|as of|beginning)[^\n.]{0,30}$",
+    re.IGNORECASE
+)
+
+POSITION_LABEL = re.compile(
+    r"^[ \t]*(?:intitulé du poste|titre du poste|poste|job title|position|role|rôle|offre)"
+    r"[ \t]*[:\-–][ \t]*(.+)$",
+    re.IGNORECASE | re.MULTILINE
+)
+POSITION_PHRASE = re.compile(
+    r"\b(?:recrute|recrutons|recherche|recherchons|is hiring|are hiring|is looking for|"
+    r"are looking for|seeking)\s+(?:(?:un|une|des|an?|our|son|sa|notre|new)(?:\(e\))?\s+)?"
+    r"(?:futur\(e\)\s+|futur\s+|future\s+)?([^\n,.;:!?()]{3,80})",
+    re.IGNORECASE
+)
+POSITION_MARKER = re.compile(r"\(?\b(?:H/F|F/H|M/F|F/M|H/F/X|F/H/X)\b\)?", re.IGNORECASE)
+# Fin du titre de poste dans une phrase ("... pour rejoindre", "... en CDI")
+POSITION_END = re.compile(
+    r"\s+(?:pour|afin|en|au sein|dans|qui|chez|à|to|for|who|in|at|with|based)\b.*$",
+    re.IGNORECASE
+)
+
+COMPANY_LABEL = re.compile(
+    r"^[ \t]*(?:entreprise|société|employeur|company|employer|organisation|organization)"
+    r"[ \t]*[:\-–][ \t]*(.+)$",
+    re.IGNORECASE | re.MULTILINE
+)
+# Nom propre : suite de mots commençant par une majuscule ou un chiffre
+PROPER_NAME = r"[A-Z0-9][\w&'’.-]*(?:[ \t]+(?:&[ \t]+)?[A-Z0-9][\w&'’.-]*){0,3}"
+COMPANY_BEFORE_VERB = re.compile(
+    rf"\b({PROPER_NAME})[ \t]+(?:recrute|recherche|is hiring|is looking|are hiring)\b"
+)
+COMPANY_AFTER_PREPOSITION = re.compile(
+    rf"\b(?:chez|rejoindre|rejoignez|rejoins|au sein de|join|at)[ \t]+(?:l'|la[ \t]+|le[ \t]+|les[ \t]+)?({PROPER_NAME})"
+)
+EMAIL_DOMAIN = re.compile(r"\b[\w.+-]+@([a-z0-9-]+)\.[a-z.]{2,}\b", re.IGNORECASE)
+WEBMAIL_DOMAINS = {'gmail', 'hotmail', 'outlook', 'yahoo', 'orange', 'free', 'laposte', 'wanadoo', 'icloud'}
+
+# Mots capitalisés qui ne sont pas des noms d'entreprise
+NOT_COMPANY = {
+    'nous', 'notre', 'vous', 'votre', 'la', 'le', 'les', 'l', 'une', 'un', 'we', 'our', 'the',
+    'you', 'your', 'this', 'cette', 'ce', 'il', 'elle', 'on', 'poste', 'job', 'description',
+}
+
+# Type de contrat normalisé, le premier motif trouvé dans l'offre l'emporte
+CONTRACT_TYPES = [
+    ('CDI', r"cdi|contrat à durée indéterminée|permanent(?: contract| position| role)?"),
+    ('CDD', r"cdd|contrat à durée déterminée|fixed[- ]term(?: contract)?"),
+    ('Alternance', r"alternance|apprentissage|contrat de professionnalisation|apprenticeship|work[- ]study"),
+    ('Stage', r"stage|internship|intern"),
+    ('Intérim', r"intérim|interim|travail temporaire|temp(?:orary)? (?:job|position|contract)"),
+    ('Freelance', r"freelance|free-lance|indépendant|portage salarial|contractor"),
+]
+CONTRACT_PATTERN = re.compile(
+    "|".join(rf"(?<![\w-])(?P<c{index}>{pattern})(?![\w-])" for index, (_, pattern) in enumerate(CONTRACT_TYPES)),
+    re.IGNORECASE
+)
+CONTRACT_LABEL = re.compile(
+    r"^[ \t]*(?:type de contrat|contrat|contract type|contract|employment type)[ \t]*[:\-–][ \t]*(.+)$",
+    re.IGNORECASE | re.MULTILINE
+)
+
+# Montant : 45 000, 45.000, 50,000, 2500, 12,50, suivi éventuellement de k
+AMOUNT = r"\d{1,3}(?:[ \u00a0\u202f.,]\d{3})+(?!\d)|\d+(?:[.,]\d{1,2})?(?!\d)"
+CURRENCY = r"€|euros?\b|EUR\b|\$|USD\b|£|GBP\b"
+CURRENCY_MAP = {'€': '€', 'euro': '€', 'euros': '€', 'eur': '€', '$': '$', 'usd': '$', '£': '£', 'gbp': '£'}
+SALARY_PATTERN = re.compile(
+    rf"(?<![\w.,])(?P<before>[€$£])?[ \t]*(?P<low>{AMOUNT})[ \t]*(?P<low_k>[kK](?![a-zA-Z]))?[ \t]*"
+    rf"(?P<low_currency>{CURRENCY})?"
+    rf"(?:[ \t]*(?:-|–|à|a|to|and|et)[ \t]*[€$£]?[ \t]*(?P<high>{AMOUNT})[ \t]*(?P<high_k>[kK](?![a-zA-Z]))?)?"
+    rf"[ \t]*(?P<currency>{CURRENCY})?",
+    re.IGNORECASE
+)
+SALARY_PERIOD = re.compile(
+    r"[ \t]*(?:bruts?|nets?|gross)?[ \t]*(?:/|par|per)?[ \t]*"
+    r"(?P<period>annuels?|an|année|year|yearly|annual|annum|mensuels?|mois|month|monthly|heure|h|hour|hourly)\b",
+    re.IGNORECASE
+)
+PERIODS = {
+    'an': 'par an', 'annuel': 'par an', 'annuels': 'par an', 'année': 'par an', 'year': 'par an',
+    'yearly': 'par an', 'annual': 'par an', 'annum': 'par an',
+    'mois': 'par mois', 'mensuel': 'par mois', 'mensuels': 'par mois', 'month': 'par mois', 'monthly': 'par mois',
+    'heure': "de l'heure", 'h': "de l'heure", 'hour': "de l'heure", 'hourly': "de l'heure",
+}
+
+LOCATION_LABEL = re.compile(
+    r"^[ \t]*(?:lieu de travail|lieu|localisation|ville|location|work location|based in)"
+    r"[ \t]*[:\-–][ \t]*(.+)$",
+    re.IGNORECASE | re.MULTILINE
+)
+# Nom de ville : mots capitalisés, éventuellement reliés par des tirets (Aix-en-Provence)
+CITY = r"[A-ZÀ-Ý][\w'’-]*(?:[ \t]+[A-ZÀ-Ý][\w'’-]*){0,2}"
+LOCATION_PHRASE = re.compile(
+    rf"\b(?:basée?s?|situées?|situés?|localisée?s?|à pourvoir|based|located)[ \t]+(?:à|a|en|in|at|sur)[ \t]+({CITY})"
+)
+# Fin du lieu sur une ligne étiquetée ("Lyon (69) - télétravail partiel")
+LOCATION_END = re.compile(r"[ \t]*(?:[(,;|/]|[ \t][-–][ \t]).*$")
+
+MAX_FIELD_LENGTH = 80
+
+
+def _clean(value):
+    """Normaliser une valeur extraite (espaces, ponctuation de fin, longueur)"""
+    value = " ".join(value.split()).strip(" \t-–:;,.")
+    return value[:MAX_FIELD_LENGTH].rstrip() if value else None
+
+
+def extract_duration(text):
+    """Durée du contrat au format de validate_duration ("6 mois", "1 an")"""
+    first = None
+    for match in DURATION_PATTERN.finditer(text):
+        number, unit = match.group(1), match.group(2).lower()
+        duration = f"{number} {UNIT_MAP.get(unit, unit)}"
+        if DURATION_CONTEXT.search(text, max(0, match.start() - 60), match.start()):
+            return duration
+        if first is None and not EXPERIENCE_CONTEXT.match(text, match.end()):
+            first = duration
+    return first
+
+
+def _to_date(parts, order):
+    values = dict(zip(order, parts))
+    month = values['month']
+    month = MONTHS.get(month.lower()) if not month.isdigit() else int(month)
+    try:
+        return datetime(int(values['year']), month, int(values['day']))
+    except (TypeError, ValueError):
+        return None
+
+
+def extract_start_date(text):
+    """Date de début au format JJ/MM/AAAA"""
+    candidates = []
+    for pattern, order in DATE_PATTERNS:
+        for match in pattern.finditer(text):
+            date = _to_date(match.groups(), order)
+            if date is not None:
+                candidates.append((match.start(), date))
+    if not candidates:
+        return None
+    candidates.sort(key=lambda candidate: candidate[0])
+    for start, date in candidates:
+        if START_CONTEXT.search(text, max(0, start - 40), start):
+            return date.strftime(DATE_FORMAT)
+    return candidates[0][1].strftime(DATE_FORMAT)
+
+
+def _clean_position(value):
+    value = POSITION_MARKER.sub("", value)
+    value = POSITION_END.sub("", value)
+    return _clean(value)
+
+
+def extract_position(text):
+    """Intitulé du poste : ligne étiquetée, titre (H/F) ou phrase de recrutement"""
+    match = POSITION_LABEL.search(text)
+    if match:
+        return _clean_position(match.group(1))
+    match = POSITION_MARKER.search(text)
+    if match:
+        # Titre d'annonce : "Développeur Python (H/F)"
+        start = text.rfind("\n", 0, match.start()) + 1
+        position = _clean_position(text[start:match.start()])
+        if position:
+            return position
+    match = POSITION_PHRASE.search(text)
+    if match:
+        return _clean_position(match.group(1))
+    return None
+
+
+def _valid_company(name):
+    name = _clean(name)
+    if not name or name.split()[0].lower().strip("'’") in NOT_COMPANY:
+        return None
+    return name
+
+
+def extract_company(text):
+    """Nom de l'entreprise : ligne étiquetée, "X recrute", "chez X" ou domaine de l'email"""
+    match = COMPANY_LABEL.search(text)
+    if match and _valid_company(match.group(1)):
+        return _valid_company(match.group(1))
+    for pattern in (COMPANY_BEFORE_VERB, COMPANY_AFTER_PREPOSITION):
+        for match in pattern.finditer(text):
+            company = _valid_company(match.group(1))
+            if company:
+                return company
+    for match in EMAIL_DOMAIN.finditer(text):
+        domain = match.group(1).lower()
+        if domain not in WEBMAIL_DOMAINS:
+            return domain.capitalize()
+    return None
+
+
+def extract_contract_type(text):
+    """Type de contrat normalisé (CDI, CDD, Alternance, Stage, Intérim, Freelance)"""
+    match = CONTRACT_LABEL.search(text)
+    for source in ((match.group(1),) if match else ()) + (text,):
+        found = CONTRACT_PATTERN.search(source)
+        if found:
+            return CONTRACT_TYPES[int(found.lastgroup[1:])][0]
+    return None
+
+
+def _amount(value, thousands):
+    """Montant en nombre, "45 000" et "50,000" comme "45k" """
+    if re.fullmatch(r"\d{1,3}(?:[ \u00a0\u202f.,]\d{3})+", value):
+        number = float(re.sub(r"\D", "", value))
+    else:
+        number = float(value.replace(",", "."))
+    return number * 1000 if thousands else number
+
+
+def _format_amount(number):
+    if number == int(number):
+        return f"{int(number):,}".replace(",", " ")
+    return f"{number:.2f}".replace(".", ",")
+
+
+def extract_salary(text):
+    """Salaire ou fourchette de salaire ("45 000 - 55 000 € par an"), seulement si une devise est indiquée"""
+    for match in SALARY_PATTERN.finditer(text):
+        currency = match.group('before') or match.group('low_currency') or match.group('currency')
+        if not currency:
+            continue
+        high_k = bool(match.group('high_k'))
+        # "45-55 k€" : le k de la borne haute vaut pour les deux
+        low = _amount(match.group('low'), match.group('low_k') or (high_k and not match.group('low_currency')))
+        salary = _format_amount(low)
+        if match.group('high'):
+            salary += " - " + _format_amount(_amount(match.group('high'), high_k))
+        salary += " " + CURRENCY_MAP[currency.lower()]
+        period = SALARY_PERIOD.match(text, match.end())
+        if period:
+            salary += " " + PERIODS[period.group('period').lower()]
+        return salary
+    return None
+
+
+def extract_location(text):
+    """Lieu de travail : ligne étiquetée ou "basé à X", "based in X" """
+    match = LOCATION_LABEL.search(text)
+    if match:
+        location = _clean(LOCATION_END.sub("", match.group(1)))
+        if location:
+            return location
+    match = LOCATION_PHRASE.search(text)
+    if match:
+        return _clean(match.group(1))
+    return None
+
+
+def extract_job_offer(text):
+    """Champs du formulaire trouvés dans l'offre (les champs absents valent None)"""
+    text = text or ""
+    return {
+        'company': extract_company(text),
+        'position': extract_position(text),
+        'duration': extract_duration(text),
+        'start_date': extract_start_date(text),
+        'contract_type': extract_contract_type(text),
+        'salary': extract_salary(text),
+        'location': extract_location(text),
+    }
+
+
+def extract_job_offers(texts):
+    """Version par lots (publipostage) : une extraction par offre, dans l'ordre"""
+    return [extract_job_offer(text) for text in texts]
@@ -0,0 +1,195 @@
+"""Représentation intermédiaire d'une lettre.
+
+La lettre est analysée une seule fois en une suite de blocs typés
+(expéditeur, destinataire, date, objet, formule d'appel, paragraphes, listes,
+formule de politesse, signature...). Chaque bloc contient des lignes, et
+chaque ligne des segments de texte stylés (gras, italique, souligné). Les
+rendus HTML, DOCX et texte (letter_renderers) sont des fonctions de cette
+représentation : un export en plusieurs formats analyse la lettre une fois et
+la rend autant de fois que nécessaire.
+"""
+import re
+
+import markup
+from stop_detection import CLOSING_PATTERN
+
+HEADER = "header"
+SENDER = "sender"
+RECIPIENT = "recipient"
+DATE = "date"
+SUBJECT = "subject"
+GREETING = "greeting"
+PARAGRAPH = "paragraph"
+LIST = "list"
+CLOSING = "closing"
+SIGNATURE = "signature"
+FOOTER = "footer"
+
+DEFAULT_GREETING = "Madame, Monsieur,"
+DEFAULT_CLOSING = "Je vous prie d'agréer, Madame, Monsieur, l'expression de mes salutations distinguées."
+# Le contenu généré commence parfois déjà par une formule d'appel
+GREETING_PATTERN = re.compile(r"^\s*(madame|monsieur|cher|chère|dear|to whom)\b", re.IGNORECASE)
+
+LIST_ITEM = re.compile(r"^\s*[-•*]\s+")
+# La formule de politesse générée est cherchée dans la fin du dernier paragraphe
+CLOSING_SEARCH_CHARS = 300
+
+# Champs du formulaire repris dans la lettre
+FIELDS = (
+    'header', 'full_name', 'address', 'postal_code', 'city', 'phone', 'email', 'company',
+    'company_address', 'company_postal_code', 'company_city', 'date', 'subject', 'signature', 'footer'
+)
+
+
+class Span:
+    """Segment de texte et son style"""
+
+    __slots__ = ('text', 'bold', 'italic', 'underline')
+
+    def __init__(self, text, bold=False, italic=False, underline=False):
+        self.text = text
+        self.bold = bold
+        self.italic = italic
+        self.underline = underline
+
+    def __eq__(self, other):
+        return (isinstance(other, Span) and self.text == other.text and self.bold == other.bold
+                and self.italic == other.italic and self.underline == other.underline)
+
+    def __repr__(self):
+        styles = [name for name in ('bold', 'italic', 'underline') if getattr(self, name)]
+        return f"Span({self.text!r}{', ' if styles else ''}{', '.join(styles)})"
+
+
+class Block:
+    """Bloc de la lettre : un type, des lignes de segments et un alignement éventuel.
+
+    source : texte saisi dont le bloc est issu (avec ses balises), s'il a été
+    analysé ; il identifie le bloc pour le cache des rendus.
+    """
+
+    __slots__ = ('kind', 'lines', 'align', 'source')
+
+    def __init__(self, kind, lines, align=None, source=None):
+        self.kind = kind
+        self.lines = lines
+        self.align = align
+        self.source = source
+
+    def text(self):
+        return "\n".join("".join(span.text for span in line) for line in self.lines)
+
+    def __repr__(self):
+        return f"Block({self.kind!r}, {self.lines!r})"
+
+
+class Letter:
+    """Suite ordonnée de blocs"""
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+    def find(self, kind):
+        """Premier bloc du type demandé (ou None)"""
+        return next((block for block in self.blocks if block.kind == kind), None)
+
+
+def parse_line(text):
+    """Segments d'une ligne selon ses balises (markup) et son alignement éventuel"""
+    if "<" not in text:
+        return [Span(text)], None
+    spans, align = [], None
+    for line in markup.paragraphs(markup.parse(text)):
+        spans.extend(Span(*run) for run in line.runs)
+        align = align or line.align
+    return spans, align
+
+
+def parse_spans(text):
+    """Découper une ligne en segments stylés selon ses balises (voir markup)"""
+    return parse_line(text)[0]
+
+
+def _lines(values):
+    """Lignes non vides, sans mise en forme"""
+    return [[Span(value)] for value in values if value and value.strip()]
+
+
+def parse_body(content):
+    """Blocs du corps de la lettre : paragraphes séparés par une ligne vide, listes à puces"""
+    blocks = []
+    for chunk in re.split(r"\n[ \t]*\n", content or ""):
+        lines = [line for line in chunk.split("\n") if line.strip()]
+        current = None
+        for line in lines:
+            kind = LIST if LIST_ITEM.match(line) else PARAGRAPH
+            if current is None or current.kind != kind:
+                current = Block(kind, [], source=[])
+                blocks.append(current)
+            spans, align = parse_line(LIST_ITEM.sub("", line) if kind == LIST else line.strip())
+            current.lines.append(spans)
+            current.source.append(line)
+            if align and kind == PARAGRAPH:
+                current.align = current.align or align
+    for block in blocks:
+        block.source = "\n".join(block.source)
+    return blocks
+
+
+def build_letter(data):
+    """Construire la représentation intermédiaire à partir des champs du formulaire"""
+    field = {name: (data.get(name) or "").strip() for name in FIELDS}
+
+    blocks = []
+    if field['header']:
+        blocks.append(Block(HEADER, _lines([field['header']])))
+
+    sender = _lines([
+        field['full_name'],
+        field['address'],
+        f"{field['postal_code']} {field['city']}".strip(),
+        f"Tél : {field['phone']}" if field['phone'] else "",
+        f"Email : {field['email']}" if field['email'] else "",
+    ])
+    if sender:
+        blocks.append(Block(SENDER, sender))
+
+    recipient = _lines([
+        field['company'],
+        field['company_address'],
+        f"{field['company_postal_code']} {field['company_city']}".strip(),
+    ])
+    if recipient:
+        blocks.append(Block(RECIPIENT, recipient))
+
+    if field['city'] and field['date']:
+        blocks.append(Block(DATE, _lines([f"{field['city']}, le {field['date']}"]), align='right'))
+
+    if field['subject']:
+        blocks.append(Block(
+            SUBJECT, [[Span("Objet : ", bold=True)] + parse_spans(field['subject'])], source=field['subject']
+        ))
+
+    body = parse_body(data.get('content'))
+    greeting = data.get('greeting', DEFAULT_GREETING)
+    if greeting and not (body and GREETING_PATTERN.match(body[0].text())):
+        blocks.append(Block(GREETING, _lines([greeting])))
+
+    blocks.extend(body)
+
+    closing = data.get('closing', DEFAULT_CLOSING)
+    tail = body[-1].text()[-CLOSING_SEARCH_CHARS:] if body else ""
+    if closing and not CLOSING_PATTERN.search(tail):
+        blocks.append(Block(CLOSING, _lines([closing])))
+
+    signature = field['signature'] or field['full_name']
+    if signature:
+        blocks.append(Block(SIGNATURE, _lines([signature]), align='right'))
+
+    if field['footer']:
+        blocks.append(Block(FOOTER, _lines([field['footer']])))
+
+    return Letter(blocks)
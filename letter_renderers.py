@@ -0,0 +1,394 @@
+"""Rendus de la représentation intermédiaire d'une lettre (letter_ir).
+
+Chaque rendu est une fonction de la lettre et de ses réglages, sans état :
+la même lettre peut être rendue en HTML, en DOCX et en texte, dans n'importe
+quel ordre ou en parallèle.
+"""
+import io
+import re
+import html
+
+from docx import Document
+from docx.shared import Mm, Pt, RGBColor
+from docx.enum.style import WD_STYLE_TYPE
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+from letter_ir import (
+    HEADER, SENDER, RECIPIENT, DATE, SUBJECT, GREETING, PARAGRAPH, LIST, CLOSING, SIGNATURE, FOOTER
+)
+
+# À incrémenter à chaque changement du rendu (letter_ir, letter_renderers, docx_writer) :
+# les fichiers exportés déjà en cache (artifact_cache) ne sont alors plus servis
+RENDER_VERSION = 3
+
+ALIGNMENTS = {
+    'left': WD_ALIGN_PARAGRAPH.LEFT,
+    'center': WD_ALIGN_PARAGRAPH.CENTER,
+    'right': WD_ALIGN_PARAGRAPH.RIGHT,
+    'justify': WD_ALIGN_PARAGRAPH.JUSTIFY,
+}
+
+# Blocs suivis d'une ligne vide dans les documents Word
+SPACED_BLOCKS = {SENDER, RECIPIENT, DATE, SUBJECT, GREETING}
+
+# Styles du StyleManager utilisés pour chaque bloc : (nom, type)
+HTML_STYLES = {
+    HEADER: ("header-footer", "paragraph"),
+    SENDER: ("address", "paragraph"),
+    RECIPIENT: ("address", "paragraph"),
+    DATE: ("date", "paragraph"),
+    SUBJECT: ("body", "paragraph"),
+    GREETING: ("greeting", "paragraph"),
+    PARAGRAPH: ("body", "paragraph"),
+    LIST: ("bullet", "text"),
+    CLOSING: ("closing", "paragraph"),
+    SIGNATURE: ("signature", "text"),
+    FOOTER: ("header-footer", "paragraph"),
+}
+
+# Classes de l'aperçu : sélecteurs .text-* et .paragraph-* de StyleManager.create_css
+HTML_CLASSES = {kind: f"{style_type}-{name}" for kind, (name, style_type) in HTML_STYLES.items()}
+HTML_CLASSES[SUBJECT] += " text-bold"
+
+# Styles nommés des documents Word : style de paragraphe de chaque bloc
+DOCX_STYLES = {
+    HEADER: "LetterHeader",
+    SENDER: "LetterAddress",
+    RECIPIENT: "LetterAddress",
+    DATE: "LetterDate",
+    SUBJECT: "LetterSubject",
+    GREETING: "LetterGreeting",
+    PARAGRAPH: "LetterBody",
+    LIST: "LetterList",
+    CLOSING: "LetterClosing",
+    SIGNATURE: "LetterSignature",
+    FOOTER: "LetterFooter",
+}
+# Styles de caractère des segments
+STRONG, EMPHASIS, UNDERLINE = "LetterStrong", "LetterEmphasis", "LetterUnderline"
+# Style du StyleManager (paragraph_styles) dont chaque style Word reprend l'alignement,
+# le retrait de première ligne et la taille de police
+DOCX_STYLE_SOURCES = {
+    "LetterHeader": "header-footer",
+    "LetterAddress": "address",
+    "LetterDate": "date",
+    "LetterSubject": "body",
+    "LetterGreeting": "greeting",
+    "LetterBody": "body",
+    "LetterList": "list-item",
+    "LetterClosing": "closing",
+    "LetterFooter": "header-footer",
+}
+CSS_LENGTH = re.compile(r"^\s*(-?[\d.]+)\s*(mm|cm|pt|px)?\s*$")
+MM_PER_UNIT = {"mm": 1, "cm": 10, "pt": 25.4 / 72, "px": 25.4 / 96}
+
+
+class DocxLayout:
+    """Mise en page d'un document Word (dimensions en mm, tailles en points).
+
+    paragraph_styles (facultatif) : styles de paragraphe CSS du StyleManager,
+    repris dans les styles nommés du document (voir DOCX_STYLE_SOURCES).
+    """
+
+    def __init__(self, font="Times New Roman", font_size=11.5, line_spacing=1.15,
+                 margins=None, page_size=None, first_line_indent=10, list_indent=10,
+                 space_after=0, justify=False, paragraph_styles=None):
+        self.font = font
+        self.font_size = font_size
+        self.line_spacing = line_spacing
+        self.margins = margins or {"top": 25, "bottom": 25, "left": 20, "right": 20}
+        self.page_size = page_size
+        self.first_line_indent = first_line_indent
+        self.list_indent = list_indent
+        self.space_after = space_after
+        self.justify = justify
+        self.paragraph_styles = paragraph_styles or {}
+
+    def key(self):
+        """Réglages sous forme hachable (cache des documents modèles)"""
+        return (
+            self.font, self.font_size, self.line_spacing,
+            tuple(sorted(self.margins.items())),
+            tuple(sorted(self.page_size.items())) if self.page_size else None,
+            self.first_line_indent, self.list_indent, self.space_after, self.justify,
+            tuple((name, tuple(sorted(css.items()))) for name, css in sorted(self.paragraph_styles.items())),
+        )
+
+
+def _css_mm(value):
+    match = CSS_LENGTH.match(str(value))
+    if not match:
+        return None
+    return float(match.group(1)) * MM_PER_UNIT[match.group(2) or "px"] if float(match.group(1)) else 0
+
+
+def docx_styles(layout):
+    """Propriétés des styles de paragraphe nommés : {nom: {align, first_line_indent, font_size, color, bold}}.
+
+    Les valeurs par défaut viennent de la mise en page ; les styles CSS
+    éventuels (layout.paragraph_styles) les remplacent.
+    """
+    styles = {name: {} for name in dict.fromkeys(DOCX_STYLES.values())}
+    styles["LetterBody"] = {"first_line_indent": layout.first_line_indent}
+    if layout.justify:
+        styles["LetterBody"]["align"] = "justify"
+    styles["LetterDate"]["align"] = styles["LetterSignature"]["align"] = "right"
+    # Objet en gras, comme dans l'aperçu (classe text-bold)
+    styles["LetterSubject"]["bold"] = True
+    for name in ("LetterHeader", "LetterFooter"):
+        styles[name] = {"align": "center", "font_size": 9, "color": "666666"}
+
+    for name, source in DOCX_STYLE_SOURCES.items():
+        css = layout.paragraph_styles.get(source)
+        if not css:
+            continue
+        if css.get("text-align") in ALIGNMENTS:
+            styles[name]["align"] = css["text-align"]
+        # Le retrait des puces est celui de la numérotation
+        if name != "LetterList" and _css_mm(css.get("text-indent", "")) is not None:
+            styles[name]["first_line_indent"] = _css_mm(css["text-indent"])
+        if str(css.get("font-size", "")).endswith("pt"):
+            styles[name]["font_size"] = float(css["font-size"][:-2])
+    return styles
+
+
+# Texte
+
+def render_text(letter):
+    """Texte brut : blocs séparés par une ligne vide, listes à puces préfixées par "- " """
+    parts = []
+    for block in letter:
+        lines = ["".join(span.text for span in line) for line in block.lines]
+        if block.kind == LIST:
+            lines = [f"- {line}" for line in lines]
+        parts.append("\n".join(lines))
+    return "\n\n".join(parts) + "\n"
+
+
+# HTML
+
+def _escape(text):
+    return html.escape(text, quote=False) if "&" in text or "<" in text or ">" in text else text
+
+
+def _html_spans(line):
+    parts = []
+    for span in line:
+        text = _escape(span.text)
+        if span.underline:
+            text = f"<u>{text}</u>"
+        if span.italic:
+            text = f"<em>{text}</em>"
+        if span.bold:
+            text = f"<strong>{text}</strong>"
+        parts.append(text)
+    return "".join(parts)
+
+
+def _html_content(block):
+    """Contenu HTML d'un bloc (texte échappé), sans son conteneur"""
+    if block.kind in (HEADER, FOOTER):
+        return f"<div>{'<br>'.join(_html_spans(line) for line in block.lines)}</div>"
+    if block.kind == LIST:
+        return "<ul>" + "\n".join(f"<li>{_html_spans(line)}</li>" for line in block.lines) + "</ul>"
+    if block.kind in (SENDER, RECIPIENT):
+        return "\n".join(f"<p>{_html_spans(line)}</p>" for line in block.lines)
+    return f"<p>{'<br>'.join(_html_spans(line) for line in block.lines)}</p>"
+
+
+def render_html(letter, style_manager):
+    """Fragment HTML de la lettre, styles en ligne fournis par style_manager (sans feuille de style)"""
+    sections = []
+    for block in letter:
+        name, style_type = HTML_STYLES[block.kind]
+        styles = style_manager.get_style(name, style_type)
+        if block.kind == SUBJECT:
+            styles = {**style_manager.get_style("bold", "text"), **styles}
+        sections.append(style_manager.apply_styles(_html_content(block), styles))
+
+    return style_manager.apply_styles("\n".join(sections), style_manager.default_styles)
+
+
+MAX_FRAGMENTS = 1024
+
+
+class HtmlRenderer:
+    """Rendu HTML à classes, mis en forme par la feuille de style (StyleManager.create_css).
+
+    Chaque bloc devient un div portant la classe de son style (.paragraph-body,
+    .text-signature...) au lieu de ses propriétés en ligne. Les fragments sont
+    mis en cache par bloc : pendant la saisie, seuls les blocs modifiés sont
+    rendus à nouveau.
+    """
+
+    def __init__(self, max_fragments=MAX_FRAGMENTS):
+        self.max_fragments = max_fragments
+        self._fragments = {}
+
+    def render(self, letter):
+        """Fragment HTML de la lettre, à placer dans un conteneur .letter-content"""
+        return "\n".join([self.render_block(block) for block in letter])
+
+    def render_block(self, block):
+        """Fragment HTML d'un bloc, rendu une seule fois pour un même contenu"""
+        key = (block.kind, block.align, block.source if block.source is not None else _block_key(block))
+        fragment = self._fragments.get(key)
+        if fragment is None:
+            # Alignement imposé par les balises du texte, seul style encore en ligne
+            style = f' style="text-align: {block.align}"' if block.align and block.kind in (PARAGRAPH, LIST) else ""
+            fragment = f'<div class="{HTML_CLASSES[block.kind]}"{style}>{_html_content(block)}</div>'
+            if len(self._fragments) >= self.max_fragments:
+                self._fragments.clear()
+            self._fragments[key] = fragment
+        return fragment
+
+
+def _block_key(block):
+    """Clé d'un bloc construit sans texte source : ses segments et leurs styles"""
+    return tuple(
+        tuple((span.text, span.bold, span.italic, span.underline) for span in line)
+        for line in block.lines
+    )
+
+
+_html_renderer = HtmlRenderer()
+
+
+def render_html_document(letter, style_manager):
+    """Page HTML autonome (feuille de style incluse), pour l'export"""
+    return (
+        '<!DOCTYPE html>\n<html lang="fr">\n<head>\n<meta charset="utf-8">\n'
+        '<title>Lettre de motivation</title>\n'
+        f'<style>\n{style_manager.create_css()}\n</style>\n</head>\n'
+        f'<body>\n<div class="letter-content">\n{_html_renderer.render(letter)}\n</div>\n</body>\n</html>\n'
+    )
+
+
+# DOCX
+
+# Documents modèles (marges et styles nommés déjà définis), par mise en page
+_templates = {}
+MAX_TEMPLATES = 16
+
+
+def _define_styles(doc, layout):
+    """Définir une fois les styles nommés du document (police, taille, interligne dans Normal)"""
+    normal = doc.styles['Normal']
+    normal.font.name = layout.font
+    normal.font.size = Pt(layout.font_size)
+    fmt = normal.paragraph_format
+    fmt.space_before = Pt(0)
+    fmt.space_after = Pt(layout.space_after)
+    fmt.line_spacing = layout.line_spacing
+
+    for name, properties in docx_styles(layout).items():
+        style = doc.styles.add_style(name, WD_STYLE_TYPE.PARAGRAPH)
+        style.base_style = doc.styles['List Bullet' if name == "LetterList" else 'Normal']
+        style.quick_style = True
+        if name == "LetterList":
+            style.paragraph_format.left_indent = Mm(layout.list_indent)
+        if properties.get("align"):
+            style.paragraph_format.alignment = ALIGNMENTS[properties["align"]]
+        if properties.get("first_line_indent") is not None:
+            style.paragraph_format.first_line_indent = Mm(properties["first_line_indent"])
+        if properties.get("font_size"):
+            style.font.size = Pt(properties["font_size"])
+        if properties.get("bold"):
+            style.font.bold = True
+        if properties.get("color"):
+            style.font.color.rgb = RGBColor.from_string(properties["color"])
+
+    for name, attribute in ((STRONG, "bold"), (EMPHASIS, "italic"), (UNDERLINE, "underline")):
+        style = doc.styles.add_style(name, WD_STYLE_TYPE.CHARACTER)
+        style.quick_style = True
+        setattr(style.font, attribute, True)
+
+
+def _template(layout):
+    """Octets du document modèle de la mise en page, construit une seule fois"""
+    key = layout.key()
+    template = _templates.get(key)
+    if template is None:
+        doc = Document()
+        for section in doc.sections:
+            if layout.page_size:
+                section.page_width = Mm(layout.page_size["width"])
+                section.page_height = Mm(layout.page_size["height"])
+            section.top_margin = Mm(layout.margins["top"])
+            section.bottom_margin = Mm(layout.margins["bottom"])
+            section.left_margin = Mm(layout.margins["left"])
+            section.right_margin = Mm(layout.margins["right"])
+        _define_styles(doc, layout)
+        buffer = io.BytesIO()
+        doc.save(buffer)
+        template = buffer.getvalue()
+        if len(_templates) >= MAX_TEMPLATES:
+            _templates.clear()
+        _templates[key] = template
+    return template
+
+
+# Les styles sont référencés par identifiant (= nom) directement dans le XML :
+# la recherche par nom de python-docx parcourt tous les styles du document.
+
+def _add_runs(paragraph, line):
+    """Segments d'une ligne : un style de caractère, les autres styles en direct s'ils se cumulent"""
+    for span in line:
+        if not (span.bold or span.italic or span.underline):
+            paragraph.add_run(span.text)
+            continue
+        active = [(name, attribute) for enabled, name, attribute in (
+            (span.bold, STRONG, "bold"), (span.italic, EMPHASIS, "italic"), (span.underline, UNDERLINE, "underline")
+        ) if enabled]
+        run = paragraph.add_run(span.text)
+        run._r.style = active[0][0]
+        for _, attribute in active[1:]:
+            setattr(run, attribute, True)
+
+
+def _add_lines(paragraph, lines):
+    for i, line in enumerate(lines):
+        if i:
+            paragraph.add_run().add_break()
+        _add_runs(paragraph, line)
+
+
+def _add_paragraph(doc, block, lines, styles):
+    name = DOCX_STYLES[block.kind]
+    paragraph = doc.add_paragraph()
+    paragraph._p.style = name
+    _add_lines(paragraph, lines)
+    # Alignement direct seulement s'il diffère de celui du style
+    if block.align and block.align != styles[name].get("align"):
+        paragraph.alignment = ALIGNMENTS[block.align]
+    return paragraph
+
+
+def _set_header_footer(part, block):
+    paragraph = part.paragraphs[0]
+    paragraph._p.style = DOCX_STYLES[block.kind]
+    _add_lines(paragraph, block.lines)
+
+
+def render_docx(letter, layout=None):
+    """Document Word (python-docx) de la lettre, mis en forme par styles nommés"""
+    layout = layout or DocxLayout()
+    doc = Document(io.BytesIO(_template(layout)))
+    styles = docx_styles(layout)
+
+    for block in letter:
+        if block.kind == HEADER:
+            _set_header_footer(doc.sections[0].header, block)
+        elif block.kind == FOOTER:
+            _set_header_footer(doc.sections[0].footer, block)
+        elif block.kind in (LIST, SENDER, RECIPIENT):
+            # Une puce ou une ligne d'adresse par paragraphe
+            for line in block.lines:
+                _add_paragraph(doc, block, [line], styles)
+        else:
+            _add_paragraph(doc, block, block.lines, styles)
+
+        if block.kind in SPACED_BLOCKS:
+            doc.add_paragraph()
+
+    return doc
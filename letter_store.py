@@ -0,0 +1,141 @@
+"""Stockage adressé par contenu des lettres de l'historique.
+
+En publipostage, les lettres ne diffèrent souvent que par l'entreprise et le
+poste. Chaque lettre est réduite à un gabarit où ces valeurs sont remplacées
+par des marqueurs ; le gabarit est rangé une seule fois, sous son empreinte
+SHA-256, et la lettre ne garde que l'empreinte et ses champs. Un gabarit
+nouveau mais proche d'un gabarit existant est rangé comme une différence
+(delta) mot à mot par rapport à celui-ci. La lettre est reconstituée à la
+lecture, et chaque écriture est vérifiée par une reconstitution.
+"""
+import re
+import json
+import hashlib
+import threading
+from difflib import SequenceMatcher
+
+from near_duplicates import NearDuplicateIndex
+
+FIELDS = ('position', 'company')
+MARKER = "{{%s}}"
+WORD_PATTERN = re.compile(r"\s+|\S+")
+# En dessous, un gabarit est rangé tel quel (un delta ne ferait rien gagner)
+MIN_DELTA_CHARS = 200
+# Un delta n'est gardé que s'il fait moins de la moitié du gabarit
+MAX_DELTA_RATIO = 0.5
+
+
+def body_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+
+
+def _words(text):
+    return WORD_PATTERN.findall(text)
+
+
+def make_delta(base, text):
+    """Opérations [début, fin, remplacement] transformant les mots de base en text"""
+    matcher = SequenceMatcher(None, _words(base), _words(text), autojunk=False)
+    target = matcher.b
+    return [[i1, i2, "".join(target[j1:j2])]
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+
+def apply_delta(base, delta):
+    words = _words(base)
+    parts = []
+    position = 0
+    for start, end, replacement in delta:
+        parts.append("".join(words[position:start]))
+        parts.append(replacement)
+        position = end
+    parts.append("".join(words[position:]))
+    return "".join(parts)
+
+
+class LetterStore:
+    """Corps de lettres rangés une fois par empreinte, en entier ou en delta"""
+
+    def __init__(self):
+        # empreinte -> texte du gabarit, ou {'base': empreinte, 'delta': [...]}
+        self.bodies = {}
+        self._bases = NearDuplicateIndex(threshold=0.5)
+        self._lock = threading.RLock()
+
+    def to_template(self, content, fields):
+        """Remplacer les champs par des marqueurs ; None si l'opération n'est pas réversible"""
+        template = content
+        for name in FIELDS:
+            value = fields.get(name)
+            if value:
+                template = template.replace(value, MARKER % name)
+        if self.fill(template, fields) != content:
+            return None
+        return template
+
+    @staticmethod
+    def fill(template, fields):
+        for name in reversed(FIELDS):
+            value = fields.get(name)
+            if value:
+                template = template.replace(MARKER % name, value)
+        return template
+
+    def text(self, key):
+        """Texte du gabarit `key`"""
+        entry = self.bodies[key]
+        if isinstance(entry, str):
+            return entry
+        return apply_delta(self.bodies[entry['base']], entry['delta'])
+
+    def put(self, content, fields):
+        """Ranger une lettre ; renvoie (empreinte, vrai si le corps est un gabarit)"""
+        template = self.to_template(content, fields) if "{{" not in content else None
+        text = content if template is None else template
+        key = body_hash(text)
+        with self._lock:
+            if key not in self.bodies:
+                self.bodies[key] = self._encode(key, text)
+        return key, template is not None
+
+    def _encode(self, key, text):
+        if len(text) >= MIN_DELTA_CHARS:
+            for base, _ in self._bases.query(text):
+                delta = make_delta(self.bodies[base], text)
+                if len(json.dumps(delta, ensure_ascii=False)) < MAX_DELTA_RATIO * len(text) \
+                        and apply_delta(self.bodies[base], delta) == text:
+                    return {'base': base, 'delta': delta}
+                break
+            # Seuls les corps rangés en entier servent de base : pas de chaînes de deltas
+            self._bases.add(key, text)
+        return text
+
+    def get(self, key, fields, templated=True):
+        """Reconstituer une lettre"""
+        text = self.text(key)
+        return self.fill(text, fields) if templated else text
+
+    def load(self, bodies):
+        with self._lock:
+            self.bodies.update(bodies)
+            for key, entry in bodies.items():
+                if isinstance(entry, str) and len(entry) >= MIN_DELTA_CHARS:
+                    self._bases.add(key, entry)
+
+    def entries(self, keys):
+        """Corps nécessaires pour relire les lettres `keys` (bases des deltas comprises)"""
+        needed = {}
+        for key in keys:
+            entry = self.bodies[key]
+            needed[key] = entry
+            if not isinstance(entry, str):
+                needed[entry['base']] = self.bodies[entry['base']]
+        return needed
+
+    @staticmethod
+    def stored_size(entries):
+        """Taille en octets des corps rangés"""
+        return sum(
+            len((entry if isinstance(entry, str) else json.dumps(entry, ensure_ascii=False)).encode('utf-8'))
+            for entry in entries.values()
+        )
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""Test de charge des routes /generate, /export et /preview.
+
+Exemples :
+    # Contre un serveur lancé (gunicorn, flask run...)
+    python load_test.py --url http://localhost:10000 --concurrency 8 --requests 200
+
+    # Sans serveur ni modèle : application chargée dans le processus avec le moteur "stub"
+    python load_test.py --in-process --concurrency 4 --requests 100 --output resultats.json
+
+Le rapport JSON contient, pour chaque route, les latences p50/p95/p99 (ms),
+le débit (requêtes/s) et le nombre d'erreurs.
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import threading
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+SAMPLE_LETTER = {
+    'full_name': 'Camille Martin',
+    'address': '12 rue des Lilas',
+    'postal_code': '75011',
+    'city': 'Paris',
+    'phone': '0612345678',
+    'email': 'camille.martin@example.com',
+    'company': 'Acme',
+    'company_address': '1 avenue de la République',
+    'company_postal_code': '69002',
+    'company_city': 'Lyon',
+    'subject': 'Candidature au poste de développeur Python',
+    'date': '17/01/2024',
+    'content': (
+        "Je souhaite vous proposer ma candidature au poste de développeur Python.\n\n"
+        "Mon expérience en développement web m'a permis d'acquérir une solide expertise.\n\n"
+        "Je reste à votre disposition pour un entretien."
+    ),
+}
+
+PAYLOADS = {
+    'generate': {
+        'company': 'Acme',
+        'position': 'développeur Python',
+        'duration': '6 mois',
+        'start_date': '01/03/2024',
+        'custom_paragraph': "J'ai trois ans d'expérience en développement Python.",
+        'template': '',
+    },
+    'export': dict(SAMPLE_LETTER, format='docx'),
+    'preview': SAMPLE_LETTER,
+}
+
+
+def percentile(values, pct):
+    """Percentile par rang le plus proche (values doit être trié)"""
+    if not values:
+        return None
+    rank = max(0, min(len(values) - 1, math.ceil(pct / 100.0 * len(values)) - 1))
+    return values[rank]
+
+
+class HttpClient:
+    """Envoie les requêtes à un serveur HTTP"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def post(self, endpoint, payload):
+        body = json.dumps(payload).encode('utf-8')
+        req = urllib.request.Request(
+            f"{self.base_url}/{endpoint}",
+            data=body,
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+class InProcessClient:
+    """Envoie les requêtes à l'application Flask chargée dans le processus"""
+
+    def __init__(self):
+        os.environ.setdefault('MODEL_BACKEND', 'stub')
+        from web_app import app
+        self.app = app
+        self.local = threading.local()
+
+    def post(self, endpoint, payload):
+        # Un client de test par thread
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.post(f"/{endpoint}", json=payload)
+        response.get_data()
+        return response.status_code
+
+
+def run_endpoint(client, endpoint, payload, total, concurrency):
+    """Envoyer `total` requêtes sur une route avec `concurrency` clients simultanés"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def one_request(_):
+        start = time.perf_counter()
+        try:
+            status = client.post(endpoint, payload)
+            error = None if status < 400 else f"HTTP {status}"
+        except Exception as e:
+            error = str(e)
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies.append(elapsed)
+            if error:
+                errors.append(error)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one_request, range(total)))
+    wall_time = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': total,
+        'concurrency': concurrency,
+        'errors': len(errors),
+        'error_samples': sorted(set(errors))[:5],
+        'duration_s': round(wall_time, 3),
+        'throughput_rps': round(total / wall_time, 2) if wall_time else None,
+        'latency_ms': {
+            'min': round(latencies[0], 2),
+            'p50': round(percentile(latencies, 50), 2),
+            'p95': round(percentile(latencies, 95), 2),
+            'p99': round(percentile(latencies, 99), 2),
+            'max': round(latencies[-1], 2),
+            'mean': round(sum(latencies) / len(latencies), 2),
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Test de charge de l'API de génération de lettres")
+    parser.add_argument('--url', default='http://localhost:10000', help="URL du serveur")
+    parser.add_argument('--in-process', action='store_true',
+                        help="Charger l'application dans le processus au lieu d'utiliser HTTP")
+    parser.add_argument('--endpoints', default='generate,export,preview',
+                        help="Routes à tester, séparées par des virgules")
+    parser.add_argument('--concurrency', type=int, default=4, help="Nombre de clients simultanés")
+    parser.add_argument('--requests', type=int, default=50, help="Nombre de requêtes par route")
+    parser.add_argument('--export-format', default='docx', choices=['docx', 'pdf'])
+    parser.add_argument('--timeout', type=float, default=130, help="Délai maximal par requête (s)")
+    parser.add_argument('--output', help="Fichier JSON de sortie (sinon sortie standard)")
+    args = parser.parse_args(argv)
+
+    client = InProcessClient() if args.in_process else HttpClient(args.url, args.timeout)
+    payloads = dict(PAYLOADS)
+    payloads['export'] = dict(PAYLOADS['export'], format=args.export_format)
+
+    report = {
+        'target': 'in-process' if args.in_process else args.url,
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'endpoints': {},
+    }
+    for endpoint in [e.strip() for e in args.endpoints.split(',') if e.strip()]:
+        if endpoint not in payloads:
+            parser.error(f"Route inconnue : {endpoint}")
+        report['endpoints'][endpoint] = run_endpoint(
+            client, endpoint, payloads[endpoint], args.requests, args.concurrency
+        )
+
+    output = json.dumps(report, ensure_ascii=False, indent=4)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,287 @@
+"""Analyse en une passe de la mise en forme des lettres.
+
+Le contenu peut contenir les balises de l'éditeur (<bold>, <italic>,
+<underline>, <align="...">, <spacing="...">) et leurs équivalents HTML
+(<strong>/<b>, <em>/<i>, <u>, <div style="...">). Un seul motif parcourt le
+texte de gauche à droite et produit un arbre d'éléments, en temps linéaire :
+- les balises imbriquées ou entrecroisées sont acceptées : une balise fermante
+  ferme aussi les éléments ouverts après la balise correspondante, et les
+  styles en ligne ainsi fermés sont rouverts (<b>a <i>b</b> c</i> : c en italique) ;
+- une balise fermante sans ouvrante reste dans le texte ;
+- les formes courtes <b>, <i> et <u> ne comptent que si une fermante du même
+  style les suit ("5 <u> 6" reste du texte) ;
+- les autres éléments non fermés s'arrêtent à la fin du texte.
+
+L'arbre alimente le rendu HTML (render_html) et le découpage en paragraphes
+de segments stylés (paragraphs), utilisé par letter_ir et les documents Word.
+Le texte hors balises est conservé tel quel (y compris les autres balises HTML).
+"""
+import re
+
+BOLD = "bold"
+ITALIC = "italic"
+UNDERLINE = "underline"
+ALIGN = "align"
+SPACING = "spacing"
+DIV = "div"
+
+# Nom de balise -> type d'élément
+INLINE_TAGS = {
+    'bold': BOLD, 'strong': BOLD, 'b': BOLD,
+    'italic': ITALIC, 'em': ITALIC, 'i': ITALIC,
+    'underline': UNDERLINE, 'u': UNDERLINE,
+}
+INLINE_KINDS = (BOLD, ITALIC, UNDERLINE)
+# Formes courtes, fréquentes dans du texte ordinaire : appliquées seulement si elles sont fermées
+SHORT_TAGS = {'b', 'i', 'u'}
+TAG_KINDS = {**INLINE_TAGS, 'align': ALIGN, 'spacing': SPACING, 'div': DIV}
+INLINE_NAMES = "|".join(sorted(INLINE_TAGS, key=len, reverse=True))
+
+TOKEN = re.compile(
+    r"(?P<tag><(?:"
+    rf"/(?P<end>{INLINE_NAMES}|align|spacing|div)\s*"
+    rf"|(?P<inline>{INLINE_NAMES})\s*"
+    r'|(?P<block>align|spacing)\s*=\s*"(?P<value>[^"<>]*)"\s*'
+    r"|div(?P<attrs>\s[^<>]*)?"
+    r")>)",
+    re.IGNORECASE
+)
+GROUPS = TOKEN.groups + 1
+SHORT_TAG = re.compile(r"<[biu]\s*>", re.IGNORECASE)
+STYLE_ATTRIBUTE = re.compile(r'style\s*=\s*"([^"]*)"', re.IGNORECASE)
+ALIGNMENTS = ('left', 'center', 'right', 'justify')
+
+HTML_OPEN = {BOLD: "<strong>", ITALIC: "<em>", UNDERLINE: "<u>"}
+HTML_CLOSE = {BOLD: "</strong>", ITALIC: "</em>", UNDERLINE: "</u>", ALIGN: "</div>", SPACING: "</div>", DIV: "</div>"}
+
+
+class Element:
+    """Élément de mise en forme : type, valeur (alignement, interligne, attributs du div), enfants"""
+
+    __slots__ = ('kind', 'value', 'children')
+
+    def __init__(self, kind, value=None):
+        self.kind = kind
+        self.value = value
+        self.children = []
+
+    def __repr__(self):
+        return f"Element({self.kind!r}, {self.value!r}, {self.children!r})"
+
+
+class Paragraph:
+    """Ligne du texte : segments (texte, gras, italique, souligné), alignement et interligne"""
+
+    __slots__ = ('runs', 'align', 'line_spacing')
+
+    def __init__(self):
+        self.runs = []
+        self.align = None
+        self.line_spacing = None
+
+    def text(self):
+        return "".join(run[0] for run in self.runs)
+
+
+def _closed_short_tags(pieces):
+    """Positions (dans pieces) des formes courtes suivies d'une fermante du même style.
+
+    Parcours de droite à gauche : chaque ouvrante en ligne consomme une des
+    fermantes de son style rencontrées après elle.
+    """
+    closers = dict.fromkeys(INLINE_KINDS, 0)
+    closed = set()
+    for i in range(len(pieces) - GROUPS, 0, -GROUPS):
+        end, inline = pieces[i + 1], pieces[i + 2]
+        if end is not None:
+            kind = TAG_KINDS.get(end) or TAG_KINDS[end.lower()]
+            if kind in closers:
+                closers[kind] += 1
+        elif inline is not None:
+            kind = INLINE_TAGS.get(inline) or INLINE_TAGS[inline.lower()]
+            if closers[kind]:
+                closers[kind] -= 1
+                closed.add(i)
+    return closed
+
+
+def parse(text):
+    """Arbre des éléments du texte (élément racine de type None)"""
+    root = Element(None)
+    stack = [root]
+    children = root.children
+    # Nombre d'éléments ouverts de chaque type : une fermante sans ouvrante est repérée en O(1)
+    open_counts = dict.fromkeys(set(TAG_KINDS.values()), 0)
+    # Une passe du motif : texte, puis la balise et ses groupes, puis le texte suivant...
+    pieces = TOKEN.split(text)
+    if pieces[0]:
+        children.append(pieces[0])
+    closed_short_tags = _closed_short_tags(pieces) if SHORT_TAG.search(text) else ()
+    for i in range(1, len(pieces), GROUPS):
+        tag, end, inline, block, value, attrs, following = pieces[i:i + GROUPS]
+
+        if end is not None:
+            kind = TAG_KINDS.get(end) or TAG_KINDS[end.lower()]
+            if not open_counts[kind]:
+                # Fermante orpheline : conservée comme texte
+                children.append(tag)
+            else:
+                # Fermer aussi les éléments ouverts après l'élément correspondant ; les
+                # styles en ligne ainsi fermés sont rouverts (au plus un par type)
+                reopened = []
+                while True:
+                    element = stack.pop()
+                    open_counts[element.kind] -= 1
+                    if element.kind == kind:
+                        break
+                    if element.kind in INLINE_KINDS and element.kind not in reopened:
+                        reopened.append(element.kind)
+                for inline_kind in reversed(reopened):
+                    element = Element(inline_kind)
+                    stack[-1].children.append(element)
+                    stack.append(element)
+                    open_counts[inline_kind] += 1
+                children = stack[-1].children
+        elif inline is not None and inline.lower() in SHORT_TAGS and i not in closed_short_tags:
+            children.append(tag)
+        else:
+            if inline is not None:
+                element = Element(INLINE_TAGS.get(inline) or INLINE_TAGS[inline.lower()])
+            elif block is not None:
+                element = Element(TAG_KINDS.get(block) or TAG_KINDS[block.lower()], value.strip())
+            else:
+                element = Element(DIV, attrs or "")
+            children.append(element)
+            stack.append(element)
+            children = element.children
+            open_counts[element.kind] += 1
+
+        if following:
+            children.append(following)
+    return root
+
+
+def walk(root):
+    """Parcours de l'arbre sans récursion : ('open', élément), ('text', texte), ('close', élément)"""
+    stack = [(root, iter(root.children))]
+    while stack:
+        element, children = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            if element is not root:
+                yield 'close', element
+        elif isinstance(child, str):
+            yield 'text', child
+        else:
+            yield 'open', child
+            stack.append((child, iter(child.children)))
+
+
+def div_styles(attributes):
+    """Propriétés CSS de l'attribut style d'un div : {propriété: valeur}"""
+    match = STYLE_ATTRIBUTE.search(attributes or "")
+    styles = {}
+    if match:
+        for declaration in match.group(1).split(";"):
+            name, _, value = declaration.partition(":")
+            if value.strip():
+                styles[name.strip().lower()] = value.strip()
+    return styles
+
+
+def _html_open(element):
+    if element.kind in HTML_OPEN:
+        return HTML_OPEN[element.kind]
+    if element.kind == ALIGN:
+        return f'<div style="text-align: {element.value}">'
+    if element.kind == SPACING:
+        return f'<div style="line-height: {element.value}">'
+    return f"<div{element.value}>"
+
+
+def render_html(root):
+    """HTML de l'arbre : balises de l'éditeur converties, balises fermées dans l'ordre"""
+    parts = []
+    # Parcours sans récursion (les imbrications d'un texte de 1 Mo dépassent la pile d'appels)
+    stack = [(None, iter(root.children))]
+    while stack:
+        for child in stack[-1][1]:
+            if child.__class__ is str:
+                parts.append(child)
+            else:
+                parts.append(_html_open(child))
+                stack.append((child, iter(child.children)))
+                break
+        else:
+            element = stack.pop()[0]
+            if element is not None:
+                parts.append(HTML_CLOSE[element.kind])
+    return "".join(parts)
+
+
+def _line_spacing(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def paragraphs(root):
+    """Lignes du texte (séparées par des retours à la ligne), en segments stylés"""
+    styles = {BOLD: 0, ITALIC: 0, UNDERLINE: 0}
+    aligns = []
+    spacings = []
+    current = Paragraph()
+    result = [current]
+
+    def add(text):
+        if not text:
+            return
+        style = (styles[BOLD] > 0, styles[ITALIC] > 0, styles[UNDERLINE] > 0)
+        runs = current.runs
+        # Segments consécutifs de même style regroupés (textes joints à la fin)
+        if runs and runs[-1][0] == style:
+            runs[-1][1].append(text)
+        else:
+            runs.append((style, [text]))
+        # Alignement et interligne : ceux en vigueur au premier texte de la ligne
+        if current.align is None and aligns:
+            current.align = aligns[-1]
+        if current.line_spacing is None and spacings:
+            current.line_spacing = spacings[-1]
+
+    for event, value in walk(root):
+        if event == 'text':
+            lines = value.split("\n")
+            add(lines[0])
+            for line in lines[1:]:
+                current = Paragraph()
+                result.append(current)
+                add(line)
+            continue
+
+        opening = event == 'open'
+        if value.kind in styles:
+            styles[value.kind] += 1 if opening else -1
+            continue
+        if value.kind == ALIGN:
+            align, spacing = value.value.lower(), None
+        elif value.kind == SPACING:
+            align, spacing = None, _line_spacing(value.value)
+        else:
+            css = div_styles(value.value)
+            align = css.get('text-align', '').lower() or None
+            spacing = _line_spacing(css.get('line-height'))
+        align = align if align in ALIGNMENTS else None
+        # Chaque élément de bloc empile une valeur (éventuellement celle du parent)
+        if opening:
+            aligns.append(align or (aligns[-1] if aligns else None))
+            spacings.append(spacing or (spacings[-1] if spacings else None))
+        else:
+            aligns.pop()
+            spacings.pop()
+
+    for paragraph in result:
+        paragraph.runs = [("".join(texts),) + style for style, texts in paragraph.runs]
+    return result
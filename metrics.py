@@ -0,0 +1,47 @@
+"""Compteurs de l'application exposés par la route /metrics.
+
+Les métriques sont propres à chaque worker gunicorn.
+"""
+import threading
+from collections import defaultdict
+
+
+class MetricsRegistry:
+    """Registre de compteurs et de jauges, utilisable depuis plusieurs threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._gauges = {}
+
+    def increment(self, name, value=1):
+        """Incrémenter un compteur"""
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name, value):
+        """Fixer la valeur d'une jauge"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def get(self, name, default=0):
+        with self._lock:
+            if name in self._gauges:
+                return self._gauges[name]
+            return self._counters.get(name, default)
+
+    def snapshot(self, prefix=None):
+        """Copie de toutes les métriques, éventuellement filtrées par préfixe"""
+        with self._lock:
+            values = {**self._counters, **self._gauges}
+        if prefix:
+            values = {k: v for k, v in values.items() if k.startswith(prefix)}
+        return dict(sorted(values.items()))
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,403 @@
+"""Moteurs de génération de texte utilisés par LetterGenerator.
+
+Le moteur est choisi via la variable d'environnement MODEL_BACKEND :
+- "gpt4all" (par défaut) : modèle local GPT4All
+- "stub" : moteur déterministe sans modèle, pour les benchmarks et tests de charge
+
+Un préfixe de prompt commun (instructions fixes) peut être passé à generate :
+il est évalué une fois, puis le modèle reprend à la position atteinte après ce
+préfixe et n'évalue que la suite du prompt. Les préfixes évalués sont conservés
+par clé (LRU, PREFIX_CACHE_SLOTS) ; un moteur dont le contexte ne contient
+qu'un préfixe (GPT4All) n'en garde qu'un.
+"""
+import os
+import re
+import time
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+
+from metrics import metrics
+
+# Approximation d'un découpage BPE : mots par tranches de 4 caractères, ponctuation isolée
+APPROX_TOKEN_PATTERN = re.compile(r"\w{1,4}|[^\w\s]")
+
+
+class PrefixState:
+    """État du modèle après évaluation d'un préfixe de prompt"""
+
+    def __init__(self, prefix, n_past, eval_time):
+        self.prefix = prefix
+        self.n_past = n_past
+        self.eval_time = eval_time
+
+
+class ModelBackend:
+    """Interface commune des moteurs de génération"""
+
+    name = "base"
+
+    # Nombre de préfixes évalués conservés
+    prefix_slots = int(os.getenv("PREFIX_CACHE_SLOTS", "4"))
+
+    def __init__(self, model_path=None, n_ctx=2048, n_threads=None):
+        self.model_path = model_path
+        self.n_ctx = n_ctx
+        self.n_threads = n_threads
+        self._prefix_states = OrderedDict()
+        self._prefix_lock = threading.Lock()
+
+    def _split_prefix(self, prompt, prefix):
+        """Renvoyer (état du préfixe déjà évalué ou None, suite du prompt).
+
+        La suite vaut None quand le préfixe n'est pas applicable : le prompt
+        complet est alors évalué. Un appel sans préfixe ne supprime pas les
+        préfixes conservés (voir _forget_prefixes).
+        """
+        if not prefix or not prompt.startswith(prefix) or not prompt[len(prefix):].strip():
+            return None, None
+        suffix = prompt[len(prefix):]
+        with self._prefix_lock:
+            state = self._prefix_states.get(prefix)
+            if state is not None:
+                self._prefix_states.move_to_end(prefix)
+        metrics.increment("prefix_cache.hits" if state is not None else "prefix_cache.misses")
+        return state, suffix
+
+    def _remember_prefix(self, state):
+        """Conserver l'état d'un préfixe évalué (le moins récemment utilisé est oublié)"""
+        with self._prefix_lock:
+            self._prefix_states[state.prefix] = state
+            self._prefix_states.move_to_end(state.prefix)
+            while len(self._prefix_states) > self.prefix_slots:
+                self._prefix_states.popitem(last=False)
+                metrics.increment("prefix_cache.evictions")
+        return state
+
+    def _forget_prefixes(self):
+        """Oublier les préfixes évalués (contexte du modèle écrasé)"""
+        with self._prefix_lock:
+            self._prefix_states.clear()
+
+    @property
+    def model_id(self):
+        """Identifiant du modèle, utilisé notamment dans les clés de cache"""
+        return f"{self.name}:{os.path.basename(str(self.model_path))}"
+
+    def load(self):
+        """Charger le modèle en mémoire"""
+        raise NotImplementedError
+
+    def count_tokens(self, text):
+        """Nombre de tokens du texte.
+
+        Approximation par défaut, pour les moteurs qui n'exposent pas leur tokenizer.
+        """
+        return len(APPROX_TOKEN_PATTERN.findall(text))
+
+    def generate(self, prompt, max_tokens=200, temp=0.7, top_k=40, top_p=0.4,
+                 repeat_penalty=1.18, streaming=False, callback=None, prefix=None, seed=None):
+        """Générer une réponse ; mêmes paramètres que GPT4All.generate.
+
+        callback(token_id, token) est appelé pour chaque token et peut
+        renvoyer False pour interrompre la génération. `prefix` est le début
+        fixe du prompt, réutilisé d'une génération à l'autre. `seed` distingue
+        plusieurs variantes d'un même prompt.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Libérer les ressources du modèle"""
+        pass
+
+
+# Versions de gpt4all dont l'API interne (prompt_model, context.n_past) a été vérifiée
+PREFIX_API_VERSIONS = ("2.",)
+
+
+def gpt4all_prefix_support(model):
+    """Le modèle GPT4All chargé expose l'API interne nécessaire à la reprise après un préfixe"""
+    try:
+        from importlib.metadata import version
+        from gpt4all._pyllmodel import LLModelPromptContext
+
+        if not version("gpt4all").startswith(PREFIX_API_VERSIONS):
+            return False
+        fields = {name for name, _ in LLModelPromptContext._fields_}
+        llmodel = model.model
+        return "n_past" in fields and callable(getattr(llmodel, "prompt_model", None)) \
+            and callable(getattr(llmodel, "prompt_model_streaming", None))
+    except Exception:
+        return False
+
+
+class GPT4AllBackend(ModelBackend):
+    """Moteur GPT4All (inférence locale sur CPU).
+
+    La reprise après un préfixe utilise l'API interne de gpt4all (prompt_model
+    et context.n_past) : elle n'est activée que pour les versions vérifiées
+    (PREFIX_API_VERSIONS) et, sinon ou en cas d'erreur, le prompt complet est
+    évalué. Le contexte ne contient que le dernier préfixe évalué, et une
+    génération sans préfixe l'écrase.
+    """
+
+    name = "gpt4all"
+    prefix_slots = 1
+
+    def __init__(self, model_path=None, n_ctx=2048, n_threads=None):
+        super().__init__(model_path, n_ctx, n_threads)
+        self.model = None
+        self.prefix_supported = False
+        # Le contexte du modèle est partagé : une seule génération à la fois
+        self._lock = threading.RLock()
+
+    def load(self):
+        from gpt4all import GPT4All
+
+        self.model = GPT4All(self.model_path, n_ctx=self.n_ctx, n_threads=self.n_threads)
+        self.prefix_supported = gpt4all_prefix_support(self.model)
+        if not self.prefix_supported:
+            print("Réutilisation du préfixe de prompt indisponible avec cette version de gpt4all")
+        return self
+
+    def eval_prefix(self, prefix):
+        """Évaluer le préfixe dans un contexte vide et mémoriser la position atteinte"""
+        llmodel = self.model.model
+        start = time.perf_counter()
+        llmodel.prompt_model(prefix, "%1", lambda token_id, response: True,
+                             n_predict=0, reset_context=True)
+        return self._remember_prefix(PrefixState(prefix, llmodel.context.n_past, time.perf_counter() - start))
+
+    def _generate_after_prefix(self, state, suffix, callback, **kwargs):
+        """Reprendre après le préfixe : seul le suffixe est évalué"""
+        llmodel = self.model.model
+        # Les positions au-delà du préfixe sont écrasées par la nouvelle génération
+        llmodel.context.n_past = state.n_past
+        tokens = []
+
+        def on_token(token_id, response):
+            tokens.append(response)
+            return callback is None or callback(token_id, response) is not False
+
+        llmodel.prompt_model(suffix, "%1", on_token, reset_context=False, **kwargs)
+        return "".join(tokens)
+
+    def _disable_prefix(self, error):
+        """API interne incompatible : évaluer désormais le prompt complet"""
+        print(f"Réutilisation du préfixe de prompt désactivée : {error}")
+        metrics.increment("prefix_cache.fallbacks")
+        self.prefix_supported = False
+        self._forget_prefixes()
+
+    def generate(self, prompt, max_tokens=200, temp=0.7, top_k=40, top_p=0.4,
+                 repeat_penalty=1.18, streaming=False, callback=None, prefix=None, seed=None):
+        # GPT4All n'expose pas la graine de l'échantillonneur : son générateur aléatoire
+        # avance d'une génération à l'autre, les variantes diffèrent donc sans `seed`
+        if streaming:
+            return self._stream(prompt, max_tokens, temp, top_k, top_p, repeat_penalty, callback, prefix)
+
+        with self._lock:
+            state, suffix = self._split_prefix(prompt, prefix) if self.prefix_supported else (None, None)
+            if suffix is not None:
+                try:
+                    if state is None:
+                        state = self.eval_prefix(prefix)
+                    return self._generate_after_prefix(
+                        state, suffix, callback, n_predict=max_tokens, temp=temp,
+                        top_k=top_k, top_p=top_p, repeat_penalty=repeat_penalty, repeat_last_n=64
+                    )
+                except (AttributeError, TypeError) as e:
+                    # Erreurs d'appel de l'API interne, levées avant le premier token
+                    self._disable_prefix(e)
+
+            # Le prompt complet est évalué dans un contexte réinitialisé
+            self._forget_prefixes()
+            kwargs = {}
+            if callback is not None:
+                kwargs['callback'] = callback
+            return self.model.generate(
+                prompt=prompt,
+                max_tokens=max_tokens,
+                temp=temp,
+                top_k=top_k,
+                top_p=top_p,
+                repeat_penalty=repeat_penalty,
+                **kwargs
+            )
+
+    def _stream(self, prompt, max_tokens, temp, top_k, top_p, repeat_penalty, callback, prefix):
+        """Version streaming de generate : le verrou est tenu jusqu'au dernier token"""
+        with self._lock:
+            state, suffix = self._split_prefix(prompt, prefix) if self.prefix_supported else (None, None)
+            if suffix is not None:
+                try:
+                    if state is None:
+                        state = self.eval_prefix(prefix)
+                    llmodel = self.model.model
+                    llmodel.context.n_past = state.n_past
+                except (AttributeError, TypeError) as e:
+                    self._disable_prefix(e)
+                    suffix = None
+            if suffix is None:
+                self._forget_prefixes()
+                kwargs = {'callback': callback} if callback is not None else {}
+                yield from self.model.generate(
+                    prompt=prompt, max_tokens=max_tokens, temp=temp, top_k=top_k,
+                    top_p=top_p, repeat_penalty=repeat_penalty, streaming=True, **kwargs
+                )
+                return
+
+            yield from llmodel.prompt_model_streaming(
+                suffix, "%1", callback or (lambda token_id, response: True),
+                n_predict=max_tokens, temp=temp, top_k=top_k, top_p=top_p,
+                repeat_penalty=repeat_penalty, repeat_last_n=64, reset_context=False
+            )
+
+    def close(self):
+        if self.model is not None:
+            self.model.close()
+            self.model = None
+            self._forget_prefixes()
+
+
+class StubBackend(ModelBackend):
+    """Moteur déterministe qui simule le débit et la latence d'un modèle.
+
+    Le texte produit ne dépend que du prompt et des paramètres
+    d'échantillonnage. La latence du premier token suit une distribution
+    configurable ("fixed", "uniform", "exponential" ou "lognormal"),
+    les tokens suivants sont émis à débit constant. L'évaluation du prompt
+    coûte un temps proportionnel à son nombre de tokens, hors préfixe déjà
+    évalué : le gain mesuré avec ce moteur découle de ce modèle de coût, seul un
+    vrai modèle (MODEL_BACKEND=gpt4all) mesure le gain réel.
+    """
+
+    name = "stub"
+
+    SENTENCES = [
+        "Votre entreprise incarne les valeurs d'exigence et d'innovation qui guident mon parcours.",
+        "Mon expérience m'a permis de développer une grande rigueur et un sens aigu de l'organisation.",
+        "Je souhaite mettre mes compétences au service de vos équipes et de vos projets.",
+        "J'ai eu l'occasion de mener plusieurs projets de bout en bout, de l'analyse du besoin à la livraison.",
+        "Ma capacité d'adaptation me permettra de m'intégrer rapidement au sein de votre structure.",
+        "Je suis convaincu(e) que ce poste correspond parfaitement à mes aspirations professionnelles.",
+        "Le travail en équipe et la communication sont au cœur de ma manière de travailler.",
+        "Je serais ravi(e) de vous exposer plus en détail mes motivations lors d'un entretien.",
+    ]
+    CLOSING = "Je vous prie d'agréer, Madame, Monsieur, l'expression de mes salutations distinguées."
+
+    def __init__(self, model_path=None, n_ctx=2048, n_threads=None,
+                 tokens_per_second=None, latency_ms=None, latency_distribution=None,
+                 seed=None, prompt_tokens_per_second=None):
+        super().__init__(model_path or "stub", n_ctx, n_threads)
+        self.tokens_per_second = float(
+            tokens_per_second if tokens_per_second is not None
+            else os.getenv("STUB_TOKENS_PER_SECOND", "0"))
+        self.latency_ms = float(
+            latency_ms if latency_ms is not None
+            else os.getenv("STUB_LATENCY_MS", "0"))
+        self.latency_distribution = (
+            latency_distribution or os.getenv("STUB_LATENCY_DISTRIBUTION", "fixed"))
+        self.seed = int(seed if seed is not None else os.getenv("STUB_SEED", "0"))
+        self.prompt_tokens_per_second = float(
+            prompt_tokens_per_second if prompt_tokens_per_second is not None
+            else os.getenv("STUB_PROMPT_TOKENS_PER_SECOND", "0"))
+
+    def load(self):
+        return self
+
+    def _rng(self, prompt, *params):
+        """Générateur aléatoire déterminé par le prompt et les paramètres"""
+        key = "|".join([str(self.seed), prompt] + [repr(p) for p in params])
+        digest = hashlib.sha256(key.encode('utf-8')).digest()
+        return random.Random(int.from_bytes(digest[:8], 'big'))
+
+    def _first_token_delay(self, rng):
+        """Tirer la latence du premier token (en secondes)"""
+        mean = self.latency_ms / 1000.0
+        if mean <= 0:
+            return 0.0
+        if self.latency_distribution == "uniform":
+            return rng.uniform(0, 2 * mean)
+        if self.latency_distribution == "exponential":
+            return rng.expovariate(1.0 / mean)
+        if self.latency_distribution == "lognormal":
+            # Médiane égale à la moyenne configurée, queue à droite
+            return rng.lognormvariate(0, 0.5) * mean
+        return mean
+
+    def _compose(self, prompt, rng):
+        """Construire le texte complet de la réponse"""
+        sentences = list(self.SENTENCES)
+        rng.shuffle(sentences)
+        paragraphs = [" ".join(sentences[i:i + 3]) for i in range(0, len(sentences), 3)]
+        paragraphs.append(self.CLOSING)
+        return "\n\n".join(paragraphs)
+
+    def tokenize(self, text):
+        """Découper un texte en tokens (mot précédé de ses espaces)"""
+        return re.findall(r"\s*\S+", text)
+
+    def count_tokens(self, text):
+        return len(self.tokenize(text))
+
+    def _eval_time(self, prompt, prefix):
+        """Durée simulée de l'évaluation du prompt"""
+        rate = self.prompt_tokens_per_second
+        state, suffix = self._split_prefix(prompt, prefix)
+        if suffix is None:
+            return self.count_tokens(prompt) / rate if rate > 0 else 0.0
+        eval_time = self.count_tokens(suffix) / rate if rate > 0 else 0.0
+        if state is None:
+            prefix_time = self.count_tokens(prefix) / rate if rate > 0 else 0.0
+            self._remember_prefix(PrefixState(prefix, self.count_tokens(prefix), prefix_time))
+            eval_time += prefix_time
+        return eval_time
+
+    def _tokens(self, prompt, max_tokens, params, prefix=None):
+        rng = self._rng(prompt, *params)
+        delay = self._eval_time(prompt, prefix) + self._first_token_delay(rng)
+        tokens = self.tokenize(self._compose(prompt, rng))[:max_tokens]
+        interval = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+        if delay:
+            time.sleep(delay)
+        for token_id, token in enumerate(tokens):
+            if interval and token_id:
+                time.sleep(interval)
+            yield token_id, token
+
+    def generate(self, prompt, max_tokens=200, temp=0.7, top_k=40, top_p=0.4,
+                 repeat_penalty=1.18, streaming=False, callback=None, prefix=None, seed=None):
+        params = (temp, top_k, top_p, repeat_penalty) if seed is None else (temp, top_k, top_p, repeat_penalty, seed)
+        tokens = self._tokens(prompt, max_tokens, params, prefix)
+
+        def stream():
+            for token_id, token in tokens:
+                if callback is not None and callback(token_id, token) is False:
+                    break
+                yield token
+
+        if streaming:
+            return stream()
+        return "".join(stream())
+
+
+BACKENDS = {
+    GPT4AllBackend.name: GPT4AllBackend,
+    StubBackend.name: StubBackend,
+}
+
+
+def register_backend(name, backend_class):
+    """Enregistrer un moteur supplémentaire"""
+    BACKENDS[name] = backend_class
+
+
+def create_backend(model_path=None, backend=None, **kwargs):
+    """Instancier et charger le moteur configuré"""
+    backend = backend or os.getenv("MODEL_BACKEND", "gpt4all")
+    if backend not in BACKENDS:
+        raise ValueError(f"Moteur de génération inconnu : '{backend}'")
+    return BACKENDS[backend](model_path, **kwargs).load()
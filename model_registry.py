@@ -0,0 +1,256 @@
+"""Registre des modèles de génération disponibles.
+
+Chaque modèle nommé (chemin, taille de contexte, nombre de threads) est chargé
+à la première utilisation. Quand le budget mémoire total est dépassé, les
+modèles inutilisés depuis le plus longtemps sont déchargés.
+
+Configuration :
+- MODEL_REGISTRY_FILE : fichier JSON {"nom": {"path": ..., "n_ctx": ..., "n_threads": ...}}
+- DEFAULT_MODEL : nom du modèle par défaut ("default" = MODEL_PATH)
+- MODEL_MEMORY_BUDGET_MB : budget mémoire total des modèles chargés
+- MODEL_LOAD_RETRY_SECONDS : délai avant de retenter un chargement qui a échoué
+"""
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from metrics import metrics
+from model_backends import create_backend
+
+
+def resident_memory():
+    """Mémoire résidente du processus en octets (0 si indisponible)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0
+
+
+class ModelSpec:
+    """Description d'un modèle du registre"""
+
+    def __init__(self, name, path, n_ctx=2048, n_threads=None, backend=None, memory_mb=None):
+        self.name = name
+        self.path = path
+        self.n_ctx = n_ctx
+        self.n_threads = n_threads
+        self.backend = backend or os.getenv("MODEL_BACKEND", "gpt4all")
+        self.memory_mb = memory_mb
+
+    @property
+    def model_id(self):
+        """Même identifiant que ModelBackend.model_id, sans charger le modèle"""
+        return f"{self.backend}:{os.path.basename(str(self.path))}"
+
+    def estimated_memory(self):
+        """Estimation de la mémoire nécessaire avant chargement (octets)"""
+        if self.memory_mb is not None:
+            return int(self.memory_mb * 1024 * 1024)
+        try:
+            # Les poids GGUF sont mappés en mémoire : la taille du fichier est une bonne estimation
+            return os.path.getsize(self.path)
+        except (OSError, TypeError):
+            return 0
+
+
+class _LoadedModel:
+    def __init__(self, backend, load_time, resident_bytes):
+        self.backend = backend
+        self.load_time = load_time
+        self.resident_bytes = resident_bytes
+        self.in_use = 0
+        self.last_used = time.time()
+
+
+class ModelRegistry:
+    """Modèles nommés chargés à la demande, avec déchargement LRU sous budget mémoire"""
+
+    def __init__(self, memory_budget_bytes, default=None, retry_after=30.0):
+        self.memory_budget_bytes = memory_budget_bytes
+        self.default = default
+        # Après un échec, les demandes reçoivent l'erreur pendant retry_after secondes, puis le
+        # chargement est retenté (mémoire libérée entre-temps, fichier dont la copie est terminée...)
+        self.retry_after = retry_after
+        self.specs = OrderedDict()
+        self.load_errors = {}
+        self._failed_at = {}
+        self._loaded = OrderedDict()
+        # Chargements en cours : nom -> Event signalé à la fin du chargement
+        self._loading = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_env(cls):
+        """Créer le registre à partir des variables d'environnement"""
+        registry = cls(
+            memory_budget_bytes=int(float(os.getenv("MODEL_MEMORY_BUDGET_MB", "8192")) * 1024 * 1024),
+            default=os.getenv("DEFAULT_MODEL", "default"),
+            retry_after=float(os.getenv("MODEL_LOAD_RETRY_SECONDS", "30")),
+        )
+        registry.register(ModelSpec(
+            "default", os.getenv("MODEL_PATH", "ggml-gpt4all-j-v1.3-groovy.bin")
+        ))
+
+        registry_file = os.getenv("MODEL_REGISTRY_FILE")
+        if registry_file:
+            with open(registry_file, 'r', encoding='utf-8') as f:
+                for name, options in json.load(f).items():
+                    registry.register(ModelSpec(name, **options))
+        return registry
+
+    def register(self, spec):
+        """Ajouter ou remplacer un modèle"""
+        with self._lock:
+            self.specs[spec.name] = spec
+            self.load_errors.pop(spec.name, None)
+            self._failed_at.pop(spec.name, None)
+
+    def resolve(self, name=None):
+        """Renvoyer la description du modèle demandé (ou du modèle par défaut)"""
+        name = name or self.default
+        if name not in self.specs:
+            raise KeyError(f"Modèle inconnu : '{name}'")
+        return self.specs[name]
+
+    def available(self, name=None):
+        """Le modèle existe et son chargement n'a pas échoué récemment"""
+        try:
+            spec = self.resolve(name)
+        except KeyError:
+            return False
+        with self._lock:
+            return self._load_error(spec.name) is None
+
+    def _load_error(self, name):
+        """Erreur du dernier chargement, oubliée une fois le délai retry_after écoulé"""
+        error = self.load_errors.get(name)
+        if error is not None and time.monotonic() - self._failed_at[name] >= self.retry_after:
+            del self.load_errors[name]
+            del self._failed_at[name]
+            return None
+        return error
+
+    def _loaded_bytes(self):
+        return sum(m.resident_bytes for m in self._loaded.values())
+
+    def _reserved_bytes(self):
+        """Mémoire des modèles chargés et estimation de ceux en cours de chargement"""
+        return self._loaded_bytes() + sum(self.specs[name].estimated_memory() for name in self._loading)
+
+    def _evict_for(self, needed):
+        """Décharger les modèles inutilisés les plus anciens jusqu'à libérer `needed` octets"""
+        for name in list(self._loaded):
+            if self._reserved_bytes() + needed <= self.memory_budget_bytes:
+                return
+            if self._loaded[name].in_use:
+                continue
+            self.unload(name)
+            metrics.increment("model_registry.evictions")
+
+    def _load(self, spec):
+        """Charger le modèle hors du verrou du registre (appelé par le seul thread qui le charge)"""
+        rss_before = resident_memory()
+        start = time.perf_counter()
+        try:
+            backend = create_backend(spec.path, spec.backend, n_ctx=spec.n_ctx, n_threads=spec.n_threads)
+        except Exception as e:
+            with self._lock:
+                self.load_errors[spec.name] = str(e) or e.__class__.__name__
+                self._failed_at[spec.name] = time.monotonic()
+                metrics.increment("model_registry.load_errors")
+            raise
+        load_time = time.perf_counter() - start
+        resident_bytes = max(resident_memory() - rss_before, spec.estimated_memory())
+        return _LoadedModel(backend, load_time, resident_bytes)
+
+    def _acquire(self, spec):
+        """Modèle chargé, réservé pour l'appelant (in_use incrémenté).
+
+        Le chargement (plusieurs Go) se fait hors du verrou : les modèles déjà
+        chargés restent utilisables, et les autres demandes du même modèle
+        attendent la fin de ce chargement.
+        """
+        while True:
+            with self._lock:
+                loaded = self._loaded.get(spec.name)
+                if loaded is not None:
+                    self._loaded.move_to_end(spec.name)
+                    loaded.in_use += 1
+                    loaded.last_used = time.time()
+                    return loaded
+                error = self._load_error(spec.name)
+                if error is not None:
+                    raise RuntimeError(error)
+                loading = self._loading.get(spec.name)
+                if loading is None:
+                    self._evict_for(spec.estimated_memory())
+                    if self._reserved_bytes() + spec.estimated_memory() > self.memory_budget_bytes:
+                        metrics.increment("model_registry.over_budget")
+                        print(f"Budget mémoire dépassé pour le modèle '{spec.name}'")
+                    loading = self._loading[spec.name] = threading.Event()
+                    leader = True
+                else:
+                    leader = False
+
+            if not leader:
+                # Un autre thread charge ce modèle : attendre puis réessayer
+                loading.wait()
+                continue
+
+            try:
+                loaded = self._load(spec)
+            finally:
+                with self._lock:
+                    del self._loading[spec.name]
+                    loading.set()
+            with self._lock:
+                self._loaded[spec.name] = loaded
+                loaded.in_use += 1
+                metrics.increment("model_registry.loads")
+                metrics.set_gauge("model_registry.resident_bytes", self._loaded_bytes())
+                return loaded
+
+    @contextmanager
+    def use(self, name=None):
+        """Emprunter un modèle (chargé si besoin) ; il ne peut pas être déchargé pendant l'usage"""
+        loaded = self._acquire(self.resolve(name))
+        try:
+            yield loaded.backend
+        finally:
+            with self._lock:
+                loaded.in_use -= 1
+
+    def unload(self, name):
+        """Décharger un modèle"""
+        with self._lock:
+            loaded = self._loaded.pop(name, None)
+            if loaded is not None:
+                loaded.backend.close()
+                metrics.set_gauge("model_registry.resident_bytes", self._loaded_bytes())
+
+    def stats(self):
+        """Temps de chargement et mémoire résidente de chaque modèle"""
+        with self._lock:
+            models = {}
+            for name, spec in self.specs.items():
+                loaded = self._loaded.get(name)
+                models[name] = {
+                    'path': spec.path,
+                    'n_ctx': spec.n_ctx,
+                    'n_threads': spec.n_threads,
+                    'loaded': loaded is not None,
+                    'load_time_s': round(loaded.load_time, 3) if loaded else None,
+                    'resident_mb': round(loaded.resident_bytes / 1024 / 1024, 1) if loaded else None,
+                    'in_use': loaded.in_use if loaded else 0,
+                    'error': self._load_error(name),
+                }
+            return {
+                'default': self.default,
+                'memory_budget_mb': round(self.memory_budget_bytes / 1024 / 1024, 1),
+                'resident_mb': round(self._loaded_bytes() / 1024 / 1024, 1),
+                'models': models,
+            }
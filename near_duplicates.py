@@ -0,0 +1,257 @@
+"""Détection des quasi-doublons par MinHash et LSH.
+
+Chaque texte est réduit à une signature MinHash de ses séquences de trois mots
+(shingles). La proportion de valeurs égales entre deux signatures estime la
+similarité de Jaccard des textes. Les signatures sont découpées en bandes
+rangées dans des tables de hachage (LSH) : seuls les textes partageant au
+moins une bande sont comparés, ce qui évite de parcourir toute la
+bibliothèque.
+
+Les quasi-doublons sont regroupés en grappes : seul le représentant d'une
+grappe est rangé dans les tables. Cent lettres de publipostage qui ne diffèrent
+que par l'entreprise forment une grappe, et une bande ne contient qu'une entrée
+par grappe au lieu d'une par lettre.
+"""
+import zlib
+import threading
+from itertools import islice
+
+import numpy as np
+
+from paragraph_index import TOKEN_PATTERN, normalize
+
+# Nombre premier de Mersenne 2^31 - 1 : (a * x + b) tient dans 64 bits
+PRIME = (1 << 31) - 1
+SHINGLE_SIZE = 3
+# Éléments vérifiés au plus par bande et par grappe lors d'une requête (les plus récents) :
+# borne le coût d'une requête quand une bande ou une grappe est très grande
+MAX_BUCKET_SIZE = 64
+
+
+def shingles(text):
+    """Séquences de SHINGLE_SIZE mots consécutifs, hachées en entiers 32 bits"""
+    words = TOKEN_PATTERN.findall(normalize(text))
+    if len(words) < SHINGLE_SIZE:
+        words = words + [""] * (SHINGLE_SIZE - len(words))
+    return np.fromiter(
+        {zlib.crc32(" ".join(words[i:i + SHINGLE_SIZE]).encode('utf-8'))
+         for i in range(len(words) - SHINGLE_SIZE + 1)},
+        dtype=np.uint64
+    )
+
+
+def _recent(members, count):
+    """Les `count` membres ajoutés le plus récemment (dictionnaire ordonné)"""
+    return islice(reversed(members), count)
+
+
+class NearDuplicateIndex:
+    """Index LSH de signatures MinHash, par grappes de quasi-doublons.
+
+    Avec 64 permutations en 16 bandes de 4, deux textes de similarité 0,8 sont
+    presque toujours comparés (probabilité > 99,9 %), deux textes de
+    similarité 0,3 dans environ 12 % des cas ; les candidats sont ensuite
+    vérifiés sur la signature complète. Un texte qui ressemble au représentant
+    d'une grappe la rejoint sans être rangé dans les tables. Une requête ne
+    vérifie qu'un échantillon borné (max_bucket_size) des représentants d'une
+    bande et des membres d'une grappe : les grandes grappes restent détectées,
+    pour un coût borné.
+    """
+
+    def __init__(self, threshold=0.8, num_perm=64, bands=16, seed=1, max_bucket_size=MAX_BUCKET_SIZE):
+        if num_perm % bands:
+            raise ValueError("num_perm doit être un multiple de bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_bucket_size = max_bucket_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, PRIME, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, PRIME, size=num_perm).astype(np.uint64)
+        self._signatures = {}
+        self._band_keys_of = {}
+        # Grappes : représentant -> membres (dictionnaire ordonné), élément -> représentant
+        self._clusters = {}
+        self._cluster_of = {}
+        # Tables LSH des représentants : clé de bande -> représentants (dictionnaire ordonné)
+        self._buckets = [{} for _ in range(bands)]
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def __contains__(self, key):
+        return key in self._signatures
+
+    def signature(self, text):
+        """Signature MinHash du texte"""
+        values = shingles(text) % np.uint64(PRIME)
+        hashed = (np.outer(values, self._a) + self._b) % np.uint64(PRIME)
+        return hashed.min(axis=0)
+
+    def _band_keys(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def similarity(self, first, second):
+        """Similarité de Jaccard estimée entre deux signatures"""
+        return float(np.count_nonzero(first == second)) / self.num_perm
+
+    def is_duplicate(self, first, second):
+        """Les deux éléments indexés sont des quasi-doublons l'un de l'autre (signatures complètes)"""
+        with self._lock:
+            return self.similarity(self._signatures[first], self._signatures[second]) >= self.threshold
+
+    def _index_representative(self, representative):
+        for band, band_key in zip(self._buckets, self._band_keys_of[representative]):
+            band.setdefault(band_key, {})[representative] = None
+
+    def _unindex_representative(self, representative):
+        for band, band_key in zip(self._buckets, self._band_keys_of[representative]):
+            members = band.get(band_key)
+            if members is not None:
+                members.pop(representative, None)
+                if not members:
+                    del band[band_key]
+
+    def _candidate_clusters(self, band_keys):
+        """Représentants partageant au moins une bande (échantillon borné par bande)"""
+        found = set()
+        for band, key in zip(self._buckets, band_keys):
+            members = band.get(key)
+            if members:
+                found.update(_recent(members, self.max_bucket_size))
+        return found
+
+    def _matches(self, signature, band_keys, exclude=None):
+        """{représentant: [(élément, similarité)]} des grappes contenant des quasi-doublons"""
+        clusters = self._candidate_clusters(band_keys)
+        if exclude in self._cluster_of:
+            clusters.add(self._cluster_of[exclude])
+        matches = {}
+        for representative in clusters:
+            # Le représentant est vérifié en premier, puis les membres les plus récents
+            members = self._clusters[representative]
+            sample = [representative] + [
+                key for key in _recent(members, self.max_bucket_size) if key != representative
+            ]
+            for key in sample:
+                if key == exclude:
+                    continue
+                score = self.similarity(signature, self._signatures[key])
+                if score >= self.threshold:
+                    matches.setdefault(representative, []).append((key, score))
+        return matches
+
+    def query(self, text=None, signature=None, exclude=None, band_keys=None):
+        """Quasi-doublons d'un texte : [(clé, similarité)] par similarité décroissante"""
+        if signature is None:
+            signature = self.signature(text)
+        if band_keys is None:
+            band_keys = self._band_keys(signature)
+        with self._lock:
+            matches = [match for found in self._matches(signature, band_keys, exclude).values() for match in found]
+        return sorted(matches, key=lambda match: match[1], reverse=True)
+
+    def add(self, key, text):
+        """Indexer (ou réindexer) `key` ; renvoie ses quasi-doublons déjà présents"""
+        signature = self.signature(text)
+        band_keys = self._band_keys(signature)
+        with self._lock:
+            self.remove(key)
+            found = self._matches(signature, band_keys)
+            self._signatures[key] = signature
+            self._band_keys_of[key] = band_keys
+            if found:
+                # Rejoindre la grappe du quasi-doublon le plus proche
+                representative = max(found, key=lambda rep: max(score for _, score in found[rep]))
+                self._clusters[representative][key] = None
+            else:
+                representative = key
+                self._clusters[key] = {key: None}
+                self._index_representative(key)
+            self._cluster_of[key] = representative
+        matches = [match for matched in found.values() for match in matched]
+        return sorted(matches, key=lambda match: match[1], reverse=True)
+
+    def remove(self, key):
+        with self._lock:
+            if self._signatures.pop(key, None) is None:
+                return
+            representative = self._cluster_of.pop(key)
+            members = self._clusters[representative]
+            del members[key]
+            if key == representative:
+                self._unindex_representative(key)
+                del self._clusters[key]
+                if members:
+                    # Le membre le plus ancien devient le représentant de la grappe
+                    successor = next(iter(members))
+                    self._clusters[successor] = members
+                    for member in members:
+                        self._cluster_of[member] = successor
+                    self._index_representative(successor)
+            del self._band_keys_of[key]
+
+    def duplicates_of(self, key):
+        """Quasi-doublons d'un élément indexé"""
+        with self._lock:
+            signature = self._signatures.get(key)
+            if signature is None:
+                return []
+            return self.query(signature=signature, exclude=key, band_keys=self._band_keys_of[key])
+
+    def dedupe(self, keys):
+        """Retirer de `keys` les quasi-doublons d'un élément précédent (ordre conservé)"""
+        kept = []
+        # Éléments conservés de chaque grappe
+        kept_in = {}
+        seen = set()
+        with self._lock:
+            for key in keys:
+                if key in seen:
+                    continue
+                seen.add(key)
+                signature = self._signatures.get(key)
+                if signature is None:
+                    kept.append(key)
+                    continue
+                # Même grappe qu'un élément conservé (comme dans groups), ou quasi-doublon
+                # vérifié d'un élément conservé d'une grappe voisine
+                if self._cluster_of[key] in kept_in:
+                    continue
+                if any(
+                    self.similarity(signature, self._signatures[other]) >= self.threshold
+                    for representative in self._candidate_clusters(self._band_keys_of[key])
+                    for other in kept_in.get(representative, ())
+                ):
+                    continue
+                kept.append(key)
+                kept_in.setdefault(self._cluster_of[key], []).append(key)
+        return kept
+
+    def groups(self):
+        """Groupes de quasi-doublons (au moins deux éléments)"""
+        with self._lock:
+            parent = {}
+
+            def find(key):
+                while parent.get(key, key) != key:
+                    key = parent[key]
+                return key
+
+            # Les grappes dont les représentants se ressemblent sont réunies
+            for representative in self._clusters:
+                signature = self._signatures[representative]
+                for other in self._candidate_clusters(self._band_keys_of[representative]):
+                    if other == representative:
+                        continue
+                    if self.similarity(signature, self._signatures[other]) >= self.threshold:
+                        root, other_root = find(representative), find(other)
+                        if root != other_root:
+                            parent[other_root] = root
+
+            groups = {}
+            for representative, members in self._clusters.items():
+                groups.setdefault(find(representative), []).extend(members)
+        return [members for members in groups.values() if len(members) > 1]
@@ -0,0 +1,230 @@
+"""Recommandation de paragraphes par similarité avec une offre d'emploi.
+
+Chaque paragraphe est représenté par un vecteur creux de n-grammes de mots
+hachés (mots et paires de mots, sans accents ni majuscules) dans un espace de
+2^18 colonnes, où les collisions sont rares. Les vecteurs sont rangés bout à
+bout dans des tableaux NumPy (colonnes, poids, ligne) : la mémoire est
+proportionnelle au nombre de n-grammes des paragraphes, pas au nombre de
+colonnes. La requête est pondérée par l'IDF des n-grammes ; le classement est
+un produit matrice creuse-vecteur (np.bincount) suivi d'une sélection
+partielle des k meilleurs. Un ordre des entrées par colonne, reconstruit
+quand assez d'entrées ont été ajoutées depuis, permet de ne lire que les
+entrées des n-grammes de la requête ; les entrées plus récentes sont parcourues
+directement.
+
+L'index est mis à jour à chaque ajout, modification ou suppression, sans
+reconstruction : les entrées d'un paragraphe modifié ou supprimé sont
+neutralisées, puis les tableaux sont compactés quand elles sont majoritaires.
+"""
+import re
+import zlib
+import threading
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+")
+COMBINING_MARKS = re.compile(r"[\u0300-\u036f]")
+
+# Mots trop fréquents pour distinguer deux paragraphes
+STOP_WORDS = frozenset("""
+    a au aux avec ce ces dans de des du elle en et il je la le les leur lui ma mais me mes mon
+    ne nos notre nous on ou par pas pour qu que qui sa se ses son sur ta te tes ton tu un une
+    vos votre vous y d l j n s c m t
+    an and are as at be by for from has have i in is it its of on or our that the this to was
+    we were will with you your
+""".split())
+
+
+N_FEATURES = 1 << 18
+
+
+def normalize(text):
+    """Minuscules sans accents"""
+    return COMBINING_MARKS.sub("", unicodedata.normalize('NFKD', text.lower()))
+
+
+@lru_cache(maxsize=65536)
+def _feature_hash(feature):
+    """Empreinte d'un n-gramme (stable d'un processus à l'autre)"""
+    return zlib.crc32(feature.encode('utf-8'))
+
+
+class ParagraphIndex:
+    """Index vectoriel creux de paragraphes, interrogeable par texte libre"""
+
+    def __init__(self, n_features=N_FEATURES, capacity=16384):
+        self.n_features = n_features
+        # Entrées non nulles de tous les paragraphes : colonne, poids, ligne
+        self._columns = np.zeros(capacity, dtype=np.int32)
+        self._weights = np.zeros(capacity, dtype=np.float32)
+        self._entry_rows = np.zeros(capacity, dtype=np.int32)
+        self._size = 0
+        self._dead = 0
+        self._df = np.zeros(n_features, dtype=np.float32)
+        # Pondération de la requête par colonne (remise à zéro après chaque recherche)
+        self._query = np.zeros(n_features, dtype=np.float32)
+        # Entrées [0, _sorted_size) triées par colonne : positions et colonnes triées
+        self._sorted = np.zeros(0, dtype=np.int64)
+        self._sorted_columns = np.zeros(0, dtype=np.int32)
+        self._sorted_size = 0
+        self._spans = []      # (début, fin) des entrées de chaque ligne
+        self._keys = []
+        self._rows = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def vectorize(self, text):
+        """Vecteur creux normalisé du texte (tf sous-linéaire, norme L2 = 1) : (colonnes, poids)"""
+        words = [w for w in TOKEN_PATTERN.findall(normalize(text)) if w not in STOP_WORDS]
+        counts = {}
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            counts[feature] = counts.get(feature, 0) + 1
+
+        if not counts:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        hashes = np.fromiter((_feature_hash(feature) for feature in counts), dtype=np.int64, count=len(counts))
+        signs = np.where(hashes & 0x80000000, 1.0, -1.0)
+        weights = signs * (1.0 + np.log(np.fromiter(counts.values(), dtype=np.float64, count=len(counts))))
+        # Les n-grammes d'une même colonne sont additionnés
+        columns, inverse = np.unique(hashes % self.n_features, return_inverse=True)
+        weights = np.bincount(inverse, weights=weights).astype(np.float32)
+        keep = weights != 0
+        columns, weights = columns[keep].astype(np.int32), weights[keep]
+        norm = np.linalg.norm(weights)
+        return columns, (weights / norm if norm else weights)
+
+    def _reserve(self, count):
+        """Agrandir les tableaux d'entrées pour `count` entrées supplémentaires"""
+        needed = self._size + count
+        if needed <= len(self._columns):
+            return
+        capacity = max(needed, 2 * len(self._columns))
+        for name in ('_columns', '_weights', '_entry_rows'):
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:self._size] = array[:self._size]
+            setattr(self, name, grown)
+
+    def _release(self, row):
+        """Neutraliser les entrées de la ligne (poids nul) et décompter ses n-grammes"""
+        start, end = self._spans[row]
+        self._df[self._columns[start:end]] -= 1
+        self._weights[start:end] = 0
+        self._entry_rows[start:end] = 0
+        self._dead += end - start
+
+    def _compact(self):
+        """Réécrire les tableaux sans les entrées neutralisées"""
+        if self._dead <= self._size // 2:
+            return
+        order = np.concatenate([np.arange(start, end) for start, end in self._spans]) \
+            if self._spans else np.zeros(0, dtype=np.int64)
+        size = len(order)
+        self._columns[:size] = self._columns[order]
+        self._weights[:size] = self._weights[order]
+        self._entry_rows[:size] = self._entry_rows[order]
+        self._weights[size:self._size] = 0
+        self._entry_rows[size:self._size] = 0
+        position = 0
+        for row, (start, end) in enumerate(self._spans):
+            self._spans[row] = (position, position + end - start)
+            position += end - start
+        self._size = size
+        self._dead = 0
+        self._sort_entries()
+
+    def _sort_entries(self):
+        """Reconstruire l'ordre des entrées par colonne"""
+        self._sorted = np.argsort(self._columns[:self._size], kind='stable')
+        self._sorted_columns = self._columns[self._sorted]
+        self._sorted_size = self._size
+
+    def _query_entries(self, columns):
+        """Positions des entrées dont la colonne figure dans la requête (plus les entrées récentes)"""
+        if self._size - self._sorted_size > max(1024, self._size // 8):
+            self._sort_entries()
+        low = np.searchsorted(self._sorted_columns, columns, side='left')
+        lengths = np.searchsorted(self._sorted_columns, columns, side='right') - low
+        total = int(lengths.sum())
+        # Concaténation des intervalles [low, low + length) sans boucle Python
+        offsets = np.repeat(low - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+        return np.concatenate([self._sorted[offsets], np.arange(self._sorted_size, self._size)])
+
+    def add(self, key, text):
+        """Ajouter ou remplacer le paragraphe `key`"""
+        columns, weights = self.vectorize(text)
+        with self._lock:
+            if key in self._rows:
+                row = self._rows[key]
+                self._release(row)
+            else:
+                row = self._rows[key] = len(self._keys)
+                self._keys.append(key)
+                self._spans.append(None)
+            self._reserve(len(columns))
+            start, end = self._size, self._size + len(columns)
+            self._columns[start:end] = columns
+            self._weights[start:end] = weights
+            self._entry_rows[start:end] = row
+            self._size = end
+            self._spans[row] = (start, end)
+            self._df[columns] += 1
+            self._compact()
+
+    def remove(self, key):
+        """Retirer le paragraphe `key` (sans effet s'il est absent)"""
+        with self._lock:
+            row = self._rows.pop(key, None)
+            if row is None:
+                return
+            self._release(row)
+            last = len(self._keys) - 1
+            if row != last:
+                # La dernière ligne prend le numéro de la ligne supprimée
+                start, end = self._spans[row] = self._spans[last]
+                self._entry_rows[start:end] = row
+                self._keys[row] = self._keys[last]
+                self._rows[self._keys[row]] = row
+            self._keys.pop()
+            self._spans.pop()
+            self._compact()
+
+    def clear(self):
+        with self._lock:
+            self._weights[:self._size] = 0
+            self._entry_rows[:self._size] = 0
+            self._size = 0
+            self._dead = 0
+            self._sort_entries()
+            self._df[:] = 0
+            self._spans = []
+            self._keys = []
+            self._rows = {}
+
+    def search(self, query, k=5):
+        """Les k paragraphes les plus proches de la requête : [(clé, score)]"""
+        columns, weights = self.vectorize(query)
+        with self._lock:
+            count = len(self._keys)
+            if not count or not len(columns) or k <= 0:
+                return []
+            # Les n-grammes rares dans l'index pèsent davantage
+            idf = np.log((1.0 + count) / (1.0 + self._df[columns])) + 1.0
+            self._query[columns] = weights * idf
+            try:
+                entries = self._query_entries(columns)
+                contributions = self._weights[entries] * self._query[self._columns[entries]]
+                scores = np.bincount(self._entry_rows[entries], weights=contributions, minlength=count)[:count]
+            finally:
+                self._query[columns] = 0
+            k = min(k, count)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self._keys[row], float(scores[row])) for row in top if scores[row] > 0]
@@ -0,0 +1,204 @@
+"""Construction du prompt en fonction de la fenêtre de contexte du modèle.
+
+Le prompt est assemblé à partir d'une partie fixe (modèle de lettre de
+l'utilisateur ou prompt par défaut) et des valeurs du formulaire. Le nombre de
+tokens de la partie fixe est mis en cache par modèle ; seules les valeurs sont
+recomptées à chaque requête.
+
+Les instructions fixes sont placées en tête du prompt : ce préfixe commun est
+évalué une seule fois par le modèle puis réutilisé (voir ModelBackend.generate).
+"""
+import re
+import math
+import threading
+from collections import OrderedDict
+
+# Instructions communes à toutes les lettres, évaluées une seule fois par modèle
+PROMPT_PREFIX = """En tant qu'expert en rédaction de lettres de motivation, génère une lettre de motivation professionnelle et persuasive.
+La lettre doit être formelle, bien structurée et mettre en avant les compétences et la motivation du candidat.
+Utilise le paragraphe personnalisé pour adapter la lettre au poste et à l'entreprise.
+N'inclus pas la mise en page (date, adresse, etc.) dans la réponse.
+
+"""
+
+DEFAULT_PROMPT = PROMPT_PREFIX + """Poste : {position}
+Entreprise : {company}
+
+Informations supplémentaires :
+- Type de contrat : {duration}
+- Date de début : {start_date}
+- Paragraphe personnalisé : {custom_paragraph}"""
+
+MARKER_PATTERN = re.compile(r"\[\[(\w+)\]\]")
+FIELD_PATTERN = re.compile(r"\{(\w+)\}")
+SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+# Champ raccourci en priorité quand le prompt ne tient pas dans le contexte
+TRIMMABLE_FIELD = 'custom_paragraph'
+# En dessous, la partie fixe d'un modèle utilisateur ne vaut pas d'être mise en cache
+MIN_PREFIX_TOKENS = 32
+
+
+def replace_markers(template, data):
+    """Remplacer les marqueurs [[champ]] du modèle par les valeurs fournies"""
+    for key, value in data.items():
+        # Les options de requête (booléens, nombres) ne sont pas des marqueurs
+        if key != 'template' and value and isinstance(value, str):
+            template = template.replace(f'[[{key}]]', value)
+    return template
+
+
+class PromptPlan:
+    """Prompt final et budget de tokens associé"""
+
+    def __init__(self, prompt, prompt_tokens, max_tokens, n_ctx, trimmed=False, prefix=None):
+        self.prompt = prompt
+        self.prefix = prefix
+        self.prompt_tokens = prompt_tokens
+        self.max_tokens = max_tokens
+        self.n_ctx = n_ctx
+        self.trimmed = trimmed
+
+    def token_report(self, completion_tokens=None):
+        """Décompte des tokens renvoyé au client"""
+        report = {
+            'prompt': self.prompt_tokens,
+            'max_tokens': self.max_tokens,
+            'context': self.n_ctx,
+            'trimmed': self.trimmed,
+        }
+        if completion_tokens is not None:
+            report['completion'] = completion_tokens
+            report['total'] = self.prompt_tokens + completion_tokens
+        return report
+
+
+class PromptBuilder:
+    """Assemble le prompt et dimensionne max_tokens selon le contexte restant"""
+
+    def __init__(self, max_tokens=2000, min_response_tokens=400, reserve_tokens=32, cache_size=4096):
+        self.max_tokens = max_tokens
+        self.min_response_tokens = min_response_tokens
+        self.reserve_tokens = reserve_tokens
+        self.cache_size = cache_size
+        self._static_counts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _static_count(self, model, text, pattern):
+        """Tokens de la partie fixe d'un modèle (sans ses champs), mis en cache par modèle"""
+        key = (model.model_id, text)
+        with self._lock:
+            if key in self._static_counts:
+                self._static_counts.move_to_end(key)
+                return self._static_counts[key]
+        count = model.count_tokens(pattern.sub(" ", text))
+        with self._lock:
+            self._static_counts[key] = count
+            while len(self._static_counts) > self.cache_size:
+                self._static_counts.popitem(last=False)
+        return count
+
+    def fill(self, data):
+        """Texte du prompt, sans contrainte de taille"""
+        # Remplacer les marqueurs par les valeurs
+        template = replace_markers(data.get('template', ''), data)
+
+        # Si le template est vide, utiliser le prompt par défaut
+        if not template.strip():
+            return DEFAULT_PROMPT.format(**data)
+        return template
+
+    def prefix(self, model, data):
+        """Début fixe du prompt, commun à toutes les requêtes (None si trop court)"""
+        template = data.get('template', '')
+        if not replace_markers(template, data).strip():
+            return PROMPT_PREFIX
+        marker = MARKER_PATTERN.search(template)
+        if marker is None:
+            return None
+        head = template[:marker.start()]
+        if self._static_count(model, head, MARKER_PATTERN) < MIN_PREFIX_TOKENS:
+            return None
+        return head
+
+    def count_prompt_tokens(self, model, data):
+        """Tokens du prompt : partie fixe en cache, valeurs des champs recomptées"""
+        template = data.get('template', '')
+        if replace_markers(template, data).strip():
+            static = self._static_count(model, template, MARKER_PATTERN)
+            fields = [key for key in MARKER_PATTERN.findall(template)
+                      if key != 'template' and data.get(key) and isinstance(data[key], str)]
+            # Les marqueurs sans valeur restent tels quels dans le prompt
+            unfilled = [f"[[{key}]]" for key in MARKER_PATTERN.findall(template) if key not in fields]
+            return (static
+                    + sum(model.count_tokens(data[key]) for key in fields)
+                    + sum(model.count_tokens(marker) for marker in unfilled))
+
+        static = self._static_count(model, DEFAULT_PROMPT, FIELD_PATTERN)
+        return static + sum(model.count_tokens(str(data[key])) for key in FIELD_PATTERN.findall(DEFAULT_PROMPT))
+
+    def field_budget(self, model, data, n_ctx, field=TRIMMABLE_FIELD):
+        """Tokens disponibles pour un champ en laissant min_response_tokens à la réponse"""
+        others = self.count_prompt_tokens(model, dict(data, **{field: ''}))
+        occurrences = max(1, self.fill(dict(data, **{field: '\0'})).count('\0'))
+        return (n_ctx - self.reserve_tokens - self.min_response_tokens - others) // occurrences
+
+    def count_tokens(self, model, text):
+        return model.count_tokens(text) if text else 0
+
+    def trim_text(self, model, text, budget):
+        """Raccourcir un texte à `budget` tokens en gardant des phrases entières"""
+        if budget <= 0:
+            return ""
+        kept = []
+        used = 0
+        for sentence in SENTENCE_END.split(text.strip()):
+            tokens = model.count_tokens(sentence + " ")
+            if used + tokens > budget:
+                break
+            kept.append(sentence)
+            used += tokens
+        if kept:
+            return " ".join(kept)
+
+        # Première phrase trop longue : couper au dernier mot qui tient
+        kept = []
+        used = model.count_tokens("…")
+        for word in text.split():
+            tokens = model.count_tokens(" " + word)
+            if used + tokens > budget:
+                break
+            kept.append(word)
+            used += tokens
+        return " ".join(kept) + "…" if kept else ""
+
+    def build(self, data, model, n_ctx):
+        """Construire le prompt et calculer max_tokens pour un modèle de contexte n_ctx"""
+        prompt_tokens = self.count_prompt_tokens(model, data)
+        available = n_ctx - self.reserve_tokens - prompt_tokens
+        trimmed = False
+
+        custom = data.get(TRIMMABLE_FIELD)
+        if available < self.min_response_tokens and custom and isinstance(custom, str):
+            # Libérer de la place pour la réponse en raccourcissant le paragraphe personnalisé
+            occurrences = max(1, self.fill(data).count(custom))
+            missing = self.min_response_tokens - available
+            budget = model.count_tokens(custom) - math.ceil(missing / occurrences)
+            data = dict(data, **{TRIMMABLE_FIELD: self.trim_text(model, custom, budget)})
+            trimmed = True
+            prompt_tokens = self.count_prompt_tokens(model, data)
+            available = n_ctx - self.reserve_tokens - prompt_tokens
+
+        if available <= 0:
+            raise ValueError(
+                f"Le prompt ({prompt_tokens} tokens) dépasse la fenêtre de contexte du modèle ({n_ctx} tokens)"
+            )
+
+        return PromptPlan(
+            prompt=self.fill(data),
+            prompt_tokens=prompt_tokens,
+            max_tokens=min(self.max_tokens, available),
+            n_ctx=n_ctx,
+            trimmed=trimmed,
+            prefix=self.prefix(model, data),
+        )
@@ -0,0 +1,149 @@
+"""Espace de travail temporaire des requêtes (documents Word et PDF intermédiaires).
+
+Chaque requête reçoit son propre dossier, supprimé à la sortie du
+gestionnaire de contexte, même après une erreur ou une annulation : deux
+exports simultanés n'écrivent jamais dans le même fichier. Les dossiers sont
+créés de préférence sur un tmpfs (/dev/shm), en mémoire. Un balayage
+périodique supprime les dossiers orphelins (processus arrêté brutalement)
+plus anciens que SCRATCH_MAX_AGE.
+"""
+import os
+import time
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from metrics import metrics
+
+TMPFS_DIR = "/dev/shm"
+DIR_NAME = "lettre_motivation_ai"
+
+
+def default_root():
+    """Dossier racine : SCRATCH_DIR, sinon un tmpfs s'il est disponible, sinon le dossier temporaire"""
+    root = os.getenv("SCRATCH_DIR")
+    if root:
+        return root
+    if os.getenv("SCRATCH_TMPFS", "1") != "0" and os.path.isdir(TMPFS_DIR) and os.access(TMPFS_DIR, os.W_OK):
+        return os.path.join(TMPFS_DIR, DIR_NAME)
+    return os.path.join(tempfile.gettempdir(), DIR_NAME)
+
+
+class ScratchSpace:
+    """Dossiers temporaires par requête, avec nettoyage garanti et balayage des orphelins"""
+
+    def __init__(self, root=None, max_age=3600.0, sweep_interval=300.0, name="scratch"):
+        self.root = root or default_root()
+        self.max_age = max_age
+        self.sweep_interval = sweep_interval
+        self.name = name
+        self._active = set()
+        self._lock = threading.Lock()
+        self._sweeper = None
+        os.makedirs(self.root, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """Créer l'espace de travail à partir des variables d'environnement"""
+        return cls(
+            max_age=float(os.getenv("SCRATCH_MAX_AGE", "3600")),
+            sweep_interval=float(os.getenv("SCRATCH_SWEEP_INTERVAL", "300")),
+        )
+
+    @contextmanager
+    def directory(self, prefix="request"):
+        """Dossier propre à la requête, supprimé à la sortie du bloc"""
+        self._start_sweeper()
+        path = tempfile.mkdtemp(prefix=f"{prefix}-", dir=self.root)
+        with self._lock:
+            self._active.add(path)
+            metrics.set_gauge(f"{self.name}.active", len(self._active))
+        metrics.increment(f"{self.name}.directories")
+        try:
+            yield path
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+            with self._lock:
+                self._active.discard(path)
+                metrics.set_gauge(f"{self.name}.active", len(self._active))
+
+    def _start_sweeper(self):
+        if self._sweeper is not None or not self.sweep_interval:
+            return
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep_loop, name="scratch-sweeper", daemon=True)
+                self._sweeper.start()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except OSError as e:
+                print(f"Erreur lors du nettoyage des fichiers temporaires : {e}")
+
+    def sweep(self):
+        """Supprimer les entrées orphelines plus anciennes que max_age ; renvoie leur nombre"""
+        limit = time.time() - self.max_age
+        with self._lock:
+            active = set(self._active)
+        removed = 0
+        for entry in os.scandir(self.root):
+            if entry.path in active:
+                continue
+            try:
+                if entry.stat(follow_symlinks=False).st_mtime >= limit:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.remove(entry.path)
+            except OSError:
+                continue
+            removed += 1
+        if removed:
+            metrics.increment(f"{self.name}.orphans_removed", removed)
+        self.usage()
+        return removed
+
+    def usage(self):
+        """Occupation du dossier racine et place libre sur le système de fichiers"""
+        files = size = 0
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                try:
+                    size += os.lstat(os.path.join(directory, filename)).st_size
+                except OSError:
+                    continue
+                files += 1
+        disk = shutil.disk_usage(self.root)
+        usage = {
+            f"{self.name}.bytes": size,
+            f"{self.name}.files": files,
+            f"{self.name}.free_bytes": disk.free,
+            f"{self.name}.total_bytes": disk.total,
+        }
+        for name, value in usage.items():
+            metrics.set_gauge(name, value)
+        return usage
+
+    def stats(self):
+        """Métriques de l'espace de travail (occupation recalculée)"""
+        self.usage()
+        return metrics.snapshot(prefix=f"{self.name}.")
+
+
+_scratch = None
+_scratch_lock = threading.Lock()
+
+
+def scratch_space():
+    """Espace de travail du processus, créé à la première utilisation"""
+    global _scratch
+    if _scratch is None:
+        with _scratch_lock:
+            if _scratch is None:
+                _scratch = ScratchSpace.from_env()
+    return _scratch
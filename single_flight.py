@@ -0,0 +1,239 @@
+"""Regroupement des générations identiques exécutées en même temps.
+
+- SingleFlight : dans un worker, les requêtes concurrentes de même clé
+  attendent la génération en cours et reçoivent son résultat ou ses tokens.
+- FileLockCoordinator : entre workers, un verrou fichier par clé désigne le
+  worker qui génère ; les autres attendent la fin puis lisent le résultat dans
+  le cache disque partagé (GENERATION_CACHE_DIR).
+
+Une génération partagée n'est annulée que lorsque toutes les requêtes qui
+l'attendent ont été annulées.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de coordination entre processus
+    fcntl = None
+
+from metrics import metrics
+from cancellation import Cancelled
+
+# Fréquence de vérification des jetons d'annulation pendant l'attente
+CANCEL_POLL_INTERVAL = 0.25
+
+
+class _Call:
+    """Génération en cours, partagée par toutes les requêtes de même clé"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.tokens = []
+        self.done = False
+        self.result = None
+        self.error = None
+        self.subscribers = 0
+        self.cancel_tokens = []
+        self.cancellable = True
+
+    def attach(self, token):
+        """Associer le jeton d'annulation d'une requête abonnée"""
+        with self.condition:
+            if token is None:
+                # Une requête sans jeton attend toujours le résultat
+                self.cancellable = False
+            else:
+                self.cancel_tokens.append(token)
+
+    def abandoned(self):
+        """Toutes les requêtes abonnées ont été annulées"""
+        with self.condition:
+            return self.cancellable and all(token.cancelled for token in self.cancel_tokens)
+
+    def _wait_for(self, predicate, timeout, token):
+        """Attendre sous self.condition que predicate soit vrai"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not predicate():
+            if token is not None:
+                token.check()
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError("Délai dépassé en attendant la génération en cours")
+            if token is not None:
+                remaining = CANCEL_POLL_INTERVAL if remaining is None else min(remaining, CANCEL_POLL_INTERVAL)
+            self.condition.wait(remaining)
+
+    def publish(self, chunk):
+        """Diffuser un token aux requêtes en attente"""
+        with self.condition:
+            self.tokens.append(chunk)
+            self.condition.notify_all()
+
+    def finish(self, result=None, error=None):
+        with self.condition:
+            self.result = result
+            self.error = error
+            self.done = True
+            self.condition.notify_all()
+
+    def wait(self, timeout=None, token=None):
+        """Attendre le résultat final"""
+        with self.condition:
+            self._wait_for(lambda: self.done, timeout, token)
+        if isinstance(self.error, Cancelled) and token is not None and token.cancelled:
+            # Génération interrompue à cause de cette requête : renvoyer sa propre raison
+            raise Cancelled(token.reason)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def iter_tokens(self, timeout=None, token=None):
+        """Itérer sur les tokens, y compris ceux déjà produits"""
+        index = 0
+        while True:
+            with self.condition:
+                self._wait_for(lambda: index < len(self.tokens) or self.done, timeout, token)
+                chunks = self.tokens[index:]
+                done = self.done
+            # Ne pas réutiliser le nom `token` : c'est le jeton d'annulation vérifié par _wait_for
+            yield from chunks
+            index += len(chunks)
+            if done and index >= len(self.tokens):
+                break
+        if self.error is not None:
+            raise self.error
+
+
+class SingleFlight:
+    """Exécute une seule fois une fonction pour toutes les requêtes simultanées de même clé"""
+
+    def __init__(self, timeout=None, name="single_flight"):
+        self.timeout = timeout
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key, token=None):
+        """Renvoyer (appel, est_leader)"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.subscribers += 1
+                call.attach(token)
+                metrics.increment(f"{self.name}.coalesced")
+                return call, False
+            call = self._calls[key] = _Call()
+            call.attach(token)
+            metrics.increment(f"{self.name}.leaders")
+            return call, True
+
+    def _run(self, key, call, fn):
+        try:
+            call.finish(result=fn(call.publish, call.abandoned))
+        except BaseException as e:
+            call.finish(error=e)
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+
+    def do(self, key, fn, token=None):
+        """Exécuter fn(publish, abandoned) ou attendre l'exécution en cours ; renvoie son résultat.
+
+        abandoned() devient vrai quand toutes les requêtes abonnées sont annulées.
+        """
+        call, leader = self._join(key, token)
+        if leader:
+            self._run(key, call, fn)
+        return call.wait(self.timeout, token)
+
+    def stream(self, key, fn, token=None):
+        """Comme do(), mais renvoie un itérateur sur les tokens publiés.
+
+        La génération s'exécute dans un thread dédié : elle se poursuit pour
+        les autres abonnés même si le client qui l'a lancée se déconnecte.
+        """
+        call, leader = self._join(key, token)
+        if leader:
+            threading.Thread(target=self._run, args=(key, call, fn), daemon=True).start()
+        return call.iter_tokens(self.timeout, token)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+class FileLockCoordinator:
+    """Verrou exclusif par clé, partagé entre les workers via des fichiers"""
+
+    def __init__(self, lock_dir, timeout=130, poll_interval=0.05):
+        self.lock_dir = lock_dir
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        os.makedirs(lock_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """Coordinateur actif seulement si le cache disque partagé est configuré"""
+        cache_dir = os.getenv("GENERATION_CACHE_DIR")
+        if not cache_dir or fcntl is None:
+            return None
+        return cls(
+            os.path.join(cache_dir, "locks"),
+            timeout=float(os.getenv("SINGLE_FLIGHT_TIMEOUT", "130")),
+        )
+
+    @contextmanager
+    def hold(self, key, cancelled=None):
+        """Prendre le verrou de la clé.
+
+        Renvoie True si ce worker l'a obtenu immédiatement, False s'il a dû
+        attendre qu'un autre worker termine. Dans les deux cas, l'appelant doit
+        relire le cache partagé avant de générer : le verrou peut avoir été
+        libéré juste avant d'être pris. L'attente s'interrompt dès que
+        cancelled() est vrai. Le fichier de verrou est supprimé à la libération.
+        """
+        path = os.path.join(self.lock_dir, f"{key}.lock")
+        leader = True
+        deadline = time.monotonic() + self.timeout
+        while True:
+            lock_file = open(path, "a")
+            try:
+                while True:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if leader:
+                            leader = False
+                            metrics.increment("single_flight.cross_worker_waits")
+                        if cancelled is not None and cancelled():
+                            raise Cancelled("abandoned")
+                        if time.monotonic() > deadline:
+                            raise TimeoutError("Délai dépassé en attendant la génération d'un autre worker")
+                        time.sleep(self.poll_interval)
+                # Le worker précédent a pu supprimer le fichier avant de libérer le
+                # verrou : recommencer avec le fichier actuel
+                try:
+                    current = os.stat(path)
+                except FileNotFoundError:
+                    current = None
+                opened = os.fstat(lock_file.fileno())
+                if current is not None and (current.st_dev, current.st_ino) == (opened.st_dev, opened.st_ino):
+                    break
+            except BaseException:
+                lock_file.close()
+                raise
+            lock_file.close()
+        try:
+            yield leader
+        finally:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
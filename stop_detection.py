@@ -0,0 +1,158 @@
+"""Arrêt anticipé de la génération.
+
+StopDetector reçoit les tokens au fil de l'eau et interrompt la génération :
+- dès qu'une séquence d'arrêt apparaît ;
+- quand la formule de politesse finale et la signature sont terminées ;
+- quand le modèle se met à répéter une phrase déjà écrite ;
+- quand le nombre maximal de paragraphes est atteint.
+
+Le texte n'est transmis qu'une fois confirmé (phrase terminée), pour que les
+clients en streaming ne reçoivent jamais la partie qui sera coupée.
+"""
+import os
+import re
+import json
+
+DEFAULT_STOP_SEQUENCES = ["###", "<|", "</s>", "[INST]", "Instruction :", "Question :"]
+
+CLOSING_PATTERN = re.compile(
+    r"je vous prie d'agréer|veuillez agréer|veuillez recevoir|recevez, madame|"
+    r"je vous prie de croire|salutations distinguées|sincères salutations|"
+    r"yours sincerely|yours faithfully|best regards|kind regards|sincerely",
+    re.IGNORECASE
+)
+SENTENCE_BOUNDARY = re.compile(r"[.!?…]+(?=\s)|\n")
+PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n\s*(?=\S)")
+SIGNATURE_END = re.compile(r"\S[^\n]*\n[ \t]*\n")
+
+# Au-delà, le texte qui suit la formule de politesse n'est pas une signature
+SIGNATURE_MAX_CHARS = 80
+# Les phrases plus courtes ("Madame, Monsieur,") peuvent légitimement se répéter
+MIN_REPEATED_SENTENCE = 20
+
+
+def stop_sequences_from_env():
+    """Séquences d'arrêt configurées (STOP_SEQUENCES, liste JSON)"""
+    value = os.getenv("STOP_SEQUENCES")
+    return json.loads(value) if value else list(DEFAULT_STOP_SEQUENCES)
+
+
+class StopDetector:
+    """Filtre de tokens qui détecte la fin naturelle d'une lettre"""
+
+    def __init__(self, stop_sequences=None, max_paragraphs=10, detect_closing=True, detect_repetition=True):
+        self.stop_sequences = [s for s in (stop_sequences or []) if s]
+        self.max_paragraphs = max_paragraphs
+        self.detect_closing = detect_closing
+        self.detect_repetition = detect_repetition
+        self.text = ""
+        self.tokens = 0
+        self.stop_reason = None
+        self._cut = None
+        self._emitted = 0
+        self._sentence_start = 0
+        self._confirmed = 0
+        self._sentences = set()
+        self._paragraph_scan = 0
+        self._paragraphs = 1
+        self._closing_end = None
+        self._hold_back = max([len(s) for s in self.stop_sequences] + [1]) - 1
+
+    def _stop(self, reason, cut):
+        self.stop_reason = reason
+        self._cut = max(cut, self._emitted)
+
+    def _check_stop_sequences(self, start):
+        for sequence in self.stop_sequences:
+            index = self.text.find(sequence, max(0, start - len(sequence)))
+            if index != -1:
+                self._stop("stop_sequence", index)
+                return True
+        return False
+
+    def _check_sentences(self):
+        """Analyser les phrases terminées depuis le dernier appel"""
+        for match in SENTENCE_BOUNDARY.finditer(self.text, self._sentence_start):
+            start, end = self._sentence_start, match.end()
+            sentence = " ".join(self.text[start:end].split()).lower()
+            self._sentence_start = end
+
+            if self.detect_repetition and len(sentence) >= MIN_REPEATED_SENTENCE:
+                if sentence in self._sentences:
+                    self._stop("repetition", start)
+                    return True
+                self._sentences.add(sentence)
+
+            if self.detect_closing and self._closing_end is None and CLOSING_PATTERN.search(sentence):
+                # Formule de politesse terminée : seule une signature peut suivre
+                self._closing_end = end
+            self._confirmed = end
+        return False
+
+    def _check_paragraphs(self):
+        for match in PARAGRAPH_BREAK.finditer(self.text, self._paragraph_scan):
+            self._paragraph_scan = match.end()
+            self._paragraphs += 1
+            if self.max_paragraphs and self._paragraphs > self.max_paragraphs:
+                self._stop("paragraph_budget", match.start())
+                return True
+        return False
+
+    def _check_signature(self):
+        if self._closing_end is None:
+            return False
+        tail = self.text[self._closing_end:]
+        if len(tail.strip()) > SIGNATURE_MAX_CHARS:
+            self._stop("closing", self._closing_end)
+            return True
+        signature = SIGNATURE_END.search(tail)
+        if signature:
+            self._stop("closing", self._closing_end + signature.end())
+            return True
+        return False
+
+    def push(self, token):
+        """Ajouter un token ; renvoie le texte confirmé à transmettre"""
+        if self.stop_reason:
+            return ""
+        start = len(self.text)
+        self.text += token
+        self.tokens += 1
+
+        if not (self._check_stop_sequences(start)
+                or self._check_sentences()
+                or self._check_paragraphs()):
+            self._check_signature()
+
+        if self.stop_reason:
+            safe = self._cut
+        else:
+            safe = min(self._confirmed, len(self.text) - self._hold_back)
+        return self._emit(safe)
+
+    def _emit(self, end):
+        # Les espaces de fin ne sont transmis qu'avec le texte qui les suit
+        while end > self._emitted and self.text[end - 1].isspace():
+            end -= 1
+        if end <= self._emitted:
+            return ""
+        chunk = self.text[self._emitted:end]
+        self._emitted = end
+        return chunk
+
+    @property
+    def stopped(self):
+        return self.stop_reason is not None
+
+    def flush(self):
+        """Fin de génération : renvoie le texte restant à transmettre"""
+        return self._emit(len(self.result()))
+
+    def result(self):
+        """Texte final, coupé au point d'arrêt"""
+        text = self.text if self._cut is None else self.text[:self._cut]
+        return text.rstrip()
+
+    def tokens_saved(self, max_tokens):
+        """Tokens non générés grâce à l'arrêt anticipé"""
+        return max(0, max_tokens - self.tokens) if self.stopped else 0
@@ -0,0 +1,69 @@
+"""Feuilles de style servies comme fichiers statiques.
+
+Chaque feuille est identifiée par l'empreinte de son contenu et servie à une
+adresse qui la contient (/styles/letter.<empreinte>.css) : elle peut être mise
+en cache indéfiniment par le navigateur (immutable), une nouvelle
+configuration de styles donnant une nouvelle adresse. Les variantes gzip et
+brotli (si le module brotli est installé) sont compressées une seule fois.
+"""
+import gzip
+import hashlib
+import threading
+
+try:
+    import brotli
+except ImportError:  # brotli facultatif : gzip seulement
+    brotli = None
+
+from metrics import metrics
+
+# Cache-Control des fichiers à empreinte
+IMMUTABLE = "public, max-age=31536000, immutable"
+URL_PREFIX = "/styles/"
+
+
+class Stylesheet:
+    """Feuille de style, son empreinte et ses variantes compressées"""
+
+    def __init__(self, css, name="letter"):
+        self.css = css
+        self.content = css.encode('utf-8')
+        self.fingerprint = hashlib.sha256(self.content).hexdigest()[:16]
+        self.filename = f"{name}.{self.fingerprint}.css"
+        self.url = URL_PREFIX + self.filename
+        self.variants = {'identity': self.content, 'gzip': gzip.compress(self.content, 9, mtime=0)}
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(self.content, quality=11)
+
+    def variant(self, accept_encodings):
+        """(encodage, contenu) le plus petit parmi ceux acceptés par le client"""
+        accepted = [
+            encoding for encoding in self.variants
+            if encoding == 'identity' or accept_encodings.quality(encoding) > 0
+        ]
+        encoding = min(accepted, key=lambda encoding: len(self.variants[encoding]))
+        return encoding, self.variants[encoding]
+
+
+_stylesheets = {}
+_lock = threading.Lock()
+
+
+def register(css, name="letter"):
+    """Feuille de style du contenu donné, créée (et compressée) une seule fois"""
+    key = (name, css)
+    stylesheet = _stylesheets.get(key)
+    if stylesheet is None:
+        with _lock:
+            stylesheet = _stylesheets.get(key)
+            if stylesheet is None:
+                stylesheet = Stylesheet(css, name)
+                _stylesheets[key] = stylesheet
+                _stylesheets[stylesheet.filename] = stylesheet
+                metrics.increment("stylesheets.built")
+    return stylesheet
+
+
+def find(filename):
+    """Feuille de style enregistrée sous ce nom de fichier (ou None)"""
+    return _stylesheets.get(filename)
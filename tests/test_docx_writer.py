@@ -0,0 +1,112 @@
+"""Écriture directe des documents Word (docx_writer), relus par python-docx."""
+import io
+
+from docx import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml.ns import qn
+
+from docx_writer import render_docx_bytes
+from letter_ir import build_letter
+from letter_renderers import DocxLayout
+
+LETTER = {
+    'header': 'Candidature spontanée', 'footer': 'Page 1',
+    'full_name': 'Jeanne Martin', 'address': '1 rue des Lilas', 'postal_code': '75001', 'city': 'Paris',
+    'phone': '0102030405', 'email': 'jeanne@example.com', 'company': 'Acme',
+    'company_address': '2 avenue de la Gare', 'company_postal_code': '69001', 'company_city': 'Lyon',
+    'date': '1 mars 2026', 'subject': 'Poste de développeuse',
+    'content': (
+        'Je suis <bold>motivée</bold>, <italic>curieuse</italic>, <underline>rigoureuse</underline> '
+        'et <b><i>disponible</i></b>.\n\n'
+        '- Python\n- Flask\n\n'
+        '<align="center">Au plaisir de vous rencontrer.</align>'
+    ),
+}
+LAYOUT = DocxLayout(font="Arial", font_size=11, line_spacing=1.5, space_after=6)
+
+
+def open_document(content):
+    return Document(io.BytesIO(content))
+
+
+def effective(run, attribute):
+    """Style du segment : propriété directe, sinon celle de son style de caractère"""
+    value = getattr(run.font, attribute)
+    return bool(value if value is not None else getattr(run.style.font, attribute))
+
+
+def body_paragraphs(document):
+    return [paragraph for paragraph in document.paragraphs if paragraph.text]
+
+
+def test_paragraph_text_and_styles():
+    document = open_document(render_docx_bytes(build_letter(LETTER), LAYOUT))
+    paragraphs = [(paragraph.text, paragraph.style.name) for paragraph in body_paragraphs(document)]
+    assert paragraphs == [
+        ('Jeanne Martin', 'LetterAddress'),
+        ('1 rue des Lilas', 'LetterAddress'),
+        ('75001 Paris', 'LetterAddress'),
+        ('Tél : 0102030405', 'LetterAddress'),
+        ('Email : jeanne@example.com', 'LetterAddress'),
+        ('Acme', 'LetterAddress'),
+        ('2 avenue de la Gare', 'LetterAddress'),
+        ('69001 Lyon', 'LetterAddress'),
+        ('Paris, le 1 mars 2026', 'LetterDate'),
+        ('Objet : Poste de développeuse', 'LetterSubject'),
+        ('Madame, Monsieur,', 'LetterGreeting'),
+        ('Je suis motivée, curieuse, rigoureuse et disponible.', 'LetterBody'),
+        ('Python', 'LetterList'),
+        ('Flask', 'LetterList'),
+        ('Au plaisir de vous rencontrer.', 'LetterBody'),
+        ("Je vous prie d'agréer, Madame, Monsieur, l'expression de mes salutations distinguées.",
+         'LetterClosing'),
+        ('Jeanne Martin', 'LetterSignature'),
+    ]
+    section = document.sections[0]
+    assert section.header.paragraphs[0].text == 'Candidature spontanée'
+    assert section.footer.paragraphs[0].text == 'Page 1'
+
+
+def test_bold_italic_underline_runs():
+    document = open_document(render_docx_bytes(build_letter(LETTER), LAYOUT))
+    paragraph = next(p for p in document.paragraphs if p.text.startswith('Je suis'))
+    runs = [(run.text, effective(run, 'bold'), effective(run, 'italic'), effective(run, 'underline'))
+            for run in paragraph.runs]
+    assert runs == [
+        ('Je suis ', False, False, False),
+        ('motivée', True, False, False),
+        (', ', False, False, False),
+        ('curieuse', False, True, False),
+        (', ', False, False, False),
+        ('rigoureuse', False, False, True),
+        (' et ', False, False, False),
+        ('disponible', True, True, False),
+        ('.', False, False, False),
+    ]
+    subject = next(p for p in document.paragraphs if p.style.name == 'LetterSubject')
+    assert subject.style.font.bold
+
+
+def test_alignment_and_spacing():
+    document = open_document(render_docx_bytes(build_letter(LETTER), LAYOUT))
+    by_text = {paragraph.text: paragraph for paragraph in document.paragraphs}
+    # Alignement du style, ou alignement direct quand il diffère du style
+    assert by_text['Paris, le 1 mars 2026'].style.paragraph_format.alignment == WD_ALIGN_PARAGRAPH.RIGHT
+    assert by_text['Jeanne Martin'].alignment is None
+    assert by_text['Au plaisir de vous rencontrer.'].alignment == WD_ALIGN_PARAGRAPH.CENTER
+    assert document.styles['LetterBody'].paragraph_format.first_line_indent is not None
+
+    # Police, taille et interligne une fois, dans les valeurs par défaut du document
+    defaults = document.styles.element.find(qn('w:docDefaults'))
+    fonts = defaults.find(f"{qn('w:rPrDefault')}/{qn('w:rPr')}/{qn('w:rFonts')}")
+    size = defaults.find(f"{qn('w:rPrDefault')}/{qn('w:rPr')}/{qn('w:sz')}")
+    spacing = defaults.find(f"{qn('w:pPrDefault')}/{qn('w:pPr')}/{qn('w:spacing')}")
+    assert fonts.get(qn('w:ascii')) == 'Arial'
+    assert int(size.get(qn('w:val'))) == 22
+    assert spacing.get(qn('w:line')) == '360'
+    assert spacing.get(qn('w:after')) == '120'
+
+
+def test_renders_are_identical():
+    letter = build_letter(LETTER)
+    assert render_docx_bytes(letter, LAYOUT) == render_docx_bytes(build_letter(LETTER), LAYOUT)
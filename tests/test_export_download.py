@@ -0,0 +1,36 @@
+"""Téléchargement d'un export déjà rendu (GET /export/<clé>.<format>)."""
+import pytest
+
+LETTER = {
+    'full_name': 'Jeanne Martin', 'address': '1 rue des Lilas', 'postal_code': '75001', 'city': 'Paris',
+    'phone': '0102030405', 'email': 'jeanne@example.com', 'company': 'Acme',
+    'company_address': '2 avenue de la Gare', 'company_postal_code': '69001', 'company_city': 'Lyon',
+    'subject': 'Candidature', 'content': 'Bonjour,\n\nJe vous écris pour le poste.',
+}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("MODEL_BACKEND", "stub")
+    import web_app
+    web_app.export_cache.clear()
+    return web_app.app.test_client()
+
+
+def test_download_uses_the_exported_format(client):
+    response = client.post('/export', json=dict(LETTER, format='txt'))
+    location = response.headers['Content-Location']
+    assert location.endswith('.txt')
+
+    again = client.get(location)
+    assert again.status_code == 200
+    assert again.data == response.data
+    assert again.mimetype == 'text/plain'
+
+
+def test_download_with_another_extension_is_not_found(client):
+    location = client.post('/export', json=dict(LETTER, format='docx')).headers['Content-Location']
+    key = location[len('/export/'):].rsplit('.', 1)[0]
+
+    for extension in ('pdf', 'txt', 'html', 'zip'):
+        assert client.get(f'/export/{key}.{extension}').status_code == 404
@@ -0,0 +1,23 @@
+"""Validation des demandes de génération (/generate et /generate/stream)."""
+import pytest
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("MODEL_BACKEND", "stub")
+    import web_app
+    return web_app.app.test_client()
+
+
+@pytest.mark.parametrize('route', ['/generate', '/generate/stream'])
+@pytest.mark.parametrize('body', [
+    'null',
+    '[1]',
+    '{"company": "Acme", "position": "développeur", "model": ["rapide"]}',
+    '{"company": "Acme", "position": "développeur", "model": {"nom": "rapide"}}',
+    '{"company": "Acme", "position": "développeur", "model": "inconnu"}',
+])
+def test_invalid_requests_get_a_json_400(client, route, body):
+    response = client.post(route, data=body, content_type='application/json')
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
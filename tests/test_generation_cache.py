@@ -0,0 +1,63 @@
+"""Cache des générations (generation_cache) : clés, expiration et niveau disque."""
+import os
+import time
+
+from generation_cache import GenerationCache, normalize_prompt
+
+PARAMS = {"max_tokens": 800, "temp": 0.7}
+
+
+def test_key_normalization():
+    prompt = "Rédige une lettre pour Acme.\n\nPoste : développeur"
+    variants = [
+        "  Rédige une  lettre pour\tAcme.  \n\n\n\nPoste : développeur\n",
+        # Même texte en forme décomposée (e + accent combinant)
+        "Rédige une lettre pour Acme.\n\nPoste : développeur",
+    ]
+    key = GenerationCache.make_key(prompt, "gpt4all:modele.gguf", PARAMS)
+    for variant in variants:
+        assert normalize_prompt(variant) == normalize_prompt(prompt)
+        assert GenerationCache.make_key(variant, "gpt4all:modele.gguf", PARAMS) == key
+    assert GenerationCache.make_key(prompt, "gpt4all:autre.gguf", PARAMS) != key
+    assert GenerationCache.make_key(prompt, "gpt4all:modele.gguf", dict(PARAMS, temp=0.2)) != key
+
+
+def test_ttl_expiry_in_both_tiers(tmp_path):
+    cache = GenerationCache(ttl=0.2, disk_dir=str(tmp_path))
+    cache.set("clé", "lettre")
+    assert cache.get("clé") == "lettre"
+    # Un autre worker (mémoire vide) lit le niveau disque
+    assert GenerationCache(ttl=0.2, disk_dir=str(tmp_path)).get("clé") == "lettre"
+
+    time.sleep(0.3)
+    assert cache.get("clé") is None
+    assert not os.listdir(tmp_path)
+
+
+def test_disk_tier_is_bounded(tmp_path):
+    value = "x" * 1000
+    cache = GenerationCache(max_entries=0, disk_dir=str(tmp_path), max_disk_bytes=10_000)
+    for number in range(5):
+        cache.set(f"ancienne {number}", value)
+    time.sleep(0.05)
+    # L'entrée lue reste récente ; les plus anciennes sont supprimées en premier
+    assert cache.get("ancienne 0") == value
+    for number in range(6):
+        cache.set(f"clé {number}", value)
+
+    total = sum(os.path.getsize(os.path.join(tmp_path, name)) for name in os.listdir(tmp_path))
+    assert total <= 10_000
+    assert cache.get("clé 5") == value
+    assert cache.get("ancienne 0") == value
+    assert cache.get("ancienne 1") is None
+
+
+def test_expired_files_are_swept_first(tmp_path):
+    cache = GenerationCache(max_entries=0, ttl=0.1, disk_dir=str(tmp_path), max_disk_bytes=5_000)
+    cache.set("expirée", "x" * 1000)
+    time.sleep(0.2)
+    cache.ttl = 3600
+    for number in range(4):
+        cache.set(f"clé {number}", "x" * 1000)
+    assert not os.path.exists(cache._disk_path("expirée"))
+    assert all(cache.get(f"clé {number}") for number in range(4))
@@ -0,0 +1,71 @@
+"""Extraction des champs d'une offre d'emploi (job_offer_extractor)."""
+import pytest
+
+from job_offer_extractor import extract_job_offer, extract_job_offers
+
+CDD_OFFER = """Développeur Python (H/F)
+Acme Solutions recrute un développeur Python confirmé pour rejoindre son équipe data.
+Vos missions : concevoir des API, maintenir la plateforme, encadrer deux alternants.
+Profil : 3 ans d'expérience minimum en Python, Flask et PostgreSQL.
+Contrat : CDD de 12 mois, démarrage le 1er septembre 2024.
+Rémunération : 42-48 k€ brut annuel selon profil.
+Lieu : Lyon (69) - télétravail deux jours par semaine.
+Envoyez votre candidature à jobs@acme-solutions.fr"""
+
+INTERNSHIP_OFFER = """Assistant(e) marketing digital (F/H) - Stage
+Au sein de l'équipe communication, vous participerez au lancement de nos nouvelles gammes.
+Durée : 6 mois, à partir du 05/01/2026. Gratification : 4,35 €/h.
+Le poste est basé à Aix-en-Provence.
+Candidatures : rh@biocosmetiques-provence.com"""
+
+ENGLISH_OFFER = """Senior Data Engineer
+Globex is hiring a senior data engineer to build our streaming platform.
+Employment type: Permanent, full-time
+Salary: €65,000 - €75,000 per year + bonus
+Start date: March 2, 2026. Candidates with 5 years of experience preferred.
+Location: Berlin, Germany (hybrid)"""
+
+FREELANCE_OFFER = """Mission freelance : architecte cloud AWS
+Nous recherchons un architecte cloud pour une mission de 3 mois renouvelable chez notre client,
+un grand compte bancaire situé à Paris. TJM : 650 € par jour. Démarrage ASAP."""
+
+
+@pytest.mark.parametrize('text, expected', [
+    (CDD_OFFER, {
+        'company': 'Acme Solutions', 'position': 'Développeur Python', 'duration': '12 mois',
+        'start_date': '01/09/2024', 'contract_type': 'CDD', 'salary': '42 000 - 48 000 € par an',
+        'location': 'Lyon',
+    }),
+    (INTERNSHIP_OFFER, {
+        'company': 'Biocosmetiques-provence', 'position': 'Assistant(e) marketing digital',
+        'duration': '6 mois', 'start_date': '05/01/2026', 'contract_type': 'Stage',
+        'salary': "4,35 € de l'heure", 'location': 'Aix-en-Provence',
+    }),
+    (ENGLISH_OFFER, {
+        'company': 'Globex', 'position': 'senior data engineer', 'duration': None,
+        'start_date': '02/03/2026', 'contract_type': 'CDI', 'salary': '65 000 - 75 000 € par an',
+        'location': 'Berlin',
+    }),
+])
+def test_real_world_offers(text, expected):
+    assert extract_job_offer(text) == expected
+
+
+def test_freelance_mission():
+    fields = extract_job_offer(FREELANCE_OFFER)
+    assert fields['contract_type'] == 'Freelance'
+    assert fields['duration'] == '3 mois'
+    assert fields['salary'] == '650 €'
+    assert fields['location'] == 'Paris'
+    assert fields['start_date'] is None
+
+
+def test_missing_fields_are_none_and_batch_keeps_order():
+    empty = dict.fromkeys(['company', 'position', 'duration', 'start_date', 'contract_type', 'salary', 'location'])
+    assert extract_job_offer("") == empty
+    # Une date ou une expérience sans devise n'est pas un salaire
+    fields = extract_job_offer("Disponible le 1 September 2024, 10 ans d'expérience.")
+    assert fields['salary'] is None and fields['duration'] is None
+    assert [fields['company'] for fields in extract_job_offers([ENGLISH_OFFER, "", CDD_OFFER])] == [
+        'Globex', None, 'Acme Solutions'
+    ]
@@ -0,0 +1,83 @@
+"""Représentation intermédiaire d'une lettre (letter_ir) et ses rendus texte, HTML et Word."""
+from letter_ir import build_letter
+from letter_renderers import DocxLayout, HtmlRenderer, render_docx, render_text
+
+LETTER = {
+    'full_name': 'Jeanne Martin', 'address': '1 rue des Lilas', 'postal_code': '75001', 'city': 'Paris',
+    'phone': '0102030405', 'email': 'jeanne@example.com', 'company': 'Acme',
+    'company_address': '2 avenue de la Gare', 'company_postal_code': '69001', 'company_city': 'Lyon',
+    'date': '1 mars 2026', 'subject': 'Poste de développeuse',
+    'content': 'Je suis <bold>motivée</bold> & disponible.\n\n- Python\n- Flask',
+}
+CLOSING = "Je vous prie d'agréer, Madame, Monsieur, l'expression de mes salutations distinguées."
+
+
+def test_text():
+    assert render_text(build_letter(LETTER)) == (
+        "Jeanne Martin\n1 rue des Lilas\n75001 Paris\nTél : 0102030405\nEmail : jeanne@example.com\n\n"
+        "Acme\n2 avenue de la Gare\n69001 Lyon\n\n"
+        "Paris, le 1 mars 2026\n\n"
+        "Objet : Poste de développeuse\n\n"
+        "Madame, Monsieur,\n\n"
+        "Je suis motivée & disponible.\n\n"
+        "- Python\n- Flask\n\n"
+        f"{CLOSING}\n\n"
+        "Jeanne Martin\n"
+    )
+
+
+def test_html():
+    assert HtmlRenderer().render(build_letter(LETTER)).split("\n") == [
+        '<div class="paragraph-address"><p>Jeanne Martin</p>',
+        '<p>1 rue des Lilas</p>',
+        '<p>75001 Paris</p>',
+        '<p>Tél : 0102030405</p>',
+        '<p>Email : jeanne@example.com</p></div>',
+        '<div class="paragraph-address"><p>Acme</p>',
+        '<p>2 avenue de la Gare</p>',
+        '<p>69001 Lyon</p></div>',
+        '<div class="paragraph-date"><p>Paris, le 1 mars 2026</p></div>',
+        '<div class="paragraph-body text-bold"><p><strong>Objet : </strong>Poste de développeuse</p></div>',
+        '<div class="paragraph-greeting"><p>Madame, Monsieur,</p></div>',
+        '<div class="paragraph-body"><p>Je suis <strong>motivée</strong> &amp; disponible.</p></div>',
+        '<div class="text-bullet"><ul><li>Python</li>',
+        '<li>Flask</li></ul></div>',
+        f'<div class="paragraph-closing"><p>{CLOSING}</p></div>',
+        '<div class="text-signature"><p>Jeanne Martin</p></div>',
+    ]
+
+
+def test_docx():
+    document = render_docx(build_letter(LETTER), DocxLayout())
+    assert [(paragraph.text, paragraph.style.name) for paragraph in document.paragraphs] == [
+        ('Jeanne Martin', 'LetterAddress'),
+        ('1 rue des Lilas', 'LetterAddress'),
+        ('75001 Paris', 'LetterAddress'),
+        ('Tél : 0102030405', 'LetterAddress'),
+        ('Email : jeanne@example.com', 'LetterAddress'),
+        ('', 'Normal'),
+        ('Acme', 'LetterAddress'),
+        ('2 avenue de la Gare', 'LetterAddress'),
+        ('69001 Lyon', 'LetterAddress'),
+        ('', 'Normal'),
+        ('Paris, le 1 mars 2026', 'LetterDate'),
+        ('', 'Normal'),
+        ('Objet : Poste de développeuse', 'LetterSubject'),
+        ('', 'Normal'),
+        ('Madame, Monsieur,', 'LetterGreeting'),
+        ('', 'Normal'),
+        ('Je suis motivée & disponible.', 'LetterBody'),
+        ('Python', 'LetterList'),
+        ('Flask', 'LetterList'),
+        (CLOSING, 'LetterClosing'),
+        ('Jeanne Martin', 'LetterSignature'),
+    ]
+
+
+def test_greeting_and_closing_already_in_the_content_are_not_repeated():
+    letter = build_letter(dict(
+        LETTER, content="Madame,\n\nTexte.\n\nVeuillez agréer mes salutations distinguées."
+    ))
+    assert render_text(letter).split("\n\n")[4:] == [
+        "Madame,", "Texte.", "Veuillez agréer mes salutations distinguées.", "Jeanne Martin\n"
+    ]
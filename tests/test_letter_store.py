@@ -0,0 +1,66 @@
+"""Stockage adressé par contenu des lettres de l'historique (letter_store)."""
+import json
+
+from letter_store import LetterStore
+
+LETTER = (
+    "Madame, Monsieur, je vous adresse ma candidature au poste de {position} chez {company}. "
+    "Après cinq années passées à concevoir des applications web, à mettre en place l'intégration continue "
+    "et à accompagner des équipes produit, je souhaite rejoindre {company} pour contribuer à ses projets. "
+    "Rigoureux et curieux, je me forme en continu et je partage volontiers mes connaissances. "
+    "Je vous prie d'agréer, Madame, Monsieur, l'expression de mes salutations distinguées."
+)
+
+
+def letter(company, position="développeur Python", text=LETTER):
+    fields = {'company': company, 'position': position}
+    return text.format(**fields), fields
+
+
+def test_store_and_load_round_trip():
+    store = LetterStore()
+    letters = [letter("Acme"), letter("Globex", "chef de projet"),
+               letter("Initech", text=LETTER.replace("cinq années", "sept années")),
+               ("Lettre courte, sans champ à remplacer.", {'company': 'Umbrella', 'position': 'comptable'})]
+    keys = [store.put(content, fields) for content, fields in letters]
+
+    # Relecture dans un nouveau stockage, à partir des seuls corps sauvegardés
+    saved = json.loads(json.dumps(store.entries(key for key, _ in keys)))
+    reloaded = LetterStore()
+    reloaded.load(saved)
+    for (content, fields), (key, templated) in zip(letters, keys):
+        assert store.get(key, fields, templated) == content
+        assert reloaded.get(key, fields, templated) == content
+
+
+def test_shared_template_is_stored_once():
+    store = LetterStore()
+    keys = {store.put(*letter(f"Entreprise {number}")) for number in range(50)}
+    assert len(keys) == 1
+    key, templated = keys.pop()
+    assert templated and len(store.bodies) == 1
+    assert "{{company}}" in store.text(key)
+
+    # Un gabarit proche est rangé comme une différence par rapport au premier
+    variant, _ = store.put(*letter("Acme", text=LETTER.replace("cinq années", "sept années")))
+    assert store.bodies[variant]['base'] == key
+
+
+def test_deleting_a_letter_keeps_the_others(tmp_path, monkeypatch):
+    monkeypatch.setenv("MODEL_BACKEND", "stub")
+    from web_app import TemplateManager
+
+    manager = TemplateManager(str(tmp_path))
+    first = manager.add_to_history("Acme", "développeur Python", letter("Acme")[0])
+    manager.add_to_history("Initech", "développeur Python",
+                           letter("Initech", text=LETTER.replace("cinq années", "sept années"))[0])
+    manager.add_to_history("Umbrella", "comptable", "Lettre courte, sans champ à remplacer.")
+    expected = {item.company: item.content for item in manager.history if item is not first}
+    variant = manager.history[1].body
+    assert manager.letter_store.bodies[variant]['base'] == first.body
+
+    # Le corps de la lettre supprimée sert de base au delta d'une autre : il reste sauvegardé
+    manager.history.remove(first)
+    manager.save_data()
+    reloaded = TemplateManager(str(tmp_path))
+    assert {item.company: item.content for item in reloaded.history} == expected
@@ -0,0 +1,71 @@
+"""Analyse de la mise en forme (markup) : arbre, rendu HTML et segments des documents Word."""
+import markup
+
+
+def html(text):
+    return markup.render_html(markup.parse(text))
+
+
+def runs(text):
+    """Segments (texte, gras, italique, souligné) de chaque ligne"""
+    return [line.runs for line in markup.paragraphs(markup.parse(text))]
+
+
+def test_nested_tags():
+    text = "<bold>a <italic>b</italic> c</bold>"
+    assert html(text) == "<strong>a <em>b</em> c</strong>"
+    assert runs(text) == [[("a ", True, False, False), ("b", True, True, False), (" c", True, False, False)]]
+
+
+def test_crossing_tags_reopen_the_inner_style():
+    text = "<b>a <i>b</b> c</i>"
+    assert html(text) == "<strong>a <em>b</em></strong><em> c</em>"
+    assert runs(text) == [[("a ", True, False, False), ("b", True, True, False), (" c", False, True, False)]]
+
+
+def test_unclosed_editor_tag_runs_to_the_end():
+    assert html("a <bold>b\nc") == "a <strong>b\nc</strong>"
+    assert runs("a <bold>b\nc") == [[("a ", False, False, False), ("b", True, False, False)],
+                                     [("c", True, False, False)]]
+
+
+def test_unclosed_short_tags_stay_text():
+    assert html("5 <u> 6") == "5 <u> 6"
+    assert runs("5 <u> 6") == [[("5 <u> 6", False, False, False)]]
+    # Seule l'ouvrante qui a une fermante est appliquée
+    assert html("<u>a <u>b</u> c") == "<u>a <u>b</u> c"
+
+
+def test_stray_closing_tags_stay_text():
+    assert html("a </bold> b") == "a </bold> b"
+    assert runs("a </bold> b") == [[("a </bold> b", False, False, False)]]
+    assert html("x</u><u>y") == "x</u><u>y"
+
+
+def test_block_tags():
+    text = '<align="center">Titre</align>\n<spacing="1.5">Corps</spacing>'
+    assert html(text) == '<div style="text-align: center">Titre</div>\n<div style="line-height: 1.5">Corps</div>'
+    lines = markup.paragraphs(markup.parse(text))
+    assert (lines[0].align, lines[0].line_spacing) == ("center", None)
+    assert (lines[1].align, lines[1].line_spacing) == (None, 1.5)
+
+
+def test_html_and_word_document_follow_the_same_tree(tmp_path, monkeypatch):
+    monkeypatch.setenv("MODEL_BACKEND", "stub")
+    from docx import Document
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    import web_app
+
+    text = '<align="right"><b>Gras <i>et italique</b> italique</i></align>\nfin </u> libre'
+    assert web_app.process_text_formatting(text) == (
+        '<div style="text-align: right"><strong>Gras <em>et italique</em></strong><em> italique</em></div>\n'
+        'fin </u> libre'
+    )
+
+    path = web_app.create_word_document(text, str(tmp_path / "lettre.docx"))
+    first, second = Document(path).paragraphs
+    assert first.alignment == WD_ALIGN_PARAGRAPH.RIGHT
+    assert [(run.text, bool(run.bold), bool(run.italic)) for run in first.runs] == [
+        ("Gras ", True, False), ("et italique", True, True), (" italique", False, True)
+    ]
+    assert second.text == "fin </u> libre"
@@ -0,0 +1,47 @@
+"""Réutilisation du préfixe de prompt (model_backends)."""
+import os
+
+import pytest
+
+from model_backends import GPT4AllBackend, StubBackend
+
+PREFIX = "Tu es un assistant qui rédige des lettres de motivation en français.\n\n"
+
+
+def test_prefix_kept_across_unrelated_calls():
+    backend = StubBackend()
+    prompt = PREFIX + "Entreprise : Acme"
+    backend.generate(prompt, max_tokens=4, prefix=PREFIX)
+    # Un résumé ou un autre préfixe ne remplace pas les instructions partagées
+    backend.generate("Résume ce texte : ...", max_tokens=4)
+    backend.generate("Autre préfixe. Suite", max_tokens=4, prefix="Autre préfixe. ")
+    state, suffix = backend._split_prefix(prompt, PREFIX)
+    assert state is not None and suffix == "Entreprise : Acme"
+
+
+def test_prefix_slots_are_bounded():
+    backend = StubBackend()
+    for index in range(backend.prefix_slots + 2):
+        prefix = f"Préfixe {index}. "
+        backend.generate(prefix + "suite", max_tokens=1, prefix=prefix)
+    assert len(backend._prefix_states) == backend.prefix_slots
+    assert backend._split_prefix("Préfixe 0. suite", "Préfixe 0. ")[0] is None
+
+
+MODEL_PATH = os.getenv("GPT4ALL_TEST_MODEL")
+
+
+@pytest.mark.skipif(not MODEL_PATH or not os.path.exists(MODEL_PATH),
+                    reason="GPT4ALL_TEST_MODEL (fichier .gguf) non défini")
+def test_gpt4all_prefix_reuse_matches_full_prompt():
+    backend = GPT4AllBackend(MODEL_PATH, n_ctx=512).load()
+    try:
+        assert backend.prefix_supported
+        prompt = PREFIX + "Écris la première phrase d'une lettre pour un poste de développeur."
+        greedy = dict(max_tokens=16, temp=0.0, top_k=1, top_p=1.0, repeat_penalty=1.0)
+        full = backend.generate(prompt, **greedy)
+        evaluated = backend.generate(prompt, prefix=PREFIX, **greedy)
+        reused = backend.generate(prompt, prefix=PREFIX, **greedy)
+        assert full == evaluated == reused
+    finally:
+        backend.close()
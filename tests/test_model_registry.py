@@ -0,0 +1,43 @@
+"""Registre des modèles (model_registry)."""
+import time
+
+import pytest
+
+import model_registry
+from model_registry import ModelRegistry, ModelSpec
+
+
+class FakeBackend:
+    def close(self):
+        pass
+
+
+def test_failed_load_is_retried_after_the_delay(monkeypatch):
+    attempts = []
+
+    def create_backend(path, backend, **options):
+        attempts.append(path)
+        if len(attempts) == 1:
+            raise MemoryError("mémoire insuffisante")
+        return FakeBackend()
+
+    monkeypatch.setattr(model_registry, "create_backend", create_backend)
+    registry = ModelRegistry(memory_budget_bytes=1 << 30, default="rapide", retry_after=0.2)
+    registry.register(ModelSpec("rapide", "rapide.gguf", backend="stub", memory_mb=1))
+
+    with pytest.raises(MemoryError):
+        with registry.use():
+            pass
+    # Pendant le délai, l'erreur est renvoyée sans nouveau chargement
+    assert not registry.available()
+    with pytest.raises(RuntimeError, match="mémoire insuffisante"):
+        with registry.use():
+            pass
+    assert len(attempts) == 1
+
+    time.sleep(0.25)
+    assert registry.available()
+    with registry.use() as backend:
+        assert isinstance(backend, FakeBackend)
+    assert len(attempts) == 2
+    assert registry.stats()['models']['rapide']['error'] is None
@@ -0,0 +1,62 @@
+"""Quasi-doublons dans une bibliothèque de lettres presque identiques (near_duplicates)."""
+from near_duplicates import NearDuplicateIndex, MAX_BUCKET_SIZE
+
+LETTER = (
+    "Madame, Monsieur, je vous adresse ma candidature au poste de développeur Python au sein de {company}. "
+    "Fort de cinq années d'expérience dans le développement d'applications web, j'ai conçu des API REST, "
+    "mis en place l'intégration continue et accompagné des équipes dans l'adoption des tests automatisés. "
+    "Votre entreprise {company} porte des projets ambitieux qui correspondent à mes aspirations et je serais "
+    "heureux de contribuer à leur réussite. Au cours de mes précédentes missions, j'ai appris à travailler "
+    "avec des équipes produit exigeantes, à prioriser les besoins des utilisateurs et à livrer régulièrement "
+    "des versions stables. Rigoureux et curieux, je me forme en continu aux nouvelles pratiques de qualité "
+    "logicielle et je partage volontiers mes connaissances. Je reste à votre disposition pour un entretien. "
+    "Je vous prie d'agréer, Madame, Monsieur, l'expression de mes salutations distinguées."
+)
+COUNT = 200
+assert COUNT > MAX_BUCKET_SIZE
+
+
+def mail_merge_index():
+    index = NearDuplicateIndex()
+    flagged = sum(bool(index.add(number, LETTER.format(company=f"Entreprise {number}"))) for number in range(COUNT))
+    return index, flagged
+
+
+def test_large_mail_merge_is_detected():
+    index, flagged = mail_merge_index()
+    assert flagged == COUNT - 1
+    assert len(index.groups()) == 1 and len(index.groups()[0]) == COUNT
+    assert index.dedupe(range(COUNT)) == [0]
+    assert index.duplicates_of(COUNT - 1)
+
+
+def test_remove_keeps_the_cluster_indexed():
+    index, _ = mail_merge_index()
+    # Le représentant de la grappe et la plupart des membres disparaissent
+    for number in range(COUNT - 2):
+        index.remove(number)
+    assert sorted(index.groups()[0]) == [COUNT - 2, COUNT - 1]
+    assert index.add("nouvelle", LETTER.format(company="Nouvelle entreprise"))
+    assert not index.add("autre", "Une lettre sans rapport pour un poste de comptable à Lyon, rédigée autrement.")
+
+
+def test_merge_keeps_chained_members_unlike_the_kept_template(tmp_path, monkeypatch):
+    monkeypatch.setenv("MODEL_BACKEND", "stub")
+    from datetime import datetime, timedelta
+    from web_app import TemplateManager
+
+    # Chaque version décale le texte de cinq mots : voisines proches, extrémités éloignées
+    words = [f"mot{number}" for number in range(200)]
+    manager = TemplateManager(str(tmp_path))
+    for version in range(6):
+        template = manager.add_template(f"version {version}", " ".join(words[5 * version:5 * version + 100]))
+        template.updated_at = datetime(2026, 1, 1) + timedelta(days=version)
+    index = manager.template_duplicates()
+    assert len(index.groups()) == 1 and len(index.groups()[0]) == 6
+    assert not index.is_duplicate("version 5", "version 0")
+
+    merged = {name for name in manager.templates if name != "version 5" and index.is_duplicate("version 5", name)}
+    remaining = set(manager.templates) - merged
+    assert manager.merge_duplicates() == {'templates': len(merged), 'history': 0}
+    assert set(manager.templates) == remaining
+    assert "version 0" in manager.templates and "version 5" in manager.templates
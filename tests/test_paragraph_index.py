@@ -0,0 +1,58 @@
+"""Index des paragraphes (paragraph_index) comparé à un calcul direct des scores."""
+import random
+
+import numpy as np
+
+from paragraph_index import ParagraphIndex
+
+WORDS = ("python flask données équipe projet client gestion analyse vente marketing api rest tests "
+         "qualité logiciel développement web produit agile autonomie rigueur curiosité communication "
+         "leadership formation budget stratégie innovation recherche santé finance industrie").split()
+
+
+def brute_force(index, vectors, query, k):
+    """Scores recalculés à partir des vecteurs de chaque paragraphe : {clé: score} des k meilleurs"""
+    columns, weights = index.vectorize(query)
+    df = np.zeros(index.n_features)
+    for doc_columns, _ in vectors.values():
+        df[doc_columns] += 1
+    query_weights = dict(zip(columns, weights * (np.log((1.0 + len(vectors)) / (1.0 + df[columns])) + 1.0)))
+    scores = {}
+    for key, (doc_columns, doc_weights) in vectors.items():
+        score = sum(float(w) * query_weights[c] for c, w in zip(doc_columns, doc_weights) if c in query_weights)
+        if score > 0:
+            scores[key] = score
+    return sorted(scores.values(), reverse=True)[:k], scores
+
+
+def test_add_edit_remove_match_brute_force():
+    rng = random.Random(7)
+    # Petite capacité : agrandissements, compactages et reconstructions de l'ordre par colonne
+    index = ParagraphIndex(capacity=64)
+    vectors = {}
+
+    def text():
+        return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 25)))
+
+    for step in range(3000):
+        key = f"paragraphe {rng.randrange(150)}"
+        if step == 1500:
+            index.clear()
+            vectors.clear()
+        elif rng.random() < 0.75:
+            # Ajout, ou modification si la clé existe déjà
+            content = text()
+            index.add(key, content)
+            vectors[key] = index.vectorize(content)
+        else:
+            index.remove(key)
+            vectors.pop(key, None)
+
+        if step % 50 == 0:
+            assert len(index) == len(vectors)
+            query, k = text(), rng.randint(1, 10)
+            expected, scores = brute_force(index, vectors, query, k)
+            results = index.search(query, k)
+            assert np.allclose([score for _, score in results], expected, rtol=1e-4, atol=1e-6)
+            for key, score in results:
+                assert np.isclose(score, scores[key], rtol=1e-4, atol=1e-6)
@@ -0,0 +1,58 @@
+"""Espace de travail temporaire des requêtes (scratch)."""
+import os
+import time
+
+import pytest
+
+from cancellation import Cancelled, CancellationToken
+from scratch import ScratchSpace
+
+
+@pytest.fixture
+def scratch(tmp_path):
+    # Sans balayage périodique : sweep() est appelé par les tests
+    return ScratchSpace(root=str(tmp_path), max_age=60, sweep_interval=0)
+
+
+def write_file(directory, name="lettre.docx"):
+    with open(os.path.join(directory, name), 'wb') as f:
+        f.write(b"contenu")
+
+
+def test_directory_is_removed_after_an_error(scratch):
+    with pytest.raises(ValueError):
+        with scratch.directory() as path:
+            write_file(path)
+            raise ValueError("conversion impossible")
+    assert not os.path.exists(path)
+    assert os.listdir(scratch.root) == []
+
+
+def test_directory_is_removed_after_a_cancellation(scratch):
+    token = CancellationToken()
+    with pytest.raises(Cancelled):
+        with scratch.directory(prefix="export") as path:
+            write_file(path)
+            token.cancel("client_disconnected")
+            token.check()
+    assert not os.path.exists(path)
+    assert os.listdir(scratch.root) == []
+
+
+def test_sweep_spares_active_and_recent_directories(scratch):
+    old = time.time() - 3600
+    orphan = os.path.join(scratch.root, "request-orphelin")
+    os.mkdir(orphan)
+    write_file(orphan)
+    recent = os.path.join(scratch.root, "request-recent")
+    os.mkdir(recent)
+    os.utime(orphan, (old, old))
+
+    with scratch.directory() as path:
+        write_file(path)
+        # Un dossier en cours d'utilisation n'est jamais supprimé, même ancien
+        os.utime(path, (old, old))
+        assert scratch.sweep() == 1
+        assert os.path.exists(os.path.join(path, "lettre.docx"))
+        assert os.path.isdir(recent) and not os.path.exists(orphan)
+    assert not os.path.exists(path)
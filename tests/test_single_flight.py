@@ -0,0 +1,50 @@
+"""Diffusion des tokens d'une génération partagée (single_flight)."""
+import time
+import threading
+
+from cancellation import CancellationToken
+from single_flight import SingleFlight
+
+
+def slow_generation(chunks, delay=0.01):
+    """Publie les tokens un par un : les abonnés les reçoivent en plusieurs lots"""
+    def run(publish, abandoned):
+        for chunk in chunks:
+            time.sleep(delay)
+            publish(chunk)
+        return "".join(chunks)
+    return run
+
+
+def test_stream_with_cancellation_token_reads_several_batches():
+    chunks = [f"mot{index} " for index in range(20)]
+    flight = SingleFlight(timeout=5)
+    token = CancellationToken.with_timeout(5)
+    assert list(flight.stream("clé", slow_generation(chunks), token)) == chunks
+
+
+def test_subscribers_share_the_stream():
+    chunks = [f"mot{index} " for index in range(10)]
+    flight = SingleFlight(timeout=5)
+    received = []
+    leader = flight.stream("clé", slow_generation(chunks), CancellationToken.with_timeout(5))
+    first = next(leader)
+    follower = threading.Thread(target=lambda: received.extend(
+        flight.stream("clé", slow_generation(["autre"]), CancellationToken.with_timeout(5))))
+    follower.start()
+    assert [first] + list(leader) == chunks
+    follower.join()
+    assert received == chunks
+
+
+def test_generate_stream_route(monkeypatch):
+    monkeypatch.setenv("MODEL_BACKEND", "stub")
+    monkeypatch.setenv("STUB_TOKENS_PER_SECOND", "1000")
+    import web_app
+
+    client = web_app.app.test_client()
+    response = client.post('/generate/stream', json={
+        'company': 'Acme', 'position': 'développeur', 'template': '', 'bypass_cache': True
+    })
+    assert response.status_code == 200
+    assert response.data.decode('utf-8').rstrip().endswith("salutations distinguées.")
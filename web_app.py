@@ -1,18 +1,39 @@
-from flask import Flask, render_template, request, jsonify, send_file
-from gpt4all import GPT4All
+from flask import Flask, render_template, request, jsonify, send_file, Response
 import os
 import io
-import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime
 from docx import Document
 from docx.shared import Cm, Inches, Pt, Mm
 from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx2pdf import convert
 import json
 import re
 import dotenv
 from dotenv import load_dotenv
 
+from model_registry import ModelRegistry
+from prompt_builder import PromptBuilder, replace_markers
+from stop_detection import StopDetector, stop_sequences_from_env
+from generation_cache import GenerationCache
+from single_flight import SingleFlight, FileLockCoordinator
+from metrics import metrics
+from cancellation import CancellationToken, Cancelled
+from conversion import convert_to_pdf
+from scratch import scratch_space
+import markup
+import stylesheets
+from condensation import Condenser, iter_sections
+from job_offer_extractor import extract_job_offer, extract_job_offers
+from paragraph_index import ParagraphIndex
+from near_duplicates import NearDuplicateIndex
+from letter_store import LetterStore
+from artifact_cache import ArtifactCache
+from letter_ir import build_letter
+from letter_renderers import DocxLayout, HtmlRenderer, render_docx, render_html_document, render_text
+from docx_writer import render_docx_bytes
+
 # Charger les variables d'environnement
 load_dotenv()
 
@@ -344,8 +365,29 @@ class LetterGenerator:
             "first_line_indent": None
         }]
         
-        # Initialiser le modèle
-        self.llm = None
+        # Registre des modèles disponibles (chargés et déchargés à la demande)
+        self.models = ModelRegistry.from_env()
+        
+        # Paramètres d'échantillonnage et cache des générations
+        self.generation_params = {
+            "max_tokens": 2000,
+            "temp": 0.7,
+            "top_k": 40,
+            "top_p": 0.4,
+            "repeat_penalty": 1.18
+        }
+        self.stop_sequences = stop_sequences_from_env()
+        self.max_paragraphs = int(os.getenv("MAX_PARAGRAPHS", "10"))
+        # Nombre maximal de variantes d'une lettre générées par requête (champ n)
+        self.max_candidates = int(os.getenv("MAX_CANDIDATES", "4"))
+        self.prompt_builder = PromptBuilder(max_tokens=self.generation_params["max_tokens"])
+        self.generation_cache = GenerationCache.from_env()
+        # Résumé des textes trop longs pour la fenêtre de contexte
+        self.condenser = Condenser.from_env()
+        
+        # Regroupement des générations identiques simultanées (threads et workers)
+        self.single_flight = SingleFlight(timeout=float(os.getenv("SINGLE_FLIGHT_TIMEOUT", "130")))
+        self.coordinator = FileLockCoordinator.from_env()
         
         # Créer un dossier pour sauvegarder les données si nécessaire
         self.save_dir = os.path.join(os.path.expanduser("~"), ".lettre_motivation_ai")
@@ -371,6 +413,11 @@ class LetterGenerator:
         }
         self.custom_templates.update(self.default_templates)
         
+        # Index de recherche des paragraphes par similarité avec l'offre
+        self.paragraph_index = ParagraphIndex()
+        for name, content in self.custom_templates.items():
+            self.paragraph_index.add(name, content)
+        
         # Définir les couleurs des marqueurs
         self.marker_colors = {
             "company": "#34C759",     # Vert clair pour l'entreprise
@@ -383,8 +430,10 @@ class LetterGenerator:
     
     def load_model(self):
         try:
-            model_path = os.getenv("MODEL_PATH", "ggml-gpt4all-j-v1.3-groovy.bin")
-            self.llm = GPT4All(model_path)
+            # Le modèle par défaut est chargé au démarrage, les autres à la demande ;
+            # aucune référence n'est conservée : le registre peut le décharger
+            with self.models.use():
+                pass
             return True
         except Exception as e:
             print(f"Erreur lors du chargement du modèle : {str(e)}")
@@ -399,47 +448,221 @@ class LetterGenerator:
             print(f"Erreur lors du chargement des modèles : {str(e)}")
             self.custom_templates = {}
 
-    def generate_letter(self, data):
-        if not self.llm:
-            return "Erreur : Le modèle n'est pas chargé."
-
-        # Remplacer les marqueurs par les valeurs
-        template = data.get('template', '')
-        for key, value in data.items():
-            if key != 'template' and value:
-                template = template.replace(f'[[{key}]]', value)
-
-        # Si le template est vide, utiliser le prompt par défaut
-        if not template.strip():
-            prompt = f"""En tant qu'expert en rédaction de lettres de motivation, génère une lettre de motivation professionnelle et persuasive pour le poste de {data['position']} chez {data['company']}.
-
-Informations supplémentaires :
-- Type de contrat : {data['duration']}
-- Date de début : {data['start_date']}
-- Paragraphe personnalisé : {data['custom_paragraph']}
-
-La lettre doit être formelle, bien structurée et mettre en avant les compétences et la motivation du candidat.
-Utilise le paragraphe personnalisé pour adapter la lettre au poste et à l'entreprise.
-N'inclus pas la mise en page (date, adresse, etc.) dans la réponse."""
+    def plan_prompt(self, data, model, llm):
+        """Construire le prompt et dimensionner max_tokens selon le contexte du modèle"""
+        return self.prompt_builder.build(data, llm, model.n_ctx)
+
+    def request_stop_sequences(self, data):
+        """Séquences d'arrêt propres à la requête (champ stop : texte ou liste de textes)"""
+        extra = data.get('stop') or []
+        if isinstance(extra, str):
+            extra = [extra]
+        if not isinstance(extra, list) or not all(isinstance(s, str) and s for s in extra):
+            raise ValueError("Le champ stop doit être un texte ou une liste de textes non vides")
+        return extra
+
+    def _stop_sequences(self, data):
+        """Séquences d'arrêt par défaut et propres à la requête"""
+        return self.stop_sequences + self.request_stop_sequences(data)
+
+    def _cached_generation(self, data, prompt, model, params):
+        """Renvoyer (clé de cache, réponse en cache ou None)"""
+        cache_key = self.generation_cache.make_key(
+            prompt, model.model_id, dict(params, stop=self._stop_sequences(data))
+        )
+        # Réutiliser une génération identique, sauf si une nouvelle variante est demandée
+        if data.get('bypass_cache'):
+            metrics.increment("generation_cache.bypasses")
+            return cache_key, None
+        return cache_key, self.generation_cache.get(cache_key)
+
+    def _run_generation(self, model, plan, params, stop_sequences, cache_key, publish, abandoned):
+        """Exécuter l'inférence (appelé une seule fois par groupe de requêtes identiques).
+
+        La génération s'interrompt quand abandoned() devient vrai, c'est-à-dire
+        quand toutes les requêtes qui l'attendent ont été annulées.
+        """
+        coordination = self.coordinator.hold(cache_key, abandoned) if self.coordinator else nullcontext(True)
+        with coordination as leader, self.models.use(model.name) as llm:
+            if self.coordinator:
+                # Un autre worker a pu générer la même lettre pendant l'attente ou juste
+                # avant la prise du verrou : relire le cache partagé
+                cached = self.generation_cache.get(cache_key)
+                if cached is not None:
+                    if leader:
+                        metrics.increment("single_flight.cross_worker_late_hits")
+                    publish(cached)
+                    return {'content': cached, 'stop_reason': None, 'tokens_saved': 0}
+
+            # Arrêter dès que la lettre est terminée plutôt qu'à max_tokens
+            detector = StopDetector(stop_sequences, max_paragraphs=self.max_paragraphs)
+
+            def on_token(token_id, token):
+                if abandoned():
+                    return False
+                chunk = detector.push(token)
+                if chunk:
+                    publish(chunk)
+                return not detector.stopped
+
+            # Les instructions fixes en tête du prompt ne sont évaluées qu'une fois par modèle
+            llm.generate(prompt=plan.prompt, prefix=plan.prefix, callback=on_token, **params)
+            if abandoned():
+                # Plus personne n'attend la lettre : elle est incomplète et n'est pas mise en cache
+                metrics.increment("cancellation.generations")
+                metrics.increment("cancellation.tokens_generated", detector.tokens)
+                metrics.increment("cancellation.tokens_avoided", max(0, params['max_tokens'] - detector.tokens))
+                raise Cancelled("abandoned")
+            remaining = detector.flush()
+            if remaining:
+                publish(remaining)
+
+            response = detector.result()
+            tokens_saved = detector.tokens_saved(params['max_tokens'])
+            if detector.stopped:
+                metrics.increment(f"generation.stop.{detector.stop_reason}")
+                metrics.increment("generation.tokens_saved", tokens_saved)
+            self.generation_cache.set(cache_key, response)
+            return {'content': response, 'stop_reason': detector.stop_reason, 'tokens_saved': tokens_saved}
+
+    def candidate_count(self, data):
+        """Nombre de variantes demandées (champ n), borné par MAX_CANDIDATES"""
+        try:
+            n = int(data.get('n') or 1)
+        except (TypeError, ValueError):
+            raise ValueError("Le champ n doit être un entier")
+        if not 1 <= n <= self.max_candidates:
+            raise ValueError(f"Le nombre de variantes doit être compris entre 1 et {self.max_candidates}")
+        return n
+
+    def condense_inputs(self, data, model, llm, token=None):
+        """Résumer le paragraphe personnalisé s'il ne tient pas dans le contexte du modèle"""
+        custom = data.get('custom_paragraph')
+        if not custom or not isinstance(custom, str):
+            return data
+        budget = self.prompt_builder.field_budget(llm, data, model.n_ctx)
+        if llm.count_tokens(custom) <= budget:
+            return data
+
+        with self.models.use(self.condenser.model or model.name) as summarizer:
+            condensed = self.condenser.condense(
+                custom, summarizer, budget,
+                trim=lambda text, limit: self.prompt_builder.trim_text(llm, text, limit),
+                token=token
+            )
+        return dict(data, custom_paragraph=condensed)
+
+    def _candidate_plans(self, data, model, llm, n, token=None):
+        """Prompt de chaque variante et paramètres d'échantillonnage associés"""
+        data = self.condense_inputs(data, model, llm, token)
+        # Les variantes reprennent après les instructions partagées (plan.prefix) : seule
+        # la partie variable du prompt est évaluée pour chacune
+        plan = self.plan_prompt(data, model, llm)
+        params = dict(self.generation_params, max_tokens=plan.max_tokens)
+        # La première variante est la génération habituelle (même entrée de cache)
+        return plan, [params] + [dict(params, seed=index) for index in range(1, n)]
+
+    def _generate_candidate(self, data, model, plan, params, stop_sequences, token=None):
+        cache_key, cached = self._cached_generation(data, plan.prompt, model, params)
+        if cached is not None:
+            result = {'content': cached, 'stop_reason': None, 'tokens_saved': 0}
         else:
-            prompt = template
-
-        response = self.llm.generate(
-            prompt=prompt,
-            max_tokens=2000,
-            temp=0.7,
-            top_k=40,
-            top_p=0.4,
-            repeat_penalty=1.18
+            # Les requêtes identiques simultanées partagent la même génération
+            result = self.single_flight.do(
+                cache_key,
+                lambda publish, abandoned: self._run_generation(
+                    model, plan, params, stop_sequences, cache_key, publish, abandoned
+                ),
+                token
+            )
+        return dict(result, cached=cached is not None)
+
+    def generate(self, data, token=None):
+        """Générer une lettre ; renvoie le texte et le décompte des tokens.
+
+        Avec n > 1, les variantes sont renvoyées dans 'candidates' et la
+        première est aussi renvoyée au premier niveau. Lève Cancelled si le
+        jeton d'annulation `token` est annulé avant la fin.
+        """
+        # Modèle choisi par la requête, sinon modèle par défaut
+        model = self.models.resolve(data.get('model'))
+        n = self.candidate_count(data)
+        if not self.models.available(model.name):
+            return {'content': "Erreur : Le modèle n'est pas chargé.", 'tokens': None}
+
+        with self.models.use(model.name) as llm:
+            plan, candidate_params = self._candidate_plans(data, model, llm, n, token)
+            stop_sequences = self._stop_sequences(data)
+
+            candidates = []
+            for params in candidate_params:
+                if token is not None:
+                    token.check()
+                result = self._generate_candidate(data, model, plan, params, stop_sequences, token)
+                tokens = plan.token_report(llm.count_tokens(result['content']))
+                tokens['saved'] = result['tokens_saved']
+                candidates.append({
+                    'content': result['content'],
+                    'cached': result['cached'],
+                    'stop_reason': result['stop_reason'],
+                    'tokens': tokens
+                })
+
+            response = dict(candidates[0], model=model.name)
+            if n > 1:
+                response['candidates'] = candidates
+            return response
+
+    def generate_letter(self, data):
+        return self.generate(data)['content']
+
+    def _stream_candidate(self, data, model, plan, params, stop_sequences, token=None):
+        cache_key, cached = self._cached_generation(data, plan.prompt, model, params)
+        if cached is not None:
+            yield cached
+            return
+
+        yield from self.single_flight.stream(
+            cache_key,
+            lambda publish, abandoned: self._run_generation(
+                model, plan, params, stop_sequences, cache_key, publish, abandoned
+            ),
+            token
         )
 
-        return response
+    def stream_letter(self, data, token=None):
+        """Générer la lettre token par token.
+
+        Avec n > 1, chaque ligne est un objet JSON {"candidate": i, "text": ...}
+        et les variantes sont envoyées l'une après l'autre.
+        """
+        model = self.models.resolve(data.get('model'))
+        n = self.candidate_count(data)
+        if not self.models.available(model.name):
+            yield "Erreur : Le modèle n'est pas chargé."
+            return
+
+        with self.models.use(model.name) as llm:
+            plan, candidate_params = self._candidate_plans(data, model, llm, n, token)
+        stop_sequences = self._stop_sequences(data)
+
+        if n == 1:
+            yield from self._stream_candidate(data, model, plan, candidate_params[0], stop_sequences, token)
+            return
+        for index, params in enumerate(candidate_params):
+            for chunk in self._stream_candidate(data, model, plan, params, stop_sequences, token):
+                yield json.dumps({'candidate': index, 'text': chunk}, ensure_ascii=False) + "\n"
+
+    def replace_markers(self, template, data):
+        """Remplacer les marqueurs [[champ]] du modèle par les valeurs fournies"""
+        return replace_markers(template, data)
 
     def add_template(self, name, content):
         """Ajouter un nouveau modèle."""
         if name in self.custom_templates:
             return False, "Ce nom de modèle existe déjà."
         self.custom_templates[name] = content
+        self.paragraph_index.add(name, content)
         self.save_custom_templates()
         return True, "Modèle ajouté avec succès."
     
@@ -448,6 +671,7 @@ N'inclus pas la mise en page (date, adresse, etc.) dans la réponse."""
         if name not in self.custom_templates:
             return False, "Ce modèle n'existe pas."
         self.custom_templates[name] = content
+        self.paragraph_index.add(name, content)
         self.save_custom_templates()
         return True, "Modèle modifié avec succès."
     
@@ -456,12 +680,17 @@ N'inclus pas la mise en page (date, adresse, etc.) dans la réponse."""
         if name not in self.custom_templates or name in self.default_templates:
             return False, "Impossible de supprimer ce modèle."
         del self.custom_templates[name]
+        self.paragraph_index.remove(name)
         self.save_custom_templates()
         return True, "Modèle supprimé avec succès."
     
     def get_templates(self):
         """Récupérer tous les modèles."""
         return self.custom_templates
+    
+    def recommend_templates(self, text, k=5):
+        """Paragraphes les plus proches de l'offre ou du poste : [(nom, score)]"""
+        return self.paragraph_index.search(text, k)
 
     def save_custom_templates(self):
         with open(self.templates_file, 'w', encoding='utf-8') as f:
@@ -482,6 +711,9 @@ class LetterHistory:
         self.position = position
         self.content = content
         self.generated_at = generated_at or datetime.now()
+        # Empreinte du corps dans le LetterStore (attribuée à la sauvegarde)
+        self.body = None
+        self.templated = True
 
 class TemplateManager:
     def __init__(self, save_dir):
@@ -490,6 +722,13 @@ class TemplateManager:
         self.history_file = os.path.join(save_dir, "history.json")
         self.templates = {}
         self.history = []
+        self.index = ParagraphIndex()
+        self.letter_store = LetterStore()
+        # Index des quasi-doublons, construits à la première utilisation
+        self._template_duplicates = None
+        self._history_duplicates = None
+        # Quasi-doublons signalés à l'ajout : nom du modèle ou lettre -> [(élément similaire, similarité)]
+        self.flagged_duplicates = {}
         self.load_data()
 
     def load_data(self):
@@ -501,11 +740,12 @@ class TemplateManager:
                     for template_data in data:
                         template = Template(**template_data)
                         self.templates[template.name] = template
+                        self.index.add(template.name, template.content)
 
             if os.path.exists(self.history_file):
                 with open(self.history_file, 'r', encoding='utf-8') as f:
                     data = json.load(f)
-                    self.history = [LetterHistory(**item) for item in data]
+                    self.history = self._load_history(data)
         except Exception as e:
             print(f"Erreur lors du chargement des données : {e}")
 
@@ -515,7 +755,7 @@ class TemplateManager:
             # Sauvegarder les modèles
             templates_data = []
             for template in self.templates.values():
-                template_dict = template.__dict__
+                template_dict = dict(template.__dict__)
                 template_dict['created_at'] = template_dict['created_at'].isoformat()
                 template_dict['updated_at'] = template_dict['updated_at'].isoformat()
                 templates_data.append(template_dict)
@@ -523,19 +763,77 @@ class TemplateManager:
             with open(self.templates_file, 'w', encoding='utf-8') as f:
                 json.dump(templates_data, f, ensure_ascii=False, indent=4)
 
-            # Sauvegarder l'historique
-            history_data = []
+            # Sauvegarder l'historique : les corps de lettres sont rangés une fois par empreinte
+            letters = []
             for item in self.history:
-                item_dict = item.__dict__
-                item_dict['generated_at'] = item_dict['generated_at'].isoformat()
-                history_data.append(item_dict)
+                self._store_letter(item)
+                letter = {
+                    'company': item.company,
+                    'position': item.position,
+                    'generated_at': item.generated_at.isoformat(),
+                    'body': item.body
+                }
+                if not item.templated:
+                    letter['raw'] = True
+                letters.append(letter)
 
             with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(history_data, f, ensure_ascii=False, indent=4)
+                f.write(json.dumps({
+                    'version': 2,
+                    'bodies': self.letter_store.entries(item.body for item in self.history),
+                    'letters': letters
+                }, ensure_ascii=False, separators=(',', ':')))
 
         except Exception as e:
             print(f"Erreur lors de la sauvegarde des données : {e}")
 
+    def _load_history(self, data):
+        """Reconstituer l'historique (liste de lettres complètes pour l'ancien format)"""
+        if isinstance(data, list):
+            return [LetterHistory(item['company'], item['position'], item['content'],
+                                  datetime.fromisoformat(item['generated_at']))
+                    for item in data]
+
+        self.letter_store.load(data['bodies'])
+        texts = {}
+        history = []
+        for letter in data['letters']:
+            key = letter['body']
+            if key not in texts:
+                texts[key] = self.letter_store.text(key)
+            fields = {'company': letter['company'], 'position': letter['position']}
+            templated = not letter.get('raw')
+            content = LetterStore.fill(texts[key], fields) if templated else texts[key]
+            item = LetterHistory(letter['company'], letter['position'], content,
+                                 datetime.fromisoformat(letter['generated_at']))
+            item.body, item.templated = key, templated
+            history.append(item)
+        return history
+
+    def _store_letter(self, item):
+        if item.body is None:
+            item.body, item.templated = self.letter_store.put(
+                item.content, {'company': item.company, 'position': item.position}
+            )
+
+    def history_storage(self):
+        """Place occupée par les corps de lettres, avec et sans stockage par empreinte"""
+        for item in self.history:
+            self._store_letter(item)
+        entries = self.letter_store.entries(item.body for item in self.history)
+        content_bytes = sum(len(item.content.encode('utf-8')) for item in self.history)
+        stored_bytes = LetterStore.stored_size(entries)
+        metrics.set_gauge("history.content_bytes", content_bytes)
+        metrics.set_gauge("history.stored_bytes", stored_bytes)
+        return {
+            'letters': len(self.history),
+            'bodies': len(entries),
+            'deltas': sum(1 for entry in entries.values() if not isinstance(entry, str)),
+            'content_bytes': content_bytes,
+            'stored_bytes': stored_bytes,
+            'saving': round(1 - stored_bytes / content_bytes, 4) if content_bytes else 0.0
+        }
+
     def add_template(self, name, content, category="General", tags=None):
         """Ajouter un nouveau modèle"""
         if name in self.templates:
@@ -543,6 +841,8 @@ class TemplateManager:
         
         template = Template(name, content, category, tags)
         self.templates[name] = template
+        self.index.add(name, content)
+        self._flag_duplicates(name, self.template_duplicates().add(name, content), "templates")
         self.save_data()
         return template
 
@@ -554,6 +854,9 @@ class TemplateManager:
         template = self.templates[name]
         if content is not None:
             template.content = content
+            self.index.add(name, content)
+            if self._template_duplicates is not None:
+                self._template_duplicates.add(name, content)
         if category is not None:
             template.category = category
         if tags is not None:
@@ -569,23 +872,36 @@ class TemplateManager:
             raise ValueError(f"Aucun modèle trouvé avec le nom '{name}'")
         
         del self.templates[name]
+        self.index.remove(name)
+        if self._template_duplicates is not None:
+            self._template_duplicates.remove(name)
+        self._unflag([name])
         self.save_data()
 
     def get_templates_by_category(self, category):
         """Récupérer tous les modèles d'une catégorie"""
         return [t for t in self.templates.values() if t.category == category]
 
-    def search_templates(self, query):
-        """Rechercher des modèles par nom ou tags"""
+    def search_templates(self, query, dedupe=True):
+        """Rechercher des modèles par nom ou tags (sans les quasi-doublons si dedupe)"""
         query = query.lower()
-        return [t for t in self.templates.values() 
-                if query in t.name.lower() 
-                or any(query in tag.lower() for tag in t.tags)]
+        results = [t for t in self.templates.values() 
+                   if query in t.name.lower() 
+                   or any(query in tag.lower() for tag in t.tags)]
+        if dedupe and len(results) > 1:
+            kept = set(self.template_duplicates().dedupe([t.name for t in results]))
+            results = [t for t in results if t.name in kept]
+        return results
+
+    def recommend_templates(self, text, k=5):
+        """Modèles les plus proches de l'offre ou du poste : [(modèle, score)]"""
+        return [(self.templates[name], score) for name, score in self.index.search(text, k)]
 
     def add_to_history(self, company, position, content):
         """Ajouter une lettre à l'historique"""
         history_item = LetterHistory(company, position, content)
         self.history.append(history_item)
+        self._flag_duplicates(history_item, self.history_duplicates().add(history_item, content), "history")
         self.save_data()
         return history_item
 
@@ -595,25 +911,110 @@ class TemplateManager:
                      key=lambda x: x.generated_at, 
                      reverse=True)[:limit]
 
-    def search_history(self, query):
-        """Rechercher dans l'historique"""
+    def search_history(self, query, dedupe=True):
+        """Rechercher dans l'historique (sans les quasi-doublons si dedupe)"""
         query = query.lower()
-        return [h for h in self.history 
-                if query in h.company.lower() 
-                or query in h.position.lower() 
-                or query in h.content.lower()]
+        results = [h for h in self.history 
+                   if query in h.company.lower() 
+                   or query in h.position.lower() 
+                   or query in h.content.lower()]
+        if dedupe and len(results) > 1:
+            kept = set(map(id, self.history_duplicates().dedupe(results)))
+            results = [h for h in results if id(h) in kept]
+        return results
 
     def clear_history(self):
         """Effacer l'historique"""
+        self._unflag([item for item in self.flagged_duplicates if not isinstance(item, str)])
         self.history = []
+        self._history_duplicates = None
         self.save_data()
 
+    def template_duplicates(self):
+        """Index des quasi-doublons des modèles"""
+        if self._template_duplicates is None:
+            index = NearDuplicateIndex()
+            for template in self.templates.values():
+                index.add(template.name, template.content)
+            self._template_duplicates = index
+        return self._template_duplicates
+
+    def history_duplicates(self):
+        """Index des quasi-doublons des lettres de l'historique"""
+        if self._history_duplicates is None:
+            index = NearDuplicateIndex()
+            for item in self.history:
+                index.add(item, item.content)
+            self._history_duplicates = index
+        return self._history_duplicates
+
+    def _flag_duplicates(self, key, matches, kind):
+        if matches:
+            self.flagged_duplicates[key] = matches
+            metrics.increment(f"near_duplicates.{kind}")
+
+    def _unflag(self, keys):
+        """Oublier les signalements des éléments supprimés, y compris comme quasi-doublon d'un autre"""
+        removed = set(keys)
+        if not removed:
+            return
+        flagged = {}
+        for key, matches in self.flagged_duplicates.items():
+            if key in removed:
+                continue
+            matches = [match for match in matches if match[0] not in removed]
+            if matches:
+                flagged[key] = matches
+        self.flagged_duplicates = flagged
+
+    def merge_duplicates(self):
+        """Fusionner les quasi-doublons.
+
+        Pour chaque groupe, le modèle modifié le plus récemment est conservé et
+        reçoit les tags des autres ; pour l'historique, la lettre la plus
+        récente est conservée. Les groupes se forment de proche en proche : seuls
+        les éléments quasi identiques à l'élément conservé sont supprimés.
+        Renvoie le nombre d'éléments supprimés : {'templates': ..., 'history': ...}.
+        """
+        removed = []
+        removed_templates = 0
+        template_index = self.template_duplicates()
+        for group in template_index.groups():
+            templates = sorted((self.templates[name] for name in group),
+                               key=lambda t: t.updated_at, reverse=True)
+            kept = templates[0]
+            for template in templates[1:]:
+                if not template_index.is_duplicate(kept.name, template.name):
+                    continue
+                kept.tags = kept.tags + [tag for tag in template.tags if tag not in kept.tags]
+                del self.templates[template.name]
+                self.index.remove(template.name)
+                self._template_duplicates.remove(template.name)
+                removed.append(template.name)
+                removed_templates += 1
+
+        removed_history = set()
+        history_index = self.history_duplicates()
+        for group in history_index.groups():
+            kept, *others = sorted(group, key=lambda h: h.generated_at, reverse=True)
+            for item in others:
+                if not history_index.is_duplicate(kept, item):
+                    continue
+                history_index.remove(item)
+                removed.append(item)
+                removed_history.add(id(item))
+        if removed_history:
+            self.history = [h for h in self.history if id(h) not in removed_history]
+        self._unflag(removed)
+
+        if removed_templates or removed_history:
+            self.save_data()
+        return {'templates': removed_templates, 'history': len(removed_history)}
+
 class DocumentExporter:
     """Classe pour gérer l'export des documents"""
     
     def __init__(self):
-        self.default_font = "Times New Roman"
-        self.default_font_size = 11.5
         self.default_margins = {
             "top": 25,    # mm
             "bottom": 25,
@@ -624,141 +1025,40 @@ class DocumentExporter:
             "width": 210,  # A4 en mm
             "height": 297
         }
+        self.style_manager = StyleManager()
         
-    def export_to_word(self, data, file_path):
+    def layout(self):
+        """Mise en page des documents exportés (la même que DocumentManager)"""
+        return self.style_manager.docx_layout(self.default_margins, self.page_size)
+    
+    def export_to_word(self, data, file_path, letter=None):
         """Exporter les données en document Word"""
         try:
-            doc = Document()
-            
-            # Configuration des marges
-            sections = doc.sections
-            for section in sections:
-                section.top_margin = Mm(self.default_margins["top"])
-                section.bottom_margin = Mm(self.default_margins["bottom"])
-                section.left_margin = Mm(self.default_margins["left"])
-                section.right_margin = Mm(self.default_margins["right"])
-                
-            # Informations de l'expéditeur
-            self._add_sender_info(doc, data)
-            
-            # Espace
-            doc.add_paragraph()
-            
-            # Informations du destinataire
-            self._add_recipient_info(doc, data)
-            
-            # Espace
-            doc.add_paragraph()
-            
-            # Ville et date
-            if data.get("city") and data.get("date"):
-                p = doc.add_paragraph()
-                p.add_run(f"{data['city']}, le {data['date']}")
-                p.alignment = WD_ALIGN_PARAGRAPH.RIGHT
-            
-            # Espace
-            doc.add_paragraph()
-            
-            # Objet
-            if data.get("subject"):
-                p = doc.add_paragraph()
-                p.add_run("Objet : ").bold = True
-                p.add_run(data["subject"])
-            
-            # Espace
-            doc.add_paragraph()
-            
-            # Corps de la lettre
-            self._add_letter_content(doc, data.get("content", ""))
-            
-            # Signature
-            if data.get("signature"):
-                p = doc.add_paragraph()
-                p.add_run(data["signature"])
-                p.alignment = WD_ALIGN_PARAGRAPH.RIGHT
-            
-            # Sauvegarder
-            doc.save(file_path)
+            letter = letter or build_letter(data)
+            render_docx(letter, self.layout()).save(file_path)
             return True, None
             
         except Exception as e:
             return False, str(e)
     
-    def export_to_pdf(self, data, file_path):
+    def export_to_pdf(self, data, file_path, token=None, letter=None):
         """Exporter les données en PDF via Word"""
         try:
-            # Créer un fichier Word temporaire
-            temp_docx = os.path.join(tempfile.gettempdir(), "temp_letter.docx")
-            
-            # Exporter en Word d'abord
-            success, error = self.export_to_word(data, temp_docx)
-            if not success:
-                return False, error
+            # Document Word intermédiaire dans un dossier propre à la requête,
+            # supprimé même en cas d'erreur ou d'annulation
+            with scratch_space().directory("export") as work_dir:
+                temp_docx = os.path.join(work_dir, "lettre.docx")
+                success, error = self.export_to_word(data, temp_docx, letter)
+                if not success:
+                    return False, error
                 
-            # Convertir en PDF
-            convert(temp_docx, file_path)
-            
-            # Supprimer le fichier temporaire
-            os.remove(temp_docx)
+                # Convertir en PDF (interrompu si la requête est annulée)
+                convert_to_pdf(temp_docx, file_path, token)
             
             return True, None
             
         except Exception as e:
             return False, str(e)
-    
-    def _add_sender_info(self, doc, data):
-        """Ajouter les informations de l'expéditeur"""
-        sender_info = [
-            data.get("full_name", ""),
-            data.get("address", ""),
-            f"{data.get('postal_code', '')} {data.get('city', '')}".strip(),
-            data.get("phone", ""),
-            data.get("email", "")
-        ]
-        
-        for info in sender_info:
-            if info.strip():
-                p = self._add_paragraph_with_style(doc, info)
-    
-    def _add_recipient_info(self, doc, data):
-        """Ajouter les informations du destinataire"""
-        recipient_info = [
-            data.get("company", ""),
-            data.get("company_address", ""),
-            f"{data.get('company_postal_code', '')} {data.get('company_city', '')}".strip()
-        ]
-        
-        for info in recipient_info:
-            if info.strip():
-                p = self._add_paragraph_with_style(doc, info)
-    
-    def _add_letter_content(self, doc, content):
-        """Ajouter le contenu de la lettre avec le style approprié"""
-        paragraphs = content.split('\n\n')
-        
-        for paragraph in paragraphs:
-            if paragraph.strip():
-                p = self._add_paragraph_with_style(doc, paragraph)
-                p.paragraph_format.first_line_indent = Mm(10)
-                p.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-    
-    def _add_paragraph_with_style(self, doc, text, alignment=None, bold=False):
-        """Ajouter un paragraphe avec le style par défaut"""
-        p = doc.add_paragraph()
-        run = p.add_run(text)
-        run.font.name = self.default_font
-        run.font.size = Pt(self.default_font_size)
-        run.bold = bold
-        
-        # Style du paragraphe
-        p.paragraph_format.space_after = Pt(0)
-        p.paragraph_format.space_before = Pt(0)
-        p.paragraph_format.line_spacing = 1.15
-        
-        if alignment:
-            p.alignment = alignment
-            
-        return p
 
 class StyleManager:
     """Gestionnaire de styles pour le contenu de la lettre"""
@@ -860,6 +1160,17 @@ class StyleManager:
             }
         }
     
+    def docx_layout(self, margins=None, page_size=None):
+        """Mise en page des documents Word : police, taille, interligne et styles de paragraphe de l'aperçu"""
+        return DocxLayout(
+            font=self.default_styles["font_family"],
+            font_size=float(self.default_styles["font_size"].rstrip("pt")),
+            line_spacing=float(self.default_styles["line_height"]),
+            margins=margins,
+            page_size=page_size,
+            paragraph_styles=self.paragraph_styles
+        )
+    
     def get_style(self, style_name, style_type="text"):
         """Récupérer un style par son nom"""
         if style_type == "text":
@@ -873,6 +1184,10 @@ class StyleManager:
         style_str = "; ".join([f"{k}: {v}" for k, v in styles.items()])
         return f'<div style="{style_str}">{content}</div>'
     
+    def stylesheet(self):
+        """Feuille de style servie à l'adresse /styles/letter.<empreinte>.css"""
+        return stylesheets.register(self.create_css())
+    
     def create_css(self):
         """Générer le CSS pour tous les styles"""
         css = []
@@ -911,143 +1226,12 @@ class LetterFormatter:
     
     def __init__(self):
         self.style_manager = StyleManager()
+        # Aperçu à classes CSS (feuille de style servie à part), fragments mis en cache par bloc
+        self.renderer = HtmlRenderer()
     
-    def format_letter(self, data):
-        """Formater une lettre complète"""
-        sections = []
-        
-        # En-tête
-        if data.get('header'):
-            sections.append(self._format_header(data['header']))
-        
-        # Informations de l'expéditeur
-        sections.append(self._format_sender_info(data))
-        
-        # Informations du destinataire
-        sections.append(self._format_recipient_info(data))
-        
-        # Date et lieu
-        sections.append(self._format_date_section(data))
-        
-        # Objet
-        sections.append(self._format_subject(data))
-        
-        # Corps de la lettre
-        sections.append(self._format_body(data))
-        
-        # Signature
-        sections.append(self._format_signature(data))
-        
-        # Pied de page
-        if data.get('footer'):
-            sections.append(self._format_footer(data['footer']))
-        
-        # Assembler toutes les sections
-        letter_content = "\n".join(sections)
-        
-        # Appliquer les styles globaux
-        return self.style_manager.apply_styles(
-            letter_content,
-            self.style_manager.default_styles
-        )
-    
-    def _format_sender_info(self, data):
-        """Formater les informations de l'expéditeur"""
-        sender_info = [
-            data['full_name'],
-            data['address'],
-            f"{data['postal_code']} {data['city']}",
-            f"Tél : {data['phone']}",
-            f"Email : {data['email']}"
-        ]
-        
-        return self.style_manager.apply_styles(
-            "\n".join([f"<p>{line}</p>" for line in sender_info]),
-            self.style_manager.get_style("address", "paragraph")
-        )
-    
-    def _format_recipient_info(self, data):
-        """Formater les informations du destinataire"""
-        recipient_info = [
-            data['company'],
-            data['company_address'],
-            f"{data['company_postal_code']} {data['company_city']}"
-        ]
-        
-        return self.style_manager.apply_styles(
-            "\n".join([f"<p>{line}</p>" for line in recipient_info]),
-            self.style_manager.get_style("address", "paragraph")
-        )
-    
-    def _format_date_section(self, data):
-        """Formater la section date et lieu"""
-        date_text = f"{data['city']}, le {data['date']}"
-        
-        return self.style_manager.apply_styles(
-            f"<p>{date_text}</p>",
-            self.style_manager.get_style("date", "paragraph")
-        )
-    
-    def _format_subject(self, data):
-        """Formater la ligne d'objet"""
-        subject_text = f"Objet : {data['subject']}"
-        
-        return self.style_manager.apply_styles(
-            f"<p>{subject_text}</p>",
-            {**self.style_manager.get_style("bold", "text"),
-             **self.style_manager.get_style("body", "paragraph")}
-        )
-    
-    def _format_body(self, data):
-        """Formater le corps de la lettre"""
-        # Séparer le contenu en paragraphes
-        paragraphs = data['content'].split('\n\n')
-        
-        formatted_paragraphs = []
-        for paragraph in paragraphs:
-            # Détecter si c'est une liste
-            if paragraph.startswith('- '):
-                items = paragraph.split('\n- ')
-                items[0] = items[0][2:]  # Enlever le "- " du premier item
-                formatted_list = "\n".join([
-                    f'<li>{item}</li>' for item in items
-                ])
-                formatted_paragraphs.append(
-                    self.style_manager.apply_styles(
-                        f'<ul>{formatted_list}</ul>',
-                        self.style_manager.get_style("bullet", "text")
-                    )
-                )
-            else:
-                formatted_paragraphs.append(
-                    self.style_manager.apply_styles(
-                        f'<p>{paragraph}</p>',
-                        self.style_manager.get_style("body", "paragraph")
-                    )
-                )
-        
-        return "\n".join(formatted_paragraphs)
-    
-    def _format_signature(self, data):
-        """Formater la signature"""
-        return self.style_manager.apply_styles(
-            f"<p>{data['full_name']}</p>",
-            self.style_manager.get_style("signature", "text")
-        )
-    
-    def _format_header(self, header_text):
-        """Formater l'en-tête"""
-        return self.style_manager.apply_styles(
-            f"<div>{header_text}</div>",
-            self.style_manager.get_style("header-footer", "paragraph")
-        )
-    
-    def _format_footer(self, footer_text):
-        """Formater le pied de page"""
-        return self.style_manager.apply_styles(
-            f"<div>{footer_text}</div>",
-            self.style_manager.get_style("header-footer", "paragraph")
-        )
+    def format_letter(self, data, letter=None):
+        """Formater une lettre complète (contenu du conteneur .letter-content)"""
+        return self.renderer.render(letter or build_letter(data))
 
 # Initialiser le formateur de lettre
 letter_formatter = LetterFormatter()
@@ -1059,9 +1243,6 @@ class DocumentManager:
     """Gestionnaire de documents pour la création et l'export des lettres"""
     
     def __init__(self):
-        self.default_font = "Times New Roman"
-        self.default_font_size = 11.5
-        self.default_line_spacing = 1.15
         self.default_margins = {
             "top": 25,    # mm
             "bottom": 25,
@@ -1073,287 +1254,114 @@ class DocumentManager:
             "height": 297
         }
         
-        # Dossier pour les fichiers temporaires
-        self.temp_dir = os.path.join(tempfile.gettempdir(), "lettre_motivation_ai")
-        os.makedirs(self.temp_dir, exist_ok=True)
+        self.style_manager = StyleManager()
+        # Styles nommés du document Word (LetterBody, LetterAddress...) repris de l'aperçu
+        self.layout = self.style_manager.docx_layout(self.default_margins, self.page_size)
+        
+        # Moteur des documents Word : "python-docx" ou "direct" (écriture directe du XML)
+        self.docx_backend = os.getenv("DOCX_BACKEND", "python-docx")
+        # Rendus des exports en plusieurs formats
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("EXPORT_WORKERS", "4")),
+            thread_name_prefix="export"
+        )
+        
+        # Dossiers temporaires par requête
+        self.scratch = scratch_space()
     
-    def create_document(self, data, output_format="docx"):
-        """Créer un document avec les données fournies"""
+    def create_document(self, data, output_format="docx", token=None, letter=None):
+        """Créer un document avec les données fournies (ou la lettre déjà construite)"""
         try:
-            # Créer un document Word temporaire
-            doc = Document()
-            
-            # Configurer les marges
-            sections = doc.sections
-            for section in sections:
-                section.top_margin = Mm(self.default_margins["top"])
-                section.bottom_margin = Mm(self.default_margins["bottom"])
-                section.left_margin = Mm(self.default_margins["left"])
-                section.right_margin = Mm(self.default_margins["right"])
-            
-            # En-tête personnalisé
-            if data.get('header'):
-                self._add_header(doc, data['header'])
-            
-            # Informations de l'expéditeur
-            self._add_sender_info(doc, data)
-            
-            # Espace
-            doc.add_paragraph()
-            
-            # Informations du destinataire
-            self._add_recipient_info(doc, data)
-            
-            # Espace
-            doc.add_paragraph()
-            
-            # Date et lieu
-            self._add_date_location(doc, data)
-            
-            # Espace
-            doc.add_paragraph()
-            
-            # Objet
-            self._add_subject(doc, data)
-            
-            # Espace
-            doc.add_paragraph()
-            
-            # Formule de politesse début
-            self._add_paragraph_with_style(doc, "Madame, Monsieur,")
-            
-            # Espace
-            doc.add_paragraph()
-            
-            # Contenu principal
-            self._add_main_content(doc, data)
-            
-            # Formule de politesse fin
-            self._add_closing(doc)
-            
-            # Signature
-            self._add_signature(doc, data)
-            
-            # Pied de page personnalisé
-            if data.get('footer'):
-                self._add_footer(doc, data['footer'])
-            
-            # Créer un fichier temporaire
-            temp_docx = os.path.join(
-                self.temp_dir,
-                f"lettre_motivation_{datetime.now().strftime('%Y%m%d_%H%M%S')}.docx"
-            )
-            doc.save(temp_docx)
+            return self._render_word(letter or build_letter(data), [output_format], token)[output_format]
+        except Cancelled:
+            raise
+        except Exception as e:
+            raise Exception(f"Erreur lors de la création du document : {str(e)}")
+    
+    def create_documents(self, data, formats, token=None, letter=None):
+        """Créer la lettre dans plusieurs formats à la fois : {format: contenu}.
+        
+        La lettre est construite une fois ; le document Word (et sa conversion
+        en PDF), le HTML et le texte sont rendus en parallèle.
+        """
+        letter = letter or build_letter(data)
+        renderers = {
+            'html': lambda: render_html_document(letter, self.style_manager).encode('utf-8'),
+            'txt': lambda: render_text(letter).encode('utf-8'),
+        }
+        word_formats = [fmt for fmt in formats if fmt in ('docx', 'pdf')]
+        futures = {fmt: self._executor.submit(renderers[fmt]) for fmt in formats if fmt in renderers}
+        if word_formats:
+            word = self._executor.submit(self._render_word, letter, word_formats, token)
+        
+        try:
+            documents = {fmt: future.result() for fmt, future in futures.items()}
+            if word_formats:
+                documents.update(word.result())
+        except Cancelled:
+            raise
+        except Exception as e:
+            raise Exception(f"Erreur lors de la création du document : {str(e)}")
+        metrics.increment("export.documents", len(documents))
+        return {fmt: documents[fmt] for fmt in formats}
+    
+    def _render_word(self, letter, formats, token=None):
+        """Document Word et/ou PDF de la lettre : {format: contenu}"""
+        documents = {}
+        if self.docx_backend == "direct":
+            content = render_docx_bytes(letter, self.layout)
+            if 'docx' in formats:
+                documents['docx'] = content
+            if 'pdf' not in formats:
+                return documents
+        
+        # Fichiers intermédiaires dans un dossier propre à la requête, supprimé
+        # à la sortie, y compris après une erreur ou une annulation
+        with self.scratch.directory("document") as work_dir:
+            temp_docx = os.path.join(work_dir, "lettre_motivation.docx")
+            if self.docx_backend == "direct":
+                with open(temp_docx, 'wb') as docx_file:
+                    docx_file.write(content)
+            else:
+                render_docx(letter, self.layout).save(temp_docx)
+                if 'docx' in formats:
+                    with open(temp_docx, 'rb') as docx_file:
+                        documents['docx'] = docx_file.read()
             
             # Convertir en PDF si demandé
-            if output_format == "pdf":
-                temp_pdf = temp_docx.replace('.docx', '.pdf')
-                convert(temp_docx, temp_pdf)
+            if 'pdf' in formats:
+                temp_pdf = os.path.join(work_dir, "lettre_motivation.pdf")
+                convert_to_pdf(temp_docx, temp_pdf, token)
                 
-                # Lire le fichier PDF
                 with open(temp_pdf, 'rb') as pdf_file:
-                    pdf_content = pdf_file.read()
-                
-                # Nettoyer
-                os.unlink(temp_pdf)
-                os.unlink(temp_docx)
-                
-                return pdf_content
-            
-            # Sinon, renvoyer le fichier Word
-            else:
-                with open(temp_docx, 'rb') as docx_file:
-                    docx_content = docx_file.read()
-                
-                # Nettoyer
-                os.unlink(temp_docx)
-                
-                return docx_content
-            
-        except Exception as e:
-            raise Exception(f"Erreur lors de la création du document : {str(e)}")
-    
-    def _add_header(self, doc, header_text):
-        """Ajouter un en-tête personnalisé"""
-        section = doc.sections[0]
-        header = section.header
-        header_para = header.paragraphs[0]
-        header_para.text = header_text
-        header_para.style = doc.styles['Header']
-        
-        # Style de l'en-tête
-        font = header_para.style.font
-        font.name = self.default_font
-        font.size = Pt(9)
-        font.color.rgb = RGBColor(102, 102, 102)
-    
-    def _add_footer(self, doc, footer_text):
-        """Ajouter un pied de page personnalisé"""
-        section = doc.sections[0]
-        footer = section.footer
-        footer_para = footer.paragraphs[0]
-        footer_para.text = footer_text
-        footer_para.style = doc.styles['Footer']
-        
-        # Style du pied de page
-        font = footer_para.style.font
-        font.name = self.default_font
-        font.size = Pt(9)
-        font.color.rgb = RGBColor(102, 102, 102)
-    
-    def _add_sender_info(self, doc, data):
-        """Ajouter les informations de l'expéditeur"""
-        for info in [
-            data['full_name'],
-            data['address'],
-            f"{data['postal_code']} {data['city']}",
-            f"Tél : {data['phone']}",
-            f"Email : {data['email']}"
-        ]:
-            self._add_paragraph_with_style(doc, info)
-    
-    def _add_recipient_info(self, doc, data):
-        """Ajouter les informations du destinataire"""
-        for info in [
-            data['company'],
-            data['company_address'],
-            f"{data['company_postal_code']} {data['company_city']}"
-        ]:
-            self._add_paragraph_with_style(doc, info)
-    
-    def _add_date_location(self, doc, data):
-        """Ajouter la date et le lieu"""
-        p = self._add_paragraph_with_style(
-            doc,
-            f"{data['city']}, le {data['date']}",
-            alignment=WD_ALIGN_PARAGRAPH.RIGHT
-        )
-    
-    def _add_subject(self, doc, data):
-        """Ajouter l'objet"""
-        p = doc.add_paragraph()
-        run = p.add_run("Objet : ")
-        self._apply_run_style(run, bold=True)
+                    documents['pdf'] = pdf_file.read()
         
-        run = p.add_run(data['subject'])
-        self._apply_run_style(run)
-    
-    def _add_main_content(self, doc, data):
-        """Ajouter le contenu principal"""
-        paragraphs = data['content'].split('\n')
-        
-        for para in paragraphs:
-            if para.strip():
-                # Détecter si c'est une liste
-                if para.startswith('- '):
-                    items = para.split('\n- ')
-                    items[0] = items[0][2:]  # Enlever le "- " du premier item
-                    
-                    for item in items:
-                        p = self._add_paragraph_with_style(
-                            doc,
-                            item,
-                            first_line_indent=None,
-                            left_indent=Mm(10)
-                        )
-                        p.style = 'List Bullet'
-                else:
-                    self._add_paragraph_with_style(
-                        doc,
-                        para,
-                        first_line_indent=Mm(10)
-                    )
-    
-    def _add_closing(self, doc):
-        """Ajouter la formule de politesse finale"""
-        self._add_paragraph_with_style(
-            doc,
-            "Je vous prie d'agréer, Madame, Monsieur, l'expression de mes salutations distinguées."
-        )
-    
-    def _add_signature(self, doc, data):
-        """Ajouter la signature"""
-        self._add_paragraph_with_style(
-            doc,
-            data['full_name'],
-            alignment=WD_ALIGN_PARAGRAPH.RIGHT
-        )
-    
-    def _add_paragraph_with_style(self, doc, text, alignment=None, bold=False,
-                                first_line_indent=None, left_indent=None):
-        """Ajouter un paragraphe avec style"""
-        p = doc.add_paragraph()
-        run = p.add_run(text)
-        self._apply_run_style(run, bold)
-        
-        # Format du paragraphe
-        pf = p.paragraph_format
-        pf.space_after = Pt(0)
-        pf.space_before = Pt(0)
-        pf.line_spacing = self.default_line_spacing
-        
-        if alignment:
-            p.alignment = alignment
-        if first_line_indent is not None:
-            pf.first_line_indent = first_line_indent
-        if left_indent is not None:
-            pf.left_indent = left_indent
-        
-        return p
-    
-    def _apply_run_style(self, run, bold=False):
-        """Appliquer le style à un run"""
-        run.font.name = self.default_font
-        run.font.size = Pt(self.default_font_size)
-        run.bold = bold
+        return documents
 
 # Initialiser le gestionnaire de documents
 document_manager = DocumentManager()
 
 def process_text_formatting(text):
     """Traite le texte formaté et retourne le texte avec le formatage HTML."""
-    import re
-    
-    # Traiter les balises de style
-    text = re.sub(r'<bold>(.*?)</bold>', r'<strong>\1</strong>', text)
-    text = re.sub(r'<italic>(.*?)</italic>', r'<em>\1</em>', text)
-    text = re.sub(r'<underline>(.*?)</underline>', r'<u>\1</u>', text)
-    
-    # Traiter les alignements
-    text = re.sub(r'<align="(.*?)">(.*?)</align>', r'<div style="text-align: \1">\2</div>', text)
-    
-    # Traiter l'interligne
-    text = re.sub(r'<spacing="(.*?)">(.*?)</spacing>', r'<div style="line-height: \1">\2</div>', text)
-    
-    return text
+    # Une seule passe : balises de style, alignements et interlignes, même imbriqués
+    return markup.render_html(markup.parse(text))
 
 def process_long_text(text, max_length=1000):
     """Traite un texte long en le divisant en sections."""
-    sections = []
-    words = text.split()
-    current_section = []
-    current_length = 0
-    
-    for word in words:
-        if current_length + len(word) + 1 <= max_length:
-            current_section.append(word)
-            current_length += len(word) + 1
-        else:
-            sections.append(" ".join(current_section))
-            current_section = [word]
-            current_length = len(word)
-    
-    if current_section:
-        sections.append(" ".join(current_section))
-    
-    return sections
+    return list(iter_sections(text, max_length))
 
 def create_word_document(content, filename):
     """Crée un document Word avec le contenu formaté."""
     from docx import Document
     from docx.shared import Pt, Inches
     from docx.enum.text import WD_ALIGN_PARAGRAPH
-    import re
+    
+    align_map = {
+        'left': WD_ALIGN_PARAGRAPH.LEFT,
+        'center': WD_ALIGN_PARAGRAPH.CENTER,
+        'right': WD_ALIGN_PARAGRAPH.RIGHT,
+        'justify': WD_ALIGN_PARAGRAPH.JUSTIFY
+    }
     
     # Créer un nouveau document
     doc = Document()
@@ -1366,78 +1374,30 @@ def create_word_document(content, filename):
         section.left_margin = Inches(1)
         section.right_margin = Inches(1)
     
-    # Fonction pour appliquer le style au paragraphe
-    def apply_paragraph_style(paragraph, style_dict):
-        if 'alignment' in style_dict:
-            align_map = {
-                'left': WD_ALIGN_PARAGRAPH.LEFT,
-                'center': WD_ALIGN_PARAGRAPH.CENTER,
-                'right': WD_ALIGN_PARAGRAPH.RIGHT,
-                'justify': WD_ALIGN_PARAGRAPH.JUSTIFY
-            }
-            paragraph.alignment = align_map.get(style_dict['alignment'], WD_ALIGN_PARAGRAPH.LEFT)
-        
-        if 'line_spacing' in style_dict:
-            paragraph.paragraph_format.line_spacing = float(style_dict['line_spacing'])
-    
-    # Fonction pour appliquer le style au texte
-    def apply_run_style(run, style_dict):
-        run.font.name = 'Times New Roman'
-        run.font.size = Pt(12)
-        
-        if style_dict.get('bold'):
-            run.font.bold = True
-        if style_dict.get('italic'):
-            run.font.italic = True
-        if style_dict.get('underline'):
-            run.font.underline = True
+    # Police définie une fois dans le style du document
+    normal = doc.styles['Normal']
+    normal.font.name = 'Times New Roman'
+    normal.font.size = Pt(12)
     
-    # Parser le contenu HTML et créer les paragraphes
-    paragraphs = content.split('\n')
-    for p_text in paragraphs:
-        if not p_text.strip():
+    # Analyser le contenu HTML en une passe : une ligne par paragraphe
+    for line in markup.paragraphs(markup.parse(content)):
+        if not line.text().strip():
             continue
         
-        # Créer un nouveau paragraphe
         p = doc.add_paragraph()
-        
-        # Extraire les styles du paragraphe
-        style_dict = {}
-        
-        # Vérifier l'alignement
-        align_match = re.search(r'text-align:\s*(\w+)', p_text)
-        if align_match:
-            style_dict['alignment'] = align_match.group(1)
-        
-        # Vérifier l'interligne
-        spacing_match = re.search(r'line-height:\s*([\d.]+)', p_text)
-        if spacing_match:
-            style_dict['line_spacing'] = float(spacing_match.group(1))
-        
-        # Appliquer les styles au paragraphe
-        apply_paragraph_style(p, style_dict)
-        
-        # Traiter le texte avec les balises de style
-        text = re.sub(r'<div[^>]*>', '', p_text)
-        text = text.replace('</div>', '')
-        
-        # Diviser le texte en segments basés sur le formatage
-        segments = re.split(r'(</?(?:strong|em|u)>)', text)
-        current_styles = {'bold': False, 'italic': False, 'underline': False}
-        
-        for segment in segments:
-            if segment in ('<strong>', '<em>', '<u>'):
-                if segment == '<strong>': current_styles['bold'] = True
-                elif segment == '<em>': current_styles['italic'] = True
-                elif segment == '<u>': current_styles['underline'] = True
-            elif segment in ('</strong>', '</em>', '</u>'):
-                if segment == '</strong>': current_styles['bold'] = False
-                elif segment == '</em>': current_styles['italic'] = False
-                elif segment == '</u>': current_styles['underline'] = False
-            else:
-                if segment.strip():
-                    run = p.add_run(segment)
-                    apply_run_style(run, current_styles)
+        if line.align:
+            p.alignment = align_map[line.align]
+        if line.line_spacing:
+            p.paragraph_format.line_spacing = line.line_spacing
+        
+        for text, bold, italic, underline in line.runs:
+            run = p.add_run(text)
+            if bold:
+                run.font.bold = True
+            if italic:
+                run.font.italic = True
+            if underline:
+                run.font.underline = True
     
     # Sauvegarder le document
     doc.save(filename)
@@ -1447,10 +1407,261 @@ def create_word_document(content, filename):
 def index():
     return app.send_static_file('index.html')
 
+def generation_request():
+    """Corps JSON d'une demande de génération ({} s'il est absent ou n'est pas un objet)"""
+    data = request.get_json(silent=True)
+    return data if isinstance(data, dict) else {}
+
+def known_model(name):
+    """Le nom désigne un modèle du registre"""
+    return isinstance(name, str) and name in generator.models.specs
+
+@app.route('/generate', methods=['POST'])
+def generate():
+    """
+    Génère une lettre de motivation à partir du formulaire
+    """
+    try:
+        data = generation_request()
+        
+        for field in ['company', 'position']:
+            if not data.get(field):
+                return jsonify({
+                    'success': False,
+                    'error': f'Le champ {field} est requis'
+                }), 400
+        
+        if data.get('model') and not known_model(data['model']):
+            return jsonify({
+                'success': False,
+                'error': f"Modèle inconnu : {data['model']}"
+            }), 400
+        
+        try:
+            generator.candidate_count(data)
+            generator.request_stop_sequences(data)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        # Champs optionnels utilisés par le prompt par défaut
+        for field in ['duration', 'start_date', 'custom_paragraph']:
+            data.setdefault(field, '')
+        
+        result = generator.generate(data, CancellationToken.for_request())
+        
+        return jsonify({
+            'success': True,
+            **result
+        })
+        
+    except Cancelled as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 504
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/generate/stream', methods=['POST'])
+def generate_stream():
+    """
+    Génère la lettre en envoyant le texte au fur et à mesure
+    """
+    try:
+        data = generation_request()
+        
+        for field in ['company', 'position']:
+            if not data.get(field):
+                return jsonify({
+                    'success': False,
+                    'error': f'Le champ {field} est requis'
+                }), 400
+        
+        if data.get('model') and not known_model(data['model']):
+            return jsonify({
+                'success': False,
+                'error': f"Modèle inconnu : {data['model']}"
+            }), 400
+        
+        try:
+            n = generator.candidate_count(data)
+            generator.request_stop_sequences(data)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        for field in ['duration', 'start_date', 'custom_paragraph']:
+            data.setdefault(field, '')
+        
+        # Plusieurs variantes : une ligne JSON par fragment de texte
+        mimetype = 'application/x-ndjson' if n > 1 else 'text/plain; charset=utf-8'
+        token = CancellationToken.for_request()
+        return Response(cancel_on_disconnect(generator.stream_letter(data, token), token), mimetype=mimetype)
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def cancel_on_disconnect(chunks, token):
+    """Annuler la génération si le client ferme la connexion avant la fin"""
+    completed = False
+    try:
+        yield from chunks
+        completed = True
+    except Cancelled:
+        # Délai dépassé : la réponse s'arrête là
+        completed = True
+    finally:
+        if not completed:
+            token.cancel("client_disconnected")
+
+@app.route('/extract', methods=['POST'])
+def extract_offer():
+    """
+    Préremplit entreprise, poste, durée et date de début à partir d'une offre d'emploi
+    (avec type de contrat, salaire et lieu à titre indicatif).
+    Accepte {"text": ...} ou, pour le publipostage, {"texts": [...]}
+    """
+    data = request.get_json() or {}
+    
+    if isinstance(data.get('texts'), list):
+        return jsonify({
+            'success': True,
+            'results': extract_job_offers([str(text) for text in data['texts']])
+        })
+    
+    if not data.get('text'):
+        return jsonify({
+            'success': False,
+            'error': 'Le champ text est requis'
+        }), 400
+    
+    return jsonify({
+        'success': True,
+        'fields': extract_job_offer(data['text'])
+    })
+
+@app.route('/templates/recommend', methods=['POST'])
+def recommend_templates():
+    """
+    Classe les paragraphes enregistrés selon leur proximité avec l'offre ou le poste
+    """
+    data = request.get_json() or {}
+    text = data.get('text') or data.get('position')
+    if not text:
+        return jsonify({
+            'success': False,
+            'error': 'Le champ text est requis'
+        }), 400
+    
+    k = data.get('k')
+    if k is None:
+        k = 5
+    if isinstance(k, bool) or not isinstance(k, (int, str)) or not re.fullmatch(r"\s*-?\d+\s*", str(k)):
+        return jsonify({
+            'success': False,
+            'error': 'Le champ k doit être un entier'
+        }), 400
+    k = int(k)
+    if not 1 <= k <= 50:
+        return jsonify({
+            'success': False,
+            'error': 'Le champ k doit être compris entre 1 et 50'
+        }), 400
+    recommendations = [
+        {'name': name, 'content': generator.custom_templates[name], 'score': round(score, 4), 'source': 'paragraph'}
+        for name, score in generator.recommend_templates(text, k)
+    ] + [
+        {'name': template.name, 'content': template.content, 'score': round(score, 4), 'source': 'template'}
+        for template, score in template_manager.recommend_templates(text, k)
+    ]
+    recommendations.sort(key=lambda item: item['score'], reverse=True)
+    
+    return jsonify({
+        'success': True,
+        'recommendations': recommendations[:k]
+    })
+
+@app.route('/templates/merge-duplicates', methods=['POST'])
+def merge_duplicate_templates():
+    """
+    Fusionne les modèles et lettres de l'historique quasi identiques
+    """
+    try:
+        removed = template_manager.merge_duplicates()
+        return jsonify({
+            'success': True,
+            'removed': removed
+        })
+    except Exception as e:
+        print(f"Erreur lors de la fusion des doublons : {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/preview', methods=['POST'])
+def preview_letter():
+    """
+    Renvoie l'aperçu HTML de la lettre et l'adresse de sa feuille de style
+    """
+    try:
+        data = request.get_json()
+        
+        # La feuille de style n'est pas renvoyée : l'aperçu référence son adresse,
+        # mise en cache par le navigateur
+        return jsonify({
+            'success': True,
+            'html': letter_formatter.format_letter(data),
+            'stylesheet': letter_formatter.style_manager.stylesheet().url
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+EXPORT_MIME_TYPES = {
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'pdf': 'application/pdf',
+    'html': 'text/html',
+    'txt': 'text/plain',
+}
+
+export_cache = ArtifactCache.from_env()
+
+def render_export(data, formats, archive, token=None):
+    """Contenu renvoyé par /export : le fichier seul, ou une archive ZIP de tous les formats"""
+    if not archive:
+        output_format = formats[0]
+        if output_format in ('docx', 'pdf'):
+            return document_manager.create_document(data, output_format, token)
+        return document_manager.create_documents(data, formats, token)[output_format]
+    
+    # Tous les formats sont rendus en parallèle à partir de la même lettre
+    documents = document_manager.create_documents(data, formats, token)
+    basename = f"lettre_motivation_{datetime.now().strftime('%Y-%m-%d')}"
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for fmt, content in documents.items():
+            zip_file.writestr(f"{basename}.{fmt}", content)
+    return buffer.getvalue()
+
 @app.route('/export', methods=['POST'])
 def export_letter():
     """
-    Exporte la lettre au format Word ou PDF
+    Exporte la lettre au format Word, PDF, HTML ou texte (plusieurs formats : archive ZIP)
     """
     try:
         data = request.get_json()
@@ -1458,7 +1669,7 @@ def export_letter():
         # Valider les données
         required_fields = ['full_name', 'address', 'postal_code', 'city', 'phone', 'email',
                          'company', 'company_address', 'company_postal_code', 'company_city',
-                         'subject', 'content', 'format']
+                         'subject', 'content']
         
         for field in required_fields:
             if not data.get(field):
@@ -1467,33 +1678,129 @@ def export_letter():
                     'error': f'Le champ {field} est requis'
                 }), 400
         
-        if data['format'] not in ['docx', 'pdf']:
+        # Un format (fichier seul) ou une liste de formats (archive ZIP)
+        formats = data.get('formats') or ([data['format']] if data.get('format') else [])
+        if not formats:
+            return jsonify({
+                'success': False,
+                'error': 'Le champ format est requis'
+            }), 400
+        
+        if not isinstance(formats, list) or any(not isinstance(fmt, str) or fmt not in EXPORT_MIME_TYPES for fmt in formats):
             return jsonify({
                 'success': False,
                 'error': 'Format non supporté'
             }), 400
         
-        # Créer le document
-        file_content = document_manager.create_document(data, data['format'])
+        basename = f"lettre_motivation_{datetime.now().strftime('%Y-%m-%d')}"
+        archive = 'formats' in data
+        if archive:
+            formats = list(dict.fromkeys(formats))
+            variant = "zip:" + ",".join(formats)
+            mimetype, download_name = 'application/zip', f"{basename}.zip"
+        else:
+            variant = formats[0]
+            mimetype, download_name = EXPORT_MIME_TYPES[variant], f"{basename}.{variant}"
+        
+        # Même lettre, mêmes formats (et même moteur Word) : le fichier déjà rendu est renvoyé.
+        # L'extension fait partie de la clé : /export/<clé> ne sert le fichier que sous son format
+        extension = 'zip' if archive else variant
+        cache_key = f"{export_cache.make_key(data, f'{variant}@{document_manager.docx_backend}')}.{extension}"
+        cached = export_cache.get(cache_key)
+        if cached is not None:
+            file_content, etag = cached
+        else:
+            file_content = render_export(data, formats, archive, CancellationToken.for_request())
+            etag = export_cache.set(cache_key, file_content)
         
-        # Déterminer le type MIME
-        mime_type = ('application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-                    if data['format'] == 'docx' else 'application/pdf')
+        # Le client a déjà ce fichier
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers={'ETag': f'"{etag}"'})
         
-        # Renvoyer le fichier
-        return send_file(
+        response = send_file(
             io.BytesIO(file_content),
-            mimetype=mime_type,
+            mimetype=mimetype,
             as_attachment=True,
-            download_name=f"lettre_motivation_{datetime.now().strftime('%Y-%m-%d')}.{data['format']}"
+            download_name=download_name,
+            etag=etag
         )
+        # Adresse des téléchargements suivants (GET conditionnel, Range)
+        response.headers['Content-Location'] = f"/export/{cache_key}"
+        return response
         
+    except Cancelled as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 504
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+@app.route('/export/<key>.<extension>', methods=['GET'])
+def download_export(key, extension):
+    """
+    Renvoie un fichier déjà exporté (If-None-Match -> 304, Range -> 206)
+    """
+    mimetype = 'application/zip' if extension == 'zip' else EXPORT_MIME_TYPES.get(extension)
+    # Une autre extension que celle de l'export désigne une autre entrée : 404
+    cached = export_cache.get(f"{key}.{extension}") if mimetype and re.fullmatch(r"[0-9a-f]{64}", key) else None
+    if cached is None:
+        return jsonify({
+            'success': False,
+            'error': "Fichier introuvable ou expiré, relancez l'export"
+        }), 404
+    
+    file_content, etag = cached
+    return send_file(
+        io.BytesIO(file_content),
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=f"lettre_motivation_{datetime.now().strftime('%Y-%m-%d')}.{extension}",
+        etag=etag,
+        conditional=True
+    )
+
+@app.route('/styles/<filename>', methods=['GET'])
+def serve_stylesheet(filename):
+    """
+    Feuille de style à empreinte : mise en cache indéfiniment, variante compressée selon Accept-Encoding
+    """
+    # Enregistrer la feuille de la configuration courante (premier appel de ce worker)
+    letter_formatter.style_manager.stylesheet()
+    stylesheet = stylesheets.find(filename)
+    if stylesheet is None:
+        return jsonify({
+            'success': False,
+            'error': 'Feuille de style introuvable'
+        }), 404
+    
+    encoding, content = stylesheet.variant(request.accept_encodings)
+    response = Response(content, mimetype='text/css')
+    response.headers['Cache-Control'] = stylesheets.IMMUTABLE
+    response.headers['Vary'] = 'Accept-Encoding'
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.set_etag(f"{stylesheet.fingerprint}-{encoding}")
+    return response.make_conditional(request)
+
+@app.route('/models')
+def list_models():
+    """Modèles disponibles, temps de chargement et mémoire résidente"""
+    return jsonify(generator.models.stats())
+
+@app.route('/metrics')
+def metrics_report():
+    """Compteurs internes du worker (caches, etc.)"""
+    return jsonify({
+        **metrics.snapshot(),
+        **generator.generation_cache.stats(),
+        **export_cache.stats(),
+        **scratch_space().stats()
+    })
+
 @app.route('/health')
 def health_check():
     """Route de vérification de santé pour Render"""